@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+
+from flask import Flask, current_app, g, jsonify, request
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Admission control: every route belongs to a priority class (see
+# `priority()`; unmarked routes are "interactive"), and each class has its own
+# cap on in-flight requests in this process. A request over the cap waits up
+# to the class's queue deadline for a slot, and is shed with 503 +
+# Retry-After if none frees up or the queue is full. Long model calls can
+# then only occupy their own slots, and cheap interactive endpoints keep
+# their latency under AI load. Caps are per worker process.
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_CONTROL", "1") == "1"
+
+# Request threads per worker process. Must match gunicorn's `--threads`
+# (gunicorn.conf.py reads the same variable): the caps below are shares of
+# it, so a worker started with fewer threads can be filled by ai + heavy +
+# stream requests and leave none for interactive ones.
+WEB_THREADS = int(os.getenv("WEB_THREADS", "16"))
+# Threads ai, heavy and stream requests can never take between them. Below
+# 5 threads each of those classes can no longer get one of its own.
+INTERACTIVE_RESERVE = max(2, WEB_THREADS // 4)
+_capped = max(3, WEB_THREADS - INTERACTIVE_RESERVE)
+
+# class: (max in flight, max queued, queue deadline in seconds, Retry-After in
+# seconds). A limit of 0 means uncapped. Override per class with e.g.
+# ADMISSION_AI_LIMIT / _QUEUE / _WAIT_SECONDS / _RETRY_AFTER.
+_DEFAULTS = {
+    "critical": (0, 0, 0.0, 1),
+    "interactive": (WEB_THREADS, 2 * WEB_THREADS, 1.0, 1),
+    "heavy": (_capped // 3, 2 * (_capped // 3), 2.0, 5),
+    "ai": (_capped // 3, 2 * (_capped // 3), 2.0, 15),
+    # Each open SSE stream holds a thread for up to EVENTS_MAX_STREAM_SECONDS,
+    # so only a few fit per worker; clients shed here poll
+    # /api/events/poll (an interactive request) instead. Under `-k gevent`
+    # threads are not the constraint; raise ADMISSION_STREAM_LIMIT there.
+    "stream": (_capped - 2 * (_capped // 3), 0, 0.0, 10),
+}
+DEFAULT_CLASS = "interactive"
+
+
+class AdmissionClass:
+    """
+    Counting semaphore with a bounded wait queue and a wait deadline.
+    """
+
+    def __init__(self, name: str, limit: int, queue: int, wait_seconds: float, retry_after: int):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.wait_seconds = wait_seconds
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> bool:
+        """
+        Take a slot, waiting up to `wait_seconds` in the queue. False if the
+        request should be shed.
+        """
+        with self._cond:
+            if not self.limit or (self.in_flight < self.limit and not self.waiting):
+                self.in_flight += 1
+                return True
+            if self.waiting >= self.queue:
+                return False
+            self.waiting += 1
+            deadline = time.monotonic() + self.wait_seconds
+            try:
+                while self.in_flight >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def status(self) -> dict:
+        with self._cond:
+            return {"in_flight": self.in_flight, "waiting": self.waiting, "limit": self.limit or None}
+
+
+def _setting(name: str, key: str, default):
+    return type(default)(os.getenv(f"ADMISSION_{name.upper()}_{key}", str(default)))
+
+
+CLASSES = {
+    name: AdmissionClass(
+        name,
+        _setting(name, "LIMIT", limit),
+        _setting(name, "QUEUE", queue),
+        _setting(name, "WAIT_SECONDS", wait),
+        _setting(name, "RETRY_AFTER", retry_after),
+    )
+    for name, (limit, queue, wait, retry_after) in _DEFAULTS.items()
+}
+
+_capped_limits = [CLASSES[name].limit for name in ("ai", "heavy", "stream")]
+if 0 in _capped_limits or WEB_THREADS - sum(_capped_limits) < INTERACTIVE_RESERVE:
+    logger.warning(
+        "ai/heavy/stream admission caps %s leave fewer than %s of WEB_THREADS=%s for interactive requests",
+        _capped_limits,
+        INTERACTIVE_RESERVE,
+        WEB_THREADS,
+    )
+
+
+def priority(name: str):
+    """
+    Put a view in admission class `name` ("critical", "interactive",
+    "heavy", "ai" or "stream").
+    """
+    if name not in CLASSES:
+        raise ValueError(f"Unknown admission class {name!r}")
+
+    def decorator(view):
+        view.admission_class = name
+        return view
+
+    return decorator
+
+
+def _classify() -> AdmissionClass:
+    view = current_app.view_functions.get(request.endpoint) if request.endpoint else None
+    return CLASSES[getattr(view, "admission_class", DEFAULT_CLASS)]
+
+
+def _admit():
+    cls = _classify()
+    started = time.monotonic()
+    if not cls.acquire():
+        metrics.incr(f"admission.{cls.name}.shed")
+        resp = jsonify({"error": "Server busy, retry shortly"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(cls.retry_after)
+        return resp
+    now = time.monotonic()
+    g.admission = (cls, now)
+    metrics.incr(f"admission.{cls.name}.admitted")
+    metrics.observe(f"admission.{cls.name}.queue_ms", (now - started) * 1000)
+    return None
+
+
+def _release(exc=None) -> None:
+    # For streamed responses this runs once the stream has finished.
+    admitted = g.pop("admission", None)
+    if admitted is not None:
+        cls, since = admitted
+        cls.release()
+        metrics.observe(f"admission.{cls.name}.service_ms", (time.monotonic() - since) * 1000)
+
+
+def status() -> dict:
+    return {name: cls.status() for name, cls in CLASSES.items()}
+
+
+def init_app(app: Flask) -> None:
+    if not ADMISSION_ENABLED:
+        return
+    app.before_request(_admit)
+    app.teardown_request(_release)
@@ -1,36 +1,332 @@
 # server/ai_client.py
 
 from __future__ import annotations
+import logging
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 
-import google.generativeai as genai
+import admission
+import metrics
+
+# NOTE: `google.generativeai` is imported lazily in `get_model()`. Importing
+# the SDK costs more than half of the app's cold start, and catalog-only
+# traffic never needs it; the app must also boot without AI credentials.
 
 # Load .env if present (local dev); on Render you’ll use real env vars
 BASE_DIR = Path(__file__).resolve().parent
 load_dotenv(BASE_DIR / ".env")
 
-# Prefer Render / system env; fall back to .env for local runs
-API_KEY = os.getenv("GOOGLE_API_KEY") or os.getenv("GOOGLE_AI_KEY")
-if not API_KEY:
-    raise RuntimeError("Missing GOOGLE_API_KEY or GOOGLE_AI_KEY in environment")
-
-# Configure global client for the SDK
-genai.configure(api_key=API_KEY)
+logger = logging.getLogger(__name__)
 
 # Choose model (can be overridden via env)
 MODEL_NAME = os.getenv("GOOGLE_MODEL_NAME", "gemini-2.0-flash")
 
-# Create a reusable model instance
-_model = genai.GenerativeModel(MODEL_NAME)
+# Context caching for system instructions (SDK >= 0.7). Best effort: the API
+# rejects caches below its minimum token count, in which case we fall back to
+# a plain system instruction on the model.
+CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE", "1") == "1"
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+# Model routing: each mode maps to an ordered list of models; the first one
+# whose circuit breaker is closed serves the request and the next one is the
+# hedge / failover target. Override with e.g.
+# AI_MODELS_EXAM="gemini-2.5-pro,gemini-2.0-flash".
+MODEL_ROUTES = {
+    "practice": os.getenv("AI_MODELS_PRACTICE", f"{MODEL_NAME},gemini-2.0-flash-lite"),
+    "exam": os.getenv("AI_MODELS_EXAM", f"gemini-2.5-pro,{MODEL_NAME}"),
+}
+MODEL_ROUTES = {mode: [m.strip() for m in names.split(",") if m.strip()] for mode, names in MODEL_ROUTES.items()}
+
+# Hedging: if the first model has not answered after its recent p95 latency
+# (clamped to [AI_HEDGE_MIN_SECONDS, AI_HEDGE_MAX_SECONDS]; AI_HEDGE_MAX_SECONDS
+# until enough samples exist), send the same request to the next model and
+# take whichever answers first.
+HEDGE_ENABLED = os.getenv("AI_HEDGE", "1") == "1"
+HEDGE_MIN_SECONDS = float(os.getenv("AI_HEDGE_MIN_SECONDS", "3"))
+HEDGE_MAX_SECONDS = float(os.getenv("AI_HEDGE_MAX_SECONDS", "20"))
+
+# Circuit breaker, per model, over its last BREAKER_WINDOW calls: open on too
+# many errors or a p95 latency over BREAKER_P95_SECONDS; after
+# BREAKER_COOLDOWN_SECONDS one trial request decides whether it closes again.
+BREAKER_WINDOW = int(os.getenv("AI_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("AI_BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("AI_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_P95_SECONDS = float(os.getenv("AI_BREAKER_P95_SECONDS", "45"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("AI_BREAKER_COOLDOWN_SECONDS", "30"))
+
+_genai = None
+_models: dict[tuple[str, str | None], tuple[object, float]] = {}
+_model_lock = threading.Lock()
+
+
+def _api_key() -> str:
+    # Prefer Render / system env; fall back to .env for local runs
+    api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GOOGLE_AI_KEY")
+    if not api_key:
+        raise RuntimeError("Missing GOOGLE_API_KEY or GOOGLE_AI_KEY in environment")
+    return api_key
+
+
+def _sdk():
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+
+        # Configure global client for the SDK
+        genai.configure(api_key=_api_key())
+        _genai = genai
+    return _genai
+
+
+def _build_model(genai, model_name: str, system_instruction: str | None) -> tuple[object, float]:
+    """
+    Return (model, expires_at). Models bound to a context cache expire with it;
+    plain models never do.
+    """
+    if system_instruction and CONTEXT_CACHE_ENABLED and hasattr(genai, "caching"):
+        try:
+            model_id = model_name if model_name.startswith("models/") else f"models/{model_name}"
+            cached = genai.caching.CachedContent.create(
+                model=model_id,
+                system_instruction=system_instruction,
+                ttl=timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS),
+            )
+            model = genai.GenerativeModel.from_cached_content(cached)
+            # Rebuild a little before the server-side cache goes away.
+            return model, time.monotonic() + CONTEXT_CACHE_TTL_SECONDS * 0.9
+        except Exception as exc:
+            logger.info("Context cache unavailable for system instruction (%s); using plain model", exc)
+    return genai.GenerativeModel(model_name, system_instruction=system_instruction), float("inf")
+
+
+def get_model(system_instruction: str | None = None, model_name: str = MODEL_NAME):
+    """
+    Return the `model_name` instance for `system_instruction`, importing and
+    configuring the SDK on first use. One instance is kept per (model,
+    instruction) so the examiner prompts are attached once, not per request.
+    """
+    key = (model_name, system_instruction)
+    entry = _models.get(key)
+    if entry is None or entry[1] <= time.monotonic():
+        with _model_lock:
+            entry = _models.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                entry = _build_model(_sdk(), model_name, system_instruction)
+                _models[key] = entry
+    return entry[0]
+
+
+class CircuitBreaker:
+    """
+    Health of one model over its recent calls: closed (serving), open
+    (skipped until the cooldown passes) or half-open (one trial in flight).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self._calls: deque = deque(maxlen=BREAKER_WINDOW)
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Whether a request may go to this model now. In half-open state only
+        the first caller gets through (as the trial).
+        """
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= BREAKER_COOLDOWN_SECONDS:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return self.state == "closed"
+
+    def record(self, ok: bool, seconds: float) -> None:
+        with self._lock:
+            self._calls.append((ok, seconds))
+            if self.state == "half_open":
+                if ok:
+                    self.state = "closed"
+                    self._calls.clear()
+                else:
+                    self._open()
+            elif self.state == "closed" and len(self._calls) >= BREAKER_MIN_CALLS:
+                errors = sum(1 for call_ok, _ in self._calls if not call_ok)
+                p95 = self._p95([s for _, s in self._calls])
+                if errors / len(self._calls) >= BREAKER_ERROR_RATE or p95 >= BREAKER_P95_SECONDS:
+                    self._open()
+
+    def _open(self) -> None:
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        metrics.incr(f"ai.model.{self.name}.breaker_opened")
+        logger.warning("Circuit breaker opened for model %s", self.name)
+
+    @staticmethod
+    def _p95(samples: list[float]) -> float:
+        samples = sorted(samples)
+        return samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+
+    def latency_p95(self) -> float | None:
+        with self._lock:
+            samples = [s for ok, s in self._calls if ok]
+        return self._p95(samples) if len(samples) >= BREAKER_MIN_CALLS else None
+
+
+# Routed requests in flight at once, sized against the "ai" admission class:
+# each admitted request makes one call, or up to 4 for a section batch
+# (WRITING_BATCH_CONCURRENCY). Callers beyond this (e.g. async evaluations)
+# wait for a slot before their call, and so before the hedge clock, starts.
+ROUTER_MAX_CALLS = int(os.getenv("AI_ROUTER_MAX_CALLS", str(4 * (admission.CLASSES["ai"].limit or 4))))
+# Two workers per call (primary + hedge or failover), so a hedge never
+# queues behind other requests' primaries.
+ROUTER_WORKERS = int(os.getenv("AI_ROUTER_WORKERS", str(2 * ROUTER_MAX_CALLS)))
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_router_pool = ThreadPoolExecutor(max_workers=ROUTER_WORKERS, thread_name_prefix="ai-router")
+_router_slots = threading.BoundedSemaphore(ROUTER_MAX_CALLS)
+# Model calls currently running on _router_pool (including hedged duplicates
+# still finishing in the background).
+_busy = 0
+_busy_lock = threading.Lock()
+
+
+def breaker(model_name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        return _breakers.setdefault(model_name, CircuitBreaker(model_name))
+
+
+def _call_model(
+    model_name: str, system_instruction: str | None, contents, kwargs: dict, on_start: threading.Event | None = None
+):
+    global _busy
+    with _busy_lock:
+        _busy += 1
+    if on_start is not None:
+        on_start.set()
+    started = time.monotonic()
+    metrics.incr(f"ai.model.{model_name}.requests")
+    try:
+        response = get_model(system_instruction, model_name).generate_content(contents, **kwargs)
+    except Exception:
+        breaker(model_name).record(False, time.monotonic() - started)
+        metrics.incr(f"ai.model.{model_name}.errors")
+        raise
+    finally:
+        with _busy_lock:
+            _busy -= 1
+    elapsed = time.monotonic() - started
+    breaker(model_name).record(True, elapsed)
+    metrics.observe(f"ai.model.{model_name}.ms", elapsed * 1000)
+    return response
+
+
+def _next_model(candidates: list[str], tried: set[str]) -> str | None:
+    for name in candidates:
+        if name not in tried and breaker(name).allow():
+            return name
+    return None
+
+
+def _hedge_delay(model_name: str) -> float | None:
+    if not HEDGE_ENABLED:
+        return None
+    p95 = breaker(model_name).latency_p95()
+    if p95 is None:
+        return HEDGE_MAX_SECONDS
+    return min(HEDGE_MAX_SECONDS, max(HEDGE_MIN_SECONDS, p95))
+
+
+def route_generate(mode: str, contents, system_instruction: str | None = None, **kwargs):
+    """
+    Generate with the models configured for `mode`: the first healthy one
+    serves, a slow request is hedged to the next one, and a failed one
+    fails over to the next one. Raises the last error if every model fails.
+    """
+    waited = time.monotonic()
+    with _router_slots:
+        metrics.observe("ai.router.slot_wait_ms", (time.monotonic() - waited) * 1000)
+        return _route(mode, contents, system_instruction, kwargs)
+
+
+def _route(mode: str, contents, system_instruction: str | None, kwargs: dict):
+    candidates = MODEL_ROUTES.get(mode) or [MODEL_NAME]
+    primary = _next_model(candidates, set())
+    if primary is None:
+        # Every breaker is open: keep trying the preferred model rather than
+        # failing outright.
+        metrics.incr("ai.router.all_open")
+        primary = candidates[0]
+    tried = {primary}
+    primary_started = threading.Event()
+    pending = {
+        _router_pool.submit(_call_model, primary, system_instruction, contents, kwargs, primary_started): primary
+    }
+    hedge_after = _hedge_delay(primary)
+    hedge_at = None
+    last_error: Exception | None = None
+    while pending:
+        timeout = None
+        if hedge_after is not None:
+            if hedge_at is None:
+                # The hedge clock starts when the call does: time spent queued
+                # for a worker is not model latency, and hedging it would only
+                # add load when the pool is already behind.
+                primary_started.wait()
+                hedge_at = time.monotonic() + hedge_after
+            timeout = max(0.0, hedge_at - time.monotonic())
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            # Past the hedge threshold: race the next model (once), unless no
+            # worker is free to start it right away.
+            hedge_after = None
+            with _busy_lock:
+                saturated = _busy >= ROUTER_WORKERS
+            alternate = None if saturated else _next_model(candidates, tried)
+            if saturated:
+                metrics.incr("ai.router.hedges_skipped")
+            if alternate is not None:
+                tried.add(alternate)
+                pending[_router_pool.submit(_call_model, alternate, system_instruction, contents, kwargs)] = alternate
+                metrics.incr("ai.router.hedges")
+            continue
+        for future in done:
+            model_name = pending.pop(future)
+            try:
+                response = future.result()
+            except Exception as exc:
+                last_error = exc
+                logger.warning("Model %s failed for %s request: %s", model_name, mode, exc)
+                continue
+            if model_name != primary:
+                metrics.incr("ai.router.served_by_alternate")
+            # A slower duplicate keeps running in the background; its outcome
+            # still feeds that model's breaker.
+            return response
+        if not pending:
+            alternate = _next_model(candidates, tried)
+            if alternate is not None:
+                tried.add(alternate)
+                pending[_router_pool.submit(_call_model, alternate, system_instruction, contents, kwargs)] = alternate
+                metrics.incr("ai.router.failovers")
+    raise last_error
 
 
 def gemini_text(prompt: str, **kwargs) -> str:
     """
     Convenience helper: generate text for a single prompt.
     """
-    response = _model.generate_content(prompt, **kwargs)
+    response = get_model().generate_content(prompt, **kwargs)
 
     # Try to return response.text; fall back more defensively if needed
     text = getattr(response, "text", None)
@@ -53,27 +349,36 @@ def gemini_text(prompt: str, **kwargs) -> str:
 # ---------------------------------------------------------------------
 
 class _ModelsWrapper:
-    def __init__(self, model):
-        self._model = model
-
-    def generate_content(self, model: str | None = None, contents=None, **kwargs):
+    def generate_content(
+        self,
+        model: str | None = None,
+        contents=None,
+        system_instruction: str | None = None,
+        mode: str | None = None,
+        **kwargs,
+    ):
         """
         Shim so existing code like:
             client.models.generate_content(model=MODEL_NAME, contents=prompt)
         still works with the new SDK.
 
-        We ignore the `model` argument and always use the configured `_model`.
+        With `mode` ("practice"/"exam") the request goes through the model
+        router (see `route_generate`); otherwise it goes to `model` (default
+        MODEL_NAME) directly. `system_instruction` selects the pooled
+        instance carrying that prompt.
         """
         if contents is None and "prompt" in kwargs:
             contents = kwargs.pop("prompt")
 
+        if mode is not None:
+            return route_generate(mode, contents, system_instruction, **kwargs)
         # The new SDK happily accepts a string or richer content structure.
-        return self._model.generate_content(contents, **kwargs)
+        return get_model(system_instruction, model or MODEL_NAME).generate_content(contents, **kwargs)
 
 
 class _ClientShim:
-    def __init__(self, model):
-        self.models = _ModelsWrapper(model)
+    def __init__(self):
+        self.models = _ModelsWrapper()
 
     def generate_text(self, prompt: str, **kwargs) -> str:
         """
@@ -83,4 +388,4 @@ class _ClientShim:
 
 
 # This is what ai_helpers currently imports: `from ai_client import client, MODEL_NAME`
-client = _ClientShim(_model)
+client = _ClientShim()
@@ -4,10 +4,26 @@ import json
 import logging
 from typing import Any, Dict
 
-from ai_client import client, MODEL_NAME  # <-- new import
+import metrics
+from ai_client import client
+from ai_schemas import SPEAKING_FIELDS, WRITING_FIELDS, SchemaError, describe, response_schema, validate
+from prompts import SPEAKING_EXAMINER, WRITING_EXAMINER
 
 logger = logging.getLogger(__name__)
 
+for _kind in ("writing", "speaking"):
+    metrics.register_ratio(
+        f"ai.{_kind}.parse_failure_rate", f"ai.{_kind}.parse_failures", f"ai.{_kind}.requests"
+    )
+    metrics.register_ratio(f"ai.{_kind}.failure_rate", f"ai.{_kind}.failures", f"ai.{_kind}.requests")
+
+
+def _json_generation_config(fields: Dict[str, type]) -> Dict[str, Any]:
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": response_schema(fields),
+    }
+
 
 def _parse_json_response(raw_text: str) -> Dict[str, Any]:
     """
@@ -23,8 +39,73 @@ def _parse_json_response(raw_text: str) -> Dict[str, Any]:
     try:
         return json.loads(text)
     except Exception as exc:  # pragma: no cover - defensive parsing
-        logger.exception("Failed to parse Gemini JSON response: %s", text)
+        raise SchemaError(f"not valid JSON: {exc}") from exc
+
+
+def _generate_evaluation(
+    kind: str,
+    contents,
+    fields: Dict[str, type],
+    system_instruction: str | None = None,
+    mode: str = "practice",
+) -> Dict[str, Any]:
+    """
+    Request schema-constrained JSON from the models routed for `mode`,
+    validate it, and on failure make one cheap text-only repair call (the
+    audio/essay is not resent) on the fast practice tier.
+    """
+    metrics.incr(f"ai.{kind}.requests")
+    config = _json_generation_config(fields)
+    response = client.models.generate_content(
+        mode=mode,
+        contents=contents,
+        system_instruction=system_instruction,
+        generation_config=config,
+    )
+    raw_text = response.text
+    try:
+        return validate(_parse_json_response(raw_text), fields)
+    except SchemaError as exc:
+        metrics.incr(f"ai.{kind}.parse_failures")
+        logger.warning("Gemini %s evaluation failed validation (%s); repairing", kind, exc)
+        problem = str(exc)
+
+    repair_prompt = (
+        "The following output was supposed to be a single JSON object matching the schema "
+        f"{describe(fields)} but it is invalid ({problem}). "
+        "Return the corrected JSON object only, keeping the original scores and text wherever possible.\n\n"
+        f"{raw_text}"
+    )
+    repaired = client.models.generate_content(
+        mode="practice",
+        contents=repair_prompt,
+        generation_config=config,
+    )
+    try:
+        result = validate(_parse_json_response(repaired.text), fields)
+    except SchemaError as exc:
+        metrics.incr(f"ai.{kind}.failures")
+        logger.error("Gemini %s evaluation still invalid after repair: %s", kind, repaired.text)
         raise ValueError("Gemini response not valid JSON") from exc
+    metrics.incr(f"ai.{kind}.repaired")
+    return result
+
+
+def writing_eval_columns(eval_res: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Map a writing evaluation payload onto `writing_evaluations` columns.
+    """
+    return {
+        "overall_band": eval_res.get("overall_band"),
+        "band_task_response": eval_res.get("task_response"),
+        "band_coherence": eval_res.get("coherence_and_cohesion"),
+        "band_lexical": eval_res.get("lexical_resource"),
+        "band_grammar": eval_res.get("grammatical_range_and_accuracy"),
+        "is_good_enough": eval_res.get("is_good_enough"),
+        "feedback_short": eval_res.get("feedback_short"),
+        "feedback_detailed": eval_res.get("feedback_detailed"),
+        "model_answer": eval_res.get("model_answer"),
+    }
 
 
 def evaluate_ielts_writing(
@@ -32,41 +113,22 @@ def evaluate_ielts_writing(
     candidate_answer: str,
     task_type: str,
     target_band: float,
+    mode: str = "practice",
 ) -> Dict[str, Any]:
     """
     Evaluate an IELTS writing response using Gemini and return the parsed JSON payload.
-    Uses the new google.genai client.
+    The examiner instructions live on the model (see `prompts.WRITING_EXAMINER`);
+    only the task and answer are sent per request. `mode` ("practice" /
+    "exam") picks the model tier.
     """
-    system_prompt = (
-        "You are an official IELTS Writing examiner. "
-        "Score the candidate strictly by IELTS criteria and respond with JSON ONLY using the schema: "
-        '{"overall_band": float, "task_response": float, "coherence_and_cohesion": float, '
-        '"lexical_resource": float, "grammatical_range_and_accuracy": float, '
-        '"is_good_enough": bool, "feedback_short": str, "feedback_detailed": str, "model_answer": str}. '
-        "Do not include any text outside the JSON object."
-    )
-
-    user_content = (
-        f"Task type: {task_type}\n"
-        f"Target band threshold: {target_band}\n"
-        f"Question prompt:\n{prompt}\n\n"
-        f"Candidate answer:\n{candidate_answer}\n"
-    )
-
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=[
-            {
-                "role": "user",
-                "parts": [
-                    {"text": system_prompt},
-                    {"text": user_content},
-                ],
-            }
-        ],
+    user_content = WRITING_EXAMINER.render(
+        task_type=task_type,
+        target_band=target_band,
+        prompt=prompt,
+        candidate_answer=candidate_answer,
     )
-
-    return _parse_json_response(response.text)
+    contents = [{"role": "user", "parts": [{"text": user_content}]}]
+    return _generate_evaluation("writing", contents, WRITING_FIELDS, WRITING_EXAMINER.system, mode)
 
 
 def evaluate_ielts_speaking(
@@ -75,49 +137,31 @@ def evaluate_ielts_speaking(
     question_text: str,
     target_band: float,
     duration_seconds: int | None = None,
+    mode: str = "practice",
 ) -> Dict[str, Any]:
     """
-    Evaluate an IELTS speaking attempt (audio) via Gemini using the new google.genai client.
+    Evaluate an IELTS speaking attempt (audio) via Gemini, with the examiner
+    instructions attached to the model (see `prompts.SPEAKING_EXAMINER`).
+    `mode` ("practice" / "exam") picks the model tier.
     """
-    system_prompt = (
-        "You are an official IELTS Speaking examiner. "
-        "Listen to the provided audio and respond ONLY with JSON using the schema: "
-        '{"overall_band": float, "fluency_and_coherence": float, "lexical_resource": float, '
-        '"grammatical_range_and_accuracy": float, "pronunciation": float, '
-        '"on_topic": bool, "relevance_score": float, "relevance_feedback": str, '
-        '"is_good_enough": bool, "feedback_short": str, "feedback_detailed": str, "transcript": str}. '
-        "Be strict: penalize off-topic answers, very short answers, and missing details. "
-        "Set on_topic=false if the response does not address the question; reduce overall_band accordingly. "
-        "Set is_good_enough=false when the response is below the target_band or off-topic. "
-        "No additional commentary or code fences."
-    )
-
-    user_part = (
-        f"Question: {question_text}\n"
-        f"Target band threshold: {target_band}\n"
-        f"Approximate duration (seconds): {duration_seconds if duration_seconds is not None else 'unknown'}\n"
-        "Evaluate the speaking performance, check whether the answer addresses the question, "
-        "and transcribe the response. Penalize if the response is shorter than 5 seconds or clearly irrelevant."
+    user_part = SPEAKING_EXAMINER.render(
+        question_text=question_text,
+        target_band=target_band,
+        duration_seconds=duration_seconds if duration_seconds is not None else "unknown",
     )
-
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=[
-            {
-                "role": "user",
-                "parts": [
-                    {"text": system_prompt},
-                    {
-                        "inline_data": {
-                            "mime_type": audio_mime_type,
-                            # google-genai will handle bytes; no manual base64 needed
-                            "data": audio_bytes,
-                        }
-                    },
-                    {"text": user_part},
-                ],
-            }
-        ],
-    )
-
-    return _parse_json_response(response.text)
+    contents = [
+        {
+            "role": "user",
+            "parts": [
+                {
+                    "inline_data": {
+                        "mime_type": audio_mime_type,
+                        # google-genai will handle bytes; no manual base64 needed
+                        "data": audio_bytes,
+                    }
+                },
+                {"text": user_part},
+            ],
+        }
+    ]
+    return _generate_evaluation("speaking", contents, SPEAKING_FIELDS, SPEAKING_EXAMINER.system, mode)
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+# Typed output schemas for the examiner evaluations. Each maps a JSON field to
+# the Python type the routes expect; band fields are floats on the 0-9 scale.
+
+WRITING_FIELDS: Dict[str, type] = {
+    "overall_band": float,
+    "task_response": float,
+    "coherence_and_cohesion": float,
+    "lexical_resource": float,
+    "grammatical_range_and_accuracy": float,
+    "is_good_enough": bool,
+    "feedback_short": str,
+    "feedback_detailed": str,
+    "model_answer": str,
+}
+
+SPEAKING_FIELDS: Dict[str, type] = {
+    "overall_band": float,
+    "fluency_and_coherence": float,
+    "lexical_resource": float,
+    "grammatical_range_and_accuracy": float,
+    "pronunciation": float,
+    "on_topic": bool,
+    "relevance_score": float,
+    "relevance_feedback": str,
+    "is_good_enough": bool,
+    "feedback_short": str,
+    "feedback_detailed": str,
+    "transcript": str,
+}
+
+# Float fields that are IELTS bands (relevance_score is a free 0-1/0-10 score).
+_NON_BAND_FLOATS = {"relevance_score"}
+
+_JSON_TYPES = {float: "number", bool: "boolean", str: "string"}
+
+
+class SchemaError(ValueError):
+    pass
+
+
+def response_schema(fields: Dict[str, type]) -> Dict[str, Any]:
+    """
+    JSON schema accepted by the SDK's `response_schema` generation option.
+    """
+    return {
+        "type": "object",
+        "properties": {name: {"type": _JSON_TYPES[t]} for name, t in fields.items()},
+        "required": list(fields),
+    }
+
+
+def describe(fields: Dict[str, type]) -> str:
+    """
+    Compact `{"field": type, ...}` rendering used inside prompts.
+    """
+    inner = ", ".join(f'"{name}": {t.__name__}' for name, t in fields.items())
+    return "{" + inner + "}"
+
+
+def validate(payload: Any, fields: Dict[str, type]) -> Dict[str, Any]:
+    """
+    Check `payload` against `fields`, coercing ints to floats. Raises
+    SchemaError listing every problem found.
+    """
+    if not isinstance(payload, dict):
+        raise SchemaError(f"expected a JSON object, got {type(payload).__name__}")
+
+    out = dict(payload)
+    problems = []
+    for name, expected in fields.items():
+        if name not in payload or payload[name] is None:
+            problems.append(f"missing {name}")
+            continue
+        value = payload[name]
+        if expected is float:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                problems.append(f"{name} must be a number")
+                continue
+            value = float(value)
+            if name not in _NON_BAND_FLOATS and not 0.0 <= value <= 9.0:
+                problems.append(f"{name} out of band range 0-9")
+                continue
+        elif not isinstance(value, expected):
+            problems.append(f"{name} must be {_JSON_TYPES[expected]}")
+            continue
+        out[name] = value
+
+    if problems:
+        raise SchemaError("; ".join(problems))
+    return out
@@ -1,12 +1,19 @@
 from __future__ import annotations
 import os
 from flask import Flask, jsonify
+import admission
+import catalog
+import metrics
+import search
 from routes.content import content_bp
 from routes.practice import practice_bp
 from routes.exam import exam_bp
 from routes.premium import premium_bp
 from routes.profile import profile_bp
 from routes.speaking import speaking_bp
+from routes.media import media_bp
+from routes.events import events_bp
+from routes.bootstrap import bootstrap_bp
 
 
 def create_app() -> Flask:
@@ -14,9 +21,20 @@ def create_app() -> Flask:
 
     # Health check
     @app.get("/health")
+    @admission.priority("critical")
     def health():
         return jsonify({"ok": True})
 
+    # In-process counters / timings (AI parse failures, latencies, ...)
+    @app.get("/metrics")
+    @admission.priority("critical")
+    def metrics_snapshot():
+        return jsonify({**metrics.snapshot(), "admission": admission.status()})
+
+    # Per-class concurrency caps with brief queueing and 503 shedding, so AI
+    # evaluations cannot starve cheap endpoints (see admission.py).
+    admission.init_app(app)
+
     # Register blueprints
     app.register_blueprint(content_bp)
     app.register_blueprint(practice_bp)
@@ -24,6 +42,15 @@ def create_app() -> Flask:
     app.register_blueprint(premium_bp)
     app.register_blueprint(profile_bp)
     app.register_blueprint(speaking_bp)
+    app.register_blueprint(media_bp)
+    app.register_blueprint(events_bp)
+    app.register_blueprint(bootstrap_bp)
+
+    # Pre-load the catalog and keep hot entries fresh in the background so no
+    # request stalls on a cold cache (disable with CATALOG_PREWARM=0).
+    if os.environ.get("CATALOG_PREWARM", "1") == "1":
+        catalog.start_background_refresh()
+        search.start_background_refresh()
 
     return app
 
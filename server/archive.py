@@ -0,0 +1,168 @@
+"""
+Hot/cold archival of completed practice and exam sessions.
+
+Sessions completed more than ARCHIVE_AFTER_DAYS ago are moved, with their
+answers and evaluations, into the archive tables of
+migrations/0006_session_archive.sql, one batch per database transaction
+(`archive_practice_sessions` / `archive_exam_sessions`). Every batch takes
+the oldest remaining sessions, so an interrupted run resumes where it
+stopped. History read paths fall back to the archive via the helpers below.
+
+    cd server && python archive.py [--days 180] [--batch-size 200] [--max-batches N]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import item_stats
+import metrics
+import snapshots
+from supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+
+PRACTICE_ARCHIVE_TABLE = "practice_session_archive"
+EVALUATION_ARCHIVE_TABLE = "evaluation_archive"
+
+
+# Each batch returns the moved row counts plus "selected", the number of
+# sessions it considered.
+
+
+def _archive_practice_batch(sb, before: str, batch_size: int) -> dict:
+    moved = sb.rpc("archive_practice_sessions", {"p_before": before, "p_limit": batch_size}).execute().data
+    return {**moved, "selected": moved["sessions"]}
+
+
+def _with_snapshot(sb, ids: list[str]) -> set[str]:
+    rows = (
+        sb.table(snapshots.SNAPSHOT_TABLE).select("exam_session_id").in_("exam_session_id", ids).execute().data or []
+    )
+    return {r["exam_session_id"] for r in rows}
+
+
+def _archive_exam_batch(sb, before: str, batch_size: int) -> dict:
+    sessions = (
+        sb.table("exam_sessions")
+        .select("*")
+        .not_.is_("completed_at", "null")
+        .lt("completed_at", before)
+        .order("completed_at")
+        .order("id")
+        .limit(batch_size)
+        .execute()
+        .data
+        or []
+    )
+    if not sessions:
+        return {"selected": 0}
+    # The archived results screen is served from the snapshot, so build the
+    # missing ones first and leave any that still fail in the hot tables.
+    missing = {s["id"] for s in sessions} - _with_snapshot(sb, [s["id"] for s in sessions])
+    for session in sessions:
+        if session["id"] in missing:
+            try:
+                snapshots.build(sb, session)
+            except Exception:
+                metrics.incr("archive.exam.snapshot_failures")
+                logger.exception("Could not build the result snapshot of exam %s; not archiving it", session["id"])
+    ids = sorted(_with_snapshot(sb, [s["id"] for s in sessions]))
+    moved = sb.rpc("archive_exam_sessions", {"p_session_ids": ids, "p_before": before}).execute().data if ids else {}
+    return {**moved, "selected": len(sessions)}
+
+
+_BATCHES = {"practice": _archive_practice_batch, "exam": _archive_exam_batch}
+
+
+def run_kind(sb, kind: str, before: str, batch_size: int = ARCHIVE_BATCH_SIZE, max_batches: int | None = None) -> dict:
+    """
+    Archive `kind` ("practice"/"exam") sessions completed before `before`
+    until none are left (or `max_batches`). Returns the moved row counts.
+    """
+    totals = {"sessions": 0, "answers": 0, "evaluations": 0}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = _BATCHES[kind](sb, before, batch_size)
+        for key in totals:
+            totals[key] += moved.get(key) or 0
+        batches += 1
+        metrics.incr(f"archive.{kind}.sessions", moved.get("sessions") or 0)
+        # Stop at the end, or when a whole batch is stuck (e.g. snapshots that
+        # cannot be built) rather than retrying it forever.
+        if moved["selected"] < batch_size or not moved.get("sessions"):
+            break
+    return totals
+
+
+def run(days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE, max_batches: int | None = None) -> dict:
+    sb = get_supabase()
+    started = time.monotonic()
+    # Item stats read answers from the hot tables; fold in everything first.
+    item_stats.run()
+    before = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    moved = {kind: run_kind(sb, kind, before, batch_size, max_batches) for kind in _BATCHES}
+    logger.info("Archived %s (completed before %s) in %.1f s", moved, before, time.monotonic() - started)
+    return moved
+
+
+def practice_sessions(
+    sb,
+    user_id: str,
+    limit: int | None = None,
+    columns: str = "id:session_id,practice_set_id,completed_at,total_questions,correct_questions,score",
+) -> list[dict]:
+    """
+    The user's archived practice sessions, newest first, in the shape of
+    practice_sessions rows.
+    """
+    query = sb.table(PRACTICE_ARCHIVE_TABLE).select(columns).eq("user_id", user_id).order("completed_at", desc=True)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.execute().data or []
+
+
+def evaluations(sb, user_id: str, kind: str, page_size: int = 1000) -> list[dict]:
+    """
+    The user's archived `kind` ("writing"/"speaking") evaluation rows,
+    oldest first.
+    """
+    rows: list[dict] = []
+    start = 0
+    while True:
+        page = (
+            sb.table(EVALUATION_ARCHIVE_TABLE)
+            .select("row")
+            .eq("user_id", user_id)
+            .eq("kind", kind)
+            .order("created_at")
+            .range(start, start + page_size - 1)
+            .execute()
+            .data
+            or []
+        )
+        rows.extend(r["row"] for r in page)
+        if len(page) < page_size:
+            break
+        start += page_size
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(run(args.days, args.batch_size, args.max_batches))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import io
+import logging
+import os
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Local pre-analysis of speaking recordings, run before the Gemini call:
+# degenerate recordings (too short / silent) are answered without a model call,
+# valid ones are downsampled to compact mono audio to cut upload and latency.
+
+TARGET_SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+MIN_SPEAKING_SECONDS = float(os.getenv("SPEAKING_MIN_SECONDS", "5"))
+# A recording is only rejected as silent when less than this much of it is
+# louder than SILENCE_DBFS (muted or disconnected microphone). The relative
+# speech estimate below is reported but never used to reject: with steady
+# background noise there is no quiet stretch to measure a noise floor from,
+# so it undercounts speech; those recordings go to the model.
+MIN_SPEECH_SECONDS = float(os.getenv("SPEAKING_MIN_SPEECH_SECONDS", "1.5"))
+# Frames quieter than this are never speech, whatever the noise floor.
+SILENCE_DBFS = float(os.getenv("SPEAKING_SILENCE_DBFS", "-50"))
+# Speech frames must stand this far above the estimated noise floor.
+VAD_MARGIN_DB = 12.0
+# Share of full-scale samples above which a recording is flagged as clipped
+# (distorted; the feedback may mention it, but it is still evaluated).
+CLIPPED_RATIO = float(os.getenv("SPEAKING_CLIPPED_RATIO", "0.01"))
+OPUS_BITRATE = os.getenv("SPEAKING_OPUS_BITRATE", "24k")
+
+_FFMPEG = shutil.which("ffmpeg")
+
+
+class AudioStats:
+    __slots__ = (
+        "duration_seconds",
+        "audible_seconds",
+        "speech_seconds",
+        "speech_ratio",
+        "loudness_dbfs",
+        "clipped_ratio",
+        "clipped",
+    )
+
+    def __init__(self, duration_seconds, audible_seconds, speech_seconds, speech_ratio, loudness_dbfs, clipped_ratio):
+        self.duration_seconds = duration_seconds
+        self.audible_seconds = audible_seconds
+        self.speech_seconds = speech_seconds
+        self.speech_ratio = speech_ratio
+        self.loudness_dbfs = loudness_dbfs
+        self.clipped_ratio = clipped_ratio
+        self.clipped = clipped_ratio >= CLIPPED_RATIO
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class PreparedAudio:
+    """
+    Result of `prepare_speaking_audio`: either audio to send to the model
+    (possibly transcoded) or a `rejection` reason to answer locally.
+    """
+
+    __slots__ = ("audio_bytes", "mime_type", "stats", "rejection")
+
+    def __init__(self, audio_bytes: bytes, mime_type: str, stats: AudioStats | None, rejection: str | None = None):
+        self.audio_bytes = audio_bytes
+        self.mime_type = mime_type
+        self.stats = stats
+        self.rejection = rejection
+
+    @property
+    def duration_seconds(self) -> int | None:
+        return round(self.stats.duration_seconds) if self.stats else None
+
+
+def _decode_wav(audio_bytes: bytes) -> tuple[np.ndarray, int] | None:
+    try:
+        with wave.open(io.BytesIO(audio_bytes)) as wf:
+            width = wf.getsampwidth()
+            channels = wf.getnchannels()
+            rate = wf.getframerate()
+            raw = wf.readframes(wf.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        return None
+    if channels > 1:
+        samples = samples[: len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples, rate
+
+
+def _decode_ffmpeg(audio_bytes: bytes) -> tuple[np.ndarray, int] | None:
+    if not _FFMPEG:
+        return None
+    proc = subprocess.run(
+        [_FFMPEG, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+        input=audio_bytes,
+        capture_output=True,
+        timeout=60,
+    )
+    if proc.returncode != 0 or not proc.stdout:
+        return None
+    return np.frombuffer(proc.stdout, dtype="<i2").astype(np.float32) / 32768.0, TARGET_SAMPLE_RATE
+
+
+def decode(audio_bytes: bytes, mime_type: str) -> tuple[np.ndarray, int] | None:
+    """
+    Mono float32 samples in [-1, 1] and their sample rate, or None if the
+    format cannot be decoded locally (WAV natively, anything else via ffmpeg).
+    """
+    decoded = None
+    if "wav" in mime_type or audio_bytes[:4] == b"RIFF":
+        decoded = _decode_wav(audio_bytes)
+    return decoded or _decode_ffmpeg(audio_bytes)
+
+
+def resample(samples: np.ndarray, rate: int, target: int = TARGET_SAMPLE_RATE) -> np.ndarray:
+    if rate == target or samples.size == 0:
+        return samples
+    if rate > target:
+        # Box low-pass before decimating to keep aliasing down.
+        width = int(rate // target)
+        if width > 1:
+            samples = np.convolve(samples, np.full(width, 1.0 / width, dtype=np.float32), mode="same")
+    n_out = int(round(samples.size * target / rate))
+    positions = np.linspace(0, samples.size - 1, n_out, dtype=np.float64)
+    return np.interp(positions, np.arange(samples.size), samples).astype(np.float32)
+
+
+def analyze(samples: np.ndarray, rate: int) -> AudioStats:
+    """
+    Duration, time above the absolute silence floor, energy-based
+    speech/silence ratio (relative to the noise floor), loudness of the
+    speech frames and the fraction of clipped samples.
+    """
+    duration = samples.size / float(rate) if rate else 0.0
+    frame = max(1, int(rate * FRAME_SECONDS))
+    n_frames = samples.size // frame
+    if n_frames == 0:
+        return AudioStats(duration, 0.0, 0.0, 0.0, None, 0.0)
+
+    frames = samples[: n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    db = 20.0 * np.log10(rms + 1e-10)
+    audible_frames = int((db > SILENCE_DBFS).sum())
+    noise_floor = float(np.percentile(db, 10))
+    threshold = max(noise_floor + VAD_MARGIN_DB, SILENCE_DBFS)
+    speech = db > threshold
+
+    speech_frames = int(speech.sum())
+    loudness = None
+    if speech_frames:
+        loudness = float(20.0 * np.log10(np.sqrt(np.mean(np.square(rms[speech]))) + 1e-10))
+    clipped = float(np.mean(np.abs(samples) >= 0.999)) if samples.size else 0.0
+    return AudioStats(
+        duration,
+        audible_frames * frame / float(rate),
+        speech_frames * frame / float(rate),
+        speech_frames / float(n_frames),
+        loudness,
+        clipped,
+    )
+
+
+def _encode_wav(samples: np.ndarray, rate: int) -> bytes:
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def _encode_opus(samples: np.ndarray, rate: int) -> bytes | None:
+    if not _FFMPEG:
+        return None
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+    proc = subprocess.run(
+        [_FFMPEG, "-hide_banner", "-loglevel", "error", "-f", "s16le", "-ar", str(rate), "-ac", "1",
+         "-i", "pipe:0", "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-f", "ogg", "pipe:1"],
+        input=pcm,
+        capture_output=True,
+        timeout=60,
+    )
+    return proc.stdout if proc.returncode == 0 and proc.stdout else None
+
+
+def _compact(samples: np.ndarray, rate: int, original: bytes, mime_type: str) -> tuple[bytes, str]:
+    """
+    Smallest of: Opus/Ogg (if ffmpeg is available), 16 kHz mono WAV, original.
+    """
+    candidates = [(original, mime_type)]
+    opus = _encode_opus(samples, rate)
+    if opus:
+        candidates.append((opus, "audio/ogg"))
+    else:
+        candidates.append((_encode_wav(samples, rate), "audio/wav"))
+    return min(candidates, key=lambda c: len(c[0]))
+
+
+def prepare_speaking_audio(audio_bytes: bytes, mime_type: str) -> PreparedAudio:
+    """
+    Decode, analyze and compact a speaking recording. Undecodable audio is
+    passed through untouched for the model to handle.
+    """
+    decoded = decode(audio_bytes, mime_type)
+    if decoded is None:
+        metrics.incr("speaking.preanalysis.undecodable")
+        return PreparedAudio(audio_bytes, mime_type, None)
+
+    samples, rate = decoded
+    samples = resample(samples, rate)
+    stats = analyze(samples, TARGET_SAMPLE_RATE)
+
+    if stats.duration_seconds < MIN_SPEAKING_SECONDS:
+        metrics.incr("speaking.preanalysis.too_short")
+        return PreparedAudio(audio_bytes, mime_type, stats, "too_short")
+    if stats.audible_seconds < MIN_SPEECH_SECONDS:
+        metrics.incr("speaking.preanalysis.silent")
+        return PreparedAudio(audio_bytes, mime_type, stats, "silent")
+    if stats.clipped:
+        metrics.incr("speaking.preanalysis.clipped")
+
+    compact, compact_mime = _compact(samples, TARGET_SAMPLE_RATE, audio_bytes, mime_type)
+    metrics.observe("speaking.preanalysis.upload_ratio", len(compact) / max(1, len(audio_bytes)))
+    return PreparedAudio(compact, compact_mime, stats)
+
+
+_REJECTION_FEEDBACK = {
+    "too_short": (
+        "Your recording is too short to assess.",
+        "The recording is shorter than {min_seconds:.0f} seconds, so there is not enough speech to "
+        "evaluate against the IELTS criteria. Answer the question fully, aiming for at least "
+        "30-60 seconds, and record again.",
+    ),
+    "silent": (
+        "No speech was detected in your recording.",
+        "The recording contains little or no audible speech. Check that your microphone is working "
+        "and not muted, speak clearly and close enough to the device, and record again.",
+    ),
+}
+
+
+def rejection_evaluation(reason: str) -> dict:
+    """
+    Evaluation payload (same shape as the model's speaking JSON) for a
+    recording rejected by pre-analysis. It has no bands, only the reason:
+    nothing was assessed, so it must not count as a band of 0.
+    """
+    short, detailed = _REJECTION_FEEDBACK[reason]
+    return {
+        "rejected_reason": reason,
+        "overall_band": None,
+        "fluency_and_coherence": None,
+        "lexical_resource": None,
+        "grammatical_range_and_accuracy": None,
+        "pronunciation": None,
+        "on_topic": False,
+        "relevance_score": 0.0,
+        "relevance_feedback": short,
+        "is_good_enough": False,
+        "feedback_short": short,
+        "feedback_detailed": detailed.format(min_seconds=MIN_SPEAKING_SECONDS),
+        "transcript": "",
+    }
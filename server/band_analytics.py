@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import numpy as np
+
+import archive
+
+# Per-criterion band analytics over a user's evaluation history. Rows are
+# loaded once (paged) into NumPy arrays; everything after that is vectorized,
+# so a long history costs a few milliseconds, not a Python loop per row.
+
+PAGE_SIZE = 1000
+DEFAULT_WINDOW = 5
+DEFAULT_POINTS = 50
+PROJECTION_DAYS = 30
+
+WRITING_CRITERIA = ("band_task_response", "band_coherence", "band_lexical", "band_grammar")
+SPEAKING_CRITERIA = ("band_fluency", "band_lexical", "band_grammar", "band_pronunciation")
+
+_SOURCES = {
+    "writing": ("writing_evaluations", WRITING_CRITERIA),
+    "speaking": ("speaking_evaluations", SPEAKING_CRITERIA),
+}
+
+
+class BandHistory:
+    """
+    Column-oriented evaluation history: `times` in days since the first
+    evaluation, `overall` (n,) and `bands` (n, len(criteria)), NaN = missing.
+    """
+
+    __slots__ = ("criteria", "created_at", "times", "overall", "bands")
+
+    def __init__(self, criteria, created_at, times, overall, bands):
+        self.criteria = criteria
+        self.created_at = created_at
+        self.times = times
+        self.overall = overall
+        self.bands = bands
+
+    @classmethod
+    def from_rows(cls, rows: list[dict], criteria: tuple[str, ...]) -> "BandHistory":
+        created_at = [r["created_at"] for r in rows]
+        # timestamptz comes back as ISO-8601 in UTC; the first 19 chars are
+        # the second-resolution timestamp numpy parses natively.
+        stamps = np.array([str(c)[:19] for c in created_at], dtype="datetime64[s]").astype(np.float64)
+        times = (stamps - stamps[0]) / 86400.0 if stamps.size else stamps
+        columns = [
+            np.fromiter((np.nan if (v := r.get(c)) is None else v for r in rows), np.float64, len(rows))
+            for c in ("overall_band",) + criteria
+        ]
+        bands = np.column_stack(columns[1:]) if rows else np.empty((0, len(criteria)))
+        return cls(criteria, created_at, times, columns[0], bands)
+
+    def __len__(self) -> int:
+        return self.overall.size
+
+
+def load_history(sb, user_id: str, kind: str) -> BandHistory:
+    """
+    All of the user's `kind` ("writing"/"speaking") evaluations, oldest
+    first, fetched in PAGE_SIZE pages, including archived ones. Speaking
+    recordings rejected by pre-analysis were never assessed and are left out.
+    """
+    table, criteria = _SOURCES[kind]
+    columns = ",".join(("created_at", "overall_band") + criteria)
+    rows: list[dict] = []
+    start = 0
+    while True:
+        query = sb.table(table).select(columns).eq("user_id", user_id)
+        if kind == "speaking":
+            query = query.is_("rejected_reason", "null")
+        page = query.order("created_at").range(start, start + PAGE_SIZE - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+    archived = [r for r in archive.evaluations(sb, user_id, kind) if r.get("rejected_reason") is None]
+    if archived:
+        rows = sorted(archived + rows, key=lambda r: str(r["created_at"])[:19])
+    return BandHistory.from_rows(rows, criteria)
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing NaN-aware moving average along axis 0 (each output averages the
+    non-missing values among the last `window` rows).
+    """
+    present = ~np.isnan(values)
+    zero = np.zeros((1,) + values.shape[1:])
+    sums = np.concatenate([zero, np.cumsum(np.where(present, values, 0.0), axis=0)])
+    counts = np.concatenate([zero, np.cumsum(present, axis=0)])
+    lag = np.maximum(np.arange(1, values.shape[0] + 1) - window, 0)
+    n = counts[1:] - counts[lag]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n > 0, (sums[1:] - sums[lag]) / n, np.nan)
+
+
+def slopes(times: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Least-squares slope (bands per day) of every column of `values`
+    against `times`, ignoring missing values. NaN where undetermined.
+    """
+    present = ~np.isnan(values)
+    x = times[:, None] * present
+    y = np.where(present, values, 0.0)
+    n = present.sum(axis=0)
+    sx = x.sum(axis=0)
+    sy = y.sum(axis=0)
+    denom = n * (x * x).sum(axis=0) - sx * sx
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denom > 1e-12, (n * (x * y).sum(axis=0) - sx * sy) / denom, np.nan)
+
+
+def round_band(value: float) -> float:
+    """
+    IELTS rounding of an averaged band: .25 rounds up to .5, .75 to the next
+    whole band.
+    """
+    return float(np.floor(value * 2.0 + 0.5) / 2.0)
+
+
+def _num(value) -> float | None:
+    return None if value is None or np.isnan(value) else round(float(value), 2)
+
+
+def trends(history: BandHistory, window: int = DEFAULT_WINDOW, points: int = DEFAULT_POINTS) -> dict:
+    """
+    Per-criterion latest/mean/moving average/trend, weakest-first ranking,
+    predicted overall band, and the last `points` of the overall series.
+    """
+    if not len(history):
+        return {"count": 0, "criteria": [], "weakest": [], "predicted_overall_band": None, "series": []}
+
+    matrix = np.column_stack([history.overall, history.bands])
+    # A trailing average only looks back `window` rows, so just the returned
+    # tail (at least the last row) and its lead-in need averaging.
+    n = len(history)
+    k = min(n, max(points, 1))
+    ma = moving_average(matrix[max(0, n - k - window + 1):], window)[-k:]
+    slope = slopes(history.times, matrix)
+    present = ~np.isnan(matrix)
+    counts = present.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(present, matrix, 0.0).sum(axis=0) / counts
+    # Latest non-missing value per column.
+    last_idx = matrix.shape[0] - 1 - np.argmax(present[::-1], axis=0)
+    latest = np.where(counts > 0, matrix[last_idx, np.arange(matrix.shape[1])], np.nan)
+    current = ma[-1]
+
+    crit_current = current[1:]
+    ranked = np.argsort(np.where(np.isnan(crit_current), np.inf, crit_current), kind="stable")
+    weakest = [history.criteria[i] for i in ranked if not np.isnan(crit_current[i])]
+
+    predicted = None
+    if not np.isnan(crit_current).all():
+        predicted = round_band(float(np.nanmean(crit_current)))
+    elif not np.isnan(current[0]):
+        predicted = round_band(float(current[0]))
+    projected = None
+    if predicted is not None and not np.isnan(slope[0]):
+        projected = round_band(float(np.clip(predicted + slope[0] * PROJECTION_DAYS, 0.0, 9.0)))
+
+    criteria = []
+    for i, name in enumerate(("overall_band",) + history.criteria):
+        criteria.append(
+            {
+                "criterion": name,
+                "evaluations": int(counts[i]),
+                "latest": _num(latest[i]),
+                "mean": _num(mean[i]),
+                "moving_average": _num(current[i]),
+                "trend_per_30_days": _num(slope[i] * 30.0),
+            }
+        )
+
+    start = n - min(n, points)
+    series = [
+        {"created_at": c, "overall_band": _num(o), "moving_average": _num(m)}
+        for c, o, m in zip(history.created_at[start:], history.overall[start:], ma[k - (n - start):, 0])
+    ]
+    return {
+        "count": len(history),
+        "window": window,
+        "criteria": criteria,
+        "weakest": weakest,
+        "predicted_overall_band": predicted,
+        "projected_overall_band_30d": projected,
+        "series": series,
+    }
+
+
+def band_trends(sb, user_id: str, window: int = DEFAULT_WINDOW, points: int = DEFAULT_POINTS) -> dict:
+    return {kind: trends(load_history(sb, user_id, kind), window, points) for kind in _SOURCES}
@@ -0,0 +1,68 @@
+"""
+Time `band_analytics` on 10k synthetic writing evaluations: row -> array
+conversion and the vectorized trend computation, separately.
+
+    cd server && python bench/band_trends.py [--rows 10000] [--budget-ms 5]
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+
+from band_analytics import WRITING_CRITERIA, BandHistory, trends  # noqa: E402
+
+RUNS = 20
+
+
+def _rows(n: int) -> list[dict]:
+    rng = np.random.default_rng(42)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    # Slowly improving learner with per-criterion offsets and noise.
+    base = 5.0 + np.linspace(0.0, 2.0, n)
+    rows = []
+    for i in range(n):
+        bands = np.clip(np.round((base[i] + rng.normal([0.3, 0.0, -0.2, -0.5], 0.5)) * 2) / 2, 0, 9)
+        row = {"created_at": (start + timedelta(hours=3 * i)).isoformat(), "overall_band": float(bands.mean())}
+        for name, band in zip(WRITING_CRITERIA, bands):
+            row[name] = None if rng.random() < 0.02 else float(band)
+        rows.append(row)
+    return rows
+
+
+def _time_ms(fn) -> tuple[float, object]:
+    samples = []
+    result = None
+    for _ in range(RUNS):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return statistics.median(samples), result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--budget-ms", type=float, default=5.0, help="budget for the trend computation")
+    args = parser.parse_args()
+
+    rows = _rows(args.rows)
+    load_ms, history = _time_ms(lambda: BandHistory.from_rows(rows, WRITING_CRITERIA))
+    trend_ms, result = _time_ms(lambda: trends(history))
+
+    print(f"{args.rows} evaluations (median of {RUNS} runs)")
+    print(f"  rows -> arrays: {load_ms:7.2f} ms")
+    print(f"  trends:         {trend_ms:7.2f} ms (budget {args.budget_ms:.1f} ms)")
+    print(f"  weakest: {', '.join(result['weakest'])}; predicted {result['predicted_overall_band']}")
+    return 0 if trend_ms <= args.budget_ms else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Resident size of a cached 500-question catalog: raw PostgREST dicts vs the
+__slots__ models in `models.py`.
+
+    cd server && python bench/catalog_memory.py
+"""
+from __future__ import annotations
+
+import sys
+import tracemalloc
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from models import ListeningTrack, Question  # noqa: E402
+
+N_QUESTIONS = 500
+N_OPTIONS = 4
+
+
+def _rows() -> tuple[list[dict], dict[str, dict]]:
+    track_id = str(uuid.uuid4())
+    track = {
+        "id": track_id,
+        "title": "Section 1",
+        "audio_path": "listening/section-1.mp3",
+        "duration_seconds": 420,
+    }
+    rows = []
+    for i in range(N_QUESTIONS):
+        qid = str(uuid.uuid4())
+        rows.append(
+            {
+                "id": qid,
+                "practice_set_id": "ps-1",
+                "skill_id": "skill-1",
+                "type": "mcq",
+                "task_type": None,
+                "order_index": i,
+                "prompt": f"Question {i}: what does the speaker say about item {i}?",
+                "passage": None,
+                "max_score": 1,
+                "listening_track_id": track_id if i % 2 else None,
+                "audio_start_sec": i,
+                "audio_end_sec": i + 10,
+                "question_options": [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "question_id": qid,
+                        "option_index": j,
+                        "text": f"Option {j} for question {i}",
+                        "is_correct": j == 0,
+                    }
+                    for j in range(N_OPTIONS)
+                ],
+            }
+        )
+    return rows, {track_id: track}
+
+
+def _measure(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del keep
+    return size
+
+
+def main() -> None:
+    rows, tracks = _rows()
+
+    def as_dicts():
+        # What the handlers used to hold: row dicts copied with nested
+        # "options" / "listening_track" attached.
+        out = []
+        for r in rows:
+            q = {k: v for k, v in r.items() if k != "question_options"}
+            q["options"] = [dict(o) for o in r["question_options"]]
+            if q.get("listening_track_id"):
+                q["listening_track"] = dict(tracks[q["listening_track_id"]])
+            out.append(q)
+        return out
+
+    def as_models():
+        track_map = {tid: ListeningTrack.from_row(t) for tid, t in tracks.items()}
+        return tuple(Question.from_row(r, track_map) for r in rows)
+
+    dict_bytes = _measure(as_dicts)
+    model_bytes = _measure(as_models)
+    print(f"questions={N_QUESTIONS} options/question={N_OPTIONS}")
+    print(f"dict rows : {dict_bytes / 1024:8.1f} KiB")
+    print(f"slot models: {model_bytes / 1024:8.1f} KiB")
+    print(f"saving    : {100 * (1 - model_bytes / dict_bytes):8.1f} %")
+
+
+if __name__ == "__main__":
+    main()
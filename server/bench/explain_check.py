@@ -0,0 +1,157 @@
+"""
+EXPLAIN the routes' hot queries against a Postgres database and fail if any
+of them plans a sequential scan on a table with a realistic row count.
+
+Run it against a local copy of production-sized data with the migrations
+applied (needs `pip install psycopg2-binary`):
+
+    cd server && DATABASE_URL=postgresql://... python bench/explain_check.py [--min-rows 10000] [--analyze]
+
+Tables below --min-rows are reported but not enforced: on tiny tables a
+sequential scan is the planner's correct choice.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+
+# (route, table, SQL equivalent of the PostgREST call, query that picks a
+# realistic parameter value). Mirrors migrations/0005_hot_path_indexes.sql.
+CHECKS = [
+    (
+        "POST /api/practice-sessions/<id>/complete",
+        "practice_answers",
+        "select id, question_id, option_id, is_correct from public.practice_answers where session_id = %s",
+        "select session_id from public.practice_answers limit 1",
+    ),
+    (
+        "POST /api/exam-sections/<id>/complete",
+        "exam_answers",
+        "select count(*) from public.exam_answers where section_result_id = %s and is_correct is true",
+        "select section_result_id from public.exam_answers limit 1",
+    ),
+    (
+        "GET /api/exam-sessions/<id>/result",
+        "exam_answers",
+        "select id, question_id, option_id, answer_text, is_correct from public.exam_answers"
+        " where section_result_id = %s",
+        "select section_result_id from public.exam_answers limit 1",
+    ),
+    (
+        "POST /api/practice-sessions/<id>/complete (writing)",
+        "writing_evaluations",
+        "select * from public.writing_evaluations where practice_answer_id = %s",
+        "select practice_answer_id from public.writing_evaluations where practice_answer_id is not null limit 1",
+    ),
+    (
+        "POST /api/exam-sections/<id>/writing-eval",
+        "writing_evaluations",
+        "select exam_answer_id from public.writing_evaluations where exam_section_result_id = %s",
+        "select exam_section_result_id from public.writing_evaluations"
+        " where exam_section_result_id is not null limit 1",
+    ),
+    (
+        "GET /api/exam-sessions/<id>/result (speaking)",
+        "speaking_attempts",
+        "select id, audio_path, duration_seconds, question_id from public.speaking_attempts"
+        " where exam_section_result_id = %s",
+        "select exam_section_result_id from public.speaking_attempts where exam_section_result_id is not null limit 1",
+    ),
+    (
+        "POST /api/exam-answers (grading)",
+        "question_options",
+        "select id from public.question_options where question_id = %s and is_correct = true",
+        "select question_id from public.question_options limit 1",
+    ),
+    (
+        "GET /api/practice-sets/<id>/questions",
+        "questions",
+        "select * from public.questions where practice_set_id = %s order by order_index",
+        "select practice_set_id from public.questions limit 1",
+    ),
+    (
+        "GET /api/practice-sessions/recent",
+        "practice_sessions",
+        "select id, practice_set_id, completed_at, total_questions, correct_questions, score"
+        " from public.practice_sessions where user_id = %s order by completed_at desc limit 10",
+        "select user_id from public.practice_sessions limit 1",
+    ),
+]
+
+
+def _seq_scans(plan: dict, table: str) -> list[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") == table:
+        found.append(table)
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child, table))
+    return found
+
+
+def _node_types(plan: dict) -> list[str]:
+    out = [plan.get("Node Type", "?")]
+    for child in plan.get("Plans", []):
+        out.extend(_node_types(child))
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--min-rows", type=int, default=10_000)
+    parser.add_argument("--analyze", action="store_true", help="ANALYZE the checked tables first")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("set DATABASE_URL or pass --dsn")
+
+    try:
+        import psycopg2
+    except ImportError:
+        print("explain_check needs psycopg2 (pip install psycopg2-binary)", file=sys.stderr)
+        return 2
+
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    tables = sorted({table for _, table, _, _ in CHECKS})
+    if args.analyze:
+        for table in tables:
+            cur.execute(f"analyze public.{table}")
+    cur.execute(
+        "select relname, reltuples::bigint from pg_class c join pg_namespace n on n.oid = c.relnamespace"
+        " where n.nspname = 'public' and relname = any(%s)",
+        (tables,),
+    )
+    rows = dict(cur.fetchall())
+
+    failures = 0
+    for route, table, sql, sample_sql in CHECKS:
+        cur.execute(sample_sql)
+        sample = cur.fetchone()
+        if sample is None:
+            print(f"SKIP  {route}: {table} is empty")
+            continue
+        cur.execute("explain (format json) " + sql, sample)
+        plan = cur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        root = plan[0]["Plan"]
+        nodes = " > ".join(_node_types(root))
+        n_rows = rows.get(table, 0)
+        if _seq_scans(root, table):
+            if n_rows >= args.min_rows:
+                failures += 1
+                print(f"FAIL  {route}: seq scan on {table} ({n_rows} rows): {nodes}")
+            else:
+                print(f"WARN  {route}: seq scan on {table}, only {n_rows} rows (below --min-rows): {nodes}")
+        else:
+            print(f"OK    {route}: {nodes}")
+
+    conn.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Cold-start import report for the Flask app, with a time budget.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter (without AI
+credentials), prints the most expensive modules and exits non-zero when the
+total import time exceeds the budget or when the AI SDK was pulled in. The
+same check runs as part of the test suite (tests/test_startup_budget.py).
+
+    cd server && python bench/startup_report.py [--budget-ms 400] [--top 15]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parents[1]
+
+# Modules that must stay out of the import graph until first use.
+LAZY_MODULES = ("google.generativeai", "supabase", "postgrest", "requests")
+BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "400"))
+
+
+def import_times(runs: int) -> tuple[dict[str, int], dict[str, int], int]:
+    """
+    Return (self_us, cumulative_us, total_us) for `import app`, taking the best
+    of `runs` fresh interpreters to filter out noise.
+    """
+    env = {k: v for k, v in os.environ.items() if k not in ("GOOGLE_API_KEY", "GOOGLE_AI_KEY")}
+    # The catalog prewarm thread imports the Supabase SDK concurrently; keep it
+    # out of the measurement of the import graph itself.
+    env["CATALOG_PREWARM"] = "0"
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import app"],
+            cwd=SERVER_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            raise SystemExit("`import app` failed")
+        self_us: dict[str, int] = {}
+        cumulative_us: dict[str, int] = {}
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            _, self_part, cum_part, name = (p.strip() for p in line.replace("import time:", "|").split("|"))
+            self_us[name] = int(self_part)
+            cumulative_us[name] = int(cum_part)
+        total = cumulative_us.get("app", sum(self_us.values()))
+        if best is None or total < best[2]:
+            best = (self_us, cumulative_us, total)
+    return best
+
+
+def failures(self_us: dict[str, int], total_us: int, budget_ms: float) -> list[str]:
+    """
+    Budget violations for one measurement (empty when within budget).
+    """
+    out = []
+    eager = [m for m in LAZY_MODULES if m in self_us]
+    if eager:
+        out.append(f"imported at startup but should be lazy: {', '.join(eager)}")
+    if total_us / 1000 > budget_ms:
+        out.append(f"import app took {total_us / 1000:.1f} ms > {budget_ms:.0f} ms budget")
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    self_us, cumulative_us, total_us = import_times(args.runs)
+
+    by_package: dict[str, int] = {}
+    for name, us in self_us.items():
+        by_package[name.split(".")[0]] = by_package.get(name.split(".")[0], 0) + us
+
+    print(f"import app: {total_us / 1000:.1f} ms (budget {args.budget_ms:.0f} ms)\n")
+    print("top-level packages by self time:")
+    for pkg, us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[: args.top]:
+        print(f"  {us / 1000:8.1f} ms  {pkg}")
+    print("\nlocal modules (cumulative):")
+    local = [n for n in cumulative_us if (SERVER_DIR / (n.replace(".", "/") + ".py")).exists()]
+    for name in sorted(local, key=lambda n: cumulative_us[n], reverse=True):
+        print(f"  {cumulative_us[name] / 1000:8.1f} ms  {name}")
+
+    problems = failures(self_us, total_us, args.budget_ms)
+    for msg in problems:
+        print(f"\nFAIL: {msg}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Downloadable practice-set bundles: set metadata, skill, listening tracks,
+questions, options and passages, with signed audio URLs, in one gzip'd,
+content-hashed JSON artifact cached on local disk.
+
+Bundles are rebuilt when the set's `catalog_version` changes (see
+migrations/0003_catalog_versions.sql) or their signed URLs near expiry, and
+can be built ahead of time at publish:
+
+    cd server && python bundles.py [practice_set_id ...]
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from flask import Response, request
+
+import catalog
+import metrics
+from storage_urls import SIGNED_URL_REFRESH_MARGIN_SECONDS, attach_audio_urls
+from supabase_client import get_supabase
+from utils import to_jsonable
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_DIR = Path(os.getenv("BUNDLE_DIR", os.path.join(tempfile.gettempdir(), "ielts-bundles")))
+# Audio URLs inside a bundle are signed for this long; the bundle (and so its
+# cache lifetime) is bounded by them.
+BUNDLE_URL_TTL_SECONDS = int(os.getenv("BUNDLE_URL_TTL_SECONDS", str(7 * 24 * 3600)))
+BUNDLE_FORMAT = 1
+# Ids end up in file names / glob patterns.
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+_SET_COLUMNS = (
+    "id,skill_id,title,level_tag,short_description,estimated_minutes,is_premium,is_active,catalog_version"
+)
+
+_set_meta = catalog.TTLCache(catalog.CATALOG_TTL_SECONDS)
+_current: dict[str, "Bundle"] = {}
+_build_locks: dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+class Bundle:
+    __slots__ = ("practice_set_id", "digest", "path", "catalog_version", "is_premium", "expires_at")
+
+    def __init__(self, practice_set_id, digest, path, catalog_version, is_premium, expires_at):
+        self.practice_set_id = practice_set_id
+        self.digest = digest
+        self.path = path
+        self.catalog_version = catalog_version
+        self.is_premium = is_premium
+        # Wall-clock expiry of the signed URLs inside.
+        self.expires_at = expires_at
+
+    @property
+    def max_age(self) -> int:
+        return max(0, int(self.expires_at - time.time() - SIGNED_URL_REFRESH_MARGIN_SECONDS))
+
+    def usable(self, catalog_version) -> bool:
+        return self.catalog_version == catalog_version and self.max_age > 0 and self.path.is_file()
+
+
+def _file_name(ps_id: str, digest: str, catalog_version) -> str:
+    return f"{ps_id}.v{catalog_version}.{digest}.json.gz"
+
+
+def _practice_set(ps_id: str) -> dict | None:
+    def load():
+        rows = get_supabase().table("practice_sets").select(_SET_COLUMNS).eq("id", ps_id).execute().data or []
+        return rows[0] if rows else None
+
+    return _set_meta.get_or_load(ps_id, load)
+
+
+def build(ps_id: str, ps: dict | None = None) -> Bundle | None:
+    """
+    Build, write and register the bundle for a practice set. None if the set
+    does not exist or is inactive.
+    """
+    started = time.monotonic()
+    sb = get_supabase()
+    if ps is None:
+        rows = sb.table("practice_sets").select(_SET_COLUMNS).eq("id", ps_id).execute().data or []
+        ps = rows[0] if rows else None
+        if ps is not None:
+            _set_meta.set(ps_id, ps)
+    if not ps or not ps.get("is_active"):
+        return None
+    # Builds happen once per catalog_version, so read the questions fresh:
+    # the shared cache may still hold the set as it was before the publish
+    # that bumped the version.
+    questions = catalog.reload_practice_set_questions(ps_id)
+    if questions is None:
+        return None
+
+    skill = next((s for s in catalog.skills() if s["id"] == ps.get("skill_id")), None)
+    tracks = (
+        sb.table("listening_tracks")
+        .select("id,title,audio_path,duration_seconds")
+        .eq("practice_set_id", ps_id)
+        .execute()
+        .data
+        or []
+    )
+    question_dicts = [q.to_dict() for q in questions]
+    expires_at = time.time() + BUNDLE_URL_TTL_SECONDS
+    attach_audio_urls(
+        [*tracks, *(q["listening_track"] for q in question_dicts if "listening_track" in q)],
+        ttl=BUNDLE_URL_TTL_SECONDS,
+    )
+
+    payload = {
+        "format": BUNDLE_FORMAT,
+        "practice_set": to_jsonable(ps),
+        "skill": {"slug": skill["slug"], "name": skill["name"]} if skill else None,
+        "listening_tracks": tracks,
+        "questions": question_dicts,
+        "audio_urls_expire_at": datetime.fromtimestamp(expires_at, timezone.utc).isoformat(),
+    }
+    raw = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    # mtime=0 keeps the bytes (and so the hash) a pure function of the content.
+    blob = gzip.compress(raw, compresslevel=9, mtime=0)
+    digest = hashlib.sha256(blob).hexdigest()[:20]
+
+    BUNDLE_DIR.mkdir(parents=True, exist_ok=True)
+    path = BUNDLE_DIR / _file_name(ps_id, digest, ps.get("catalog_version"))
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    tmp.write_bytes(blob)
+    os.replace(tmp, path)
+
+    bundle = Bundle(ps_id, digest, path, ps.get("catalog_version"), bool(ps.get("is_premium")), expires_at)
+    with _lock:
+        previous = _current.get(ps_id)
+        _current[ps_id] = bundle
+    _prune(ps_id, keep={path, previous.path if previous else None})
+    metrics.observe("bundles.build_ms", (time.monotonic() - started) * 1000)
+    metrics.observe("bundles.compression_ratio", len(blob) / max(1, len(raw)))
+    return bundle
+
+
+def _prune(ps_id: str, keep: set) -> None:
+    # The previous artifact stays for clients that are mid-download.
+    for old in BUNDLE_DIR.glob(f"{ps_id}.v*.json.gz"):
+        if old not in keep:
+            old.unlink(missing_ok=True)
+
+
+def _from_disk(ps_id: str, ps: dict) -> Bundle | None:
+    """
+    Pick up an artifact written by an earlier process (or the CLI); its
+    signed URLs date from the file's mtime.
+    """
+    newest = None
+    for path in BUNDLE_DIR.glob(f"{ps_id}.v{ps.get('catalog_version')}.*.json.gz"):
+        if newest is None or path.stat().st_mtime > newest.stat().st_mtime:
+            newest = path
+    if newest is None:
+        return None
+    digest = newest.name.split(".")[-3]
+    expires_at = newest.stat().st_mtime + BUNDLE_URL_TTL_SECONDS
+    return Bundle(ps_id, digest, newest, ps.get("catalog_version"), bool(ps.get("is_premium")), expires_at)
+
+
+def current(ps_id: str) -> Bundle | None:
+    """
+    The up-to-date bundle for a practice set, building it (once, even under
+    concurrent requests) when missing or stale.
+    """
+    if not _SAFE_ID.match(ps_id):
+        return None
+    ps = _practice_set(ps_id)
+    if not ps or not ps.get("is_active"):
+        return None
+    version = ps.get("catalog_version")
+    bundle = _current.get(ps_id)
+    if bundle is not None and bundle.usable(version):
+        metrics.incr("bundles.hits")
+        return bundle
+
+    with _lock:
+        build_lock = _build_locks.setdefault(ps_id, threading.Lock())
+    with build_lock:
+        bundle = _current.get(ps_id)
+        if bundle is not None and bundle.usable(version):
+            return bundle
+        bundle = _from_disk(ps_id, ps)
+        if bundle is not None and bundle.usable(version):
+            with _lock:
+                _current[ps_id] = bundle
+            return bundle
+        metrics.incr("bundles.builds")
+        return build(ps_id, ps)
+
+
+def by_digest(ps_id: str, digest: str) -> Bundle | None:
+    """
+    A specific (immutable) artifact, if it is still on disk.
+    """
+    if not (_SAFE_ID.match(ps_id) and digest.isalnum()):
+        return None
+    bundle = _current.get(ps_id)
+    if bundle is not None and bundle.digest == digest and bundle.path.is_file():
+        return bundle
+    for path in BUNDLE_DIR.glob(f"{ps_id}.v*.{digest}.json.gz"):
+        ps = _practice_set(ps_id)
+        if ps is None:
+            # Without the set we cannot tell whether it is premium.
+            return None
+        expires_at = path.stat().st_mtime + BUNDLE_URL_TTL_SECONDS
+        return Bundle(ps_id, digest, path, path.name.split(".")[1][1:], bool(ps.get("is_premium")), expires_at)
+    return None
+
+
+def response(bundle: Bundle, immutable: bool) -> Response:
+    """
+    Serve an artifact as stored (gzip) to clients accepting it, decompressed
+    otherwise. The content-hashed URL is cacheable until its audio URLs
+    expire; the per-set URL only revalidates against the digest.
+    """
+    if bundle.digest in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        blob = bundle.path.read_bytes()
+        if "gzip" in (request.headers.get("Accept-Encoding") or ""):
+            resp = Response(blob, mimetype="application/json")
+            resp.headers["Content-Encoding"] = "gzip"
+        else:
+            resp = Response(gzip.decompress(blob), mimetype="application/json")
+    resp.set_etag(bundle.digest)
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Content-Location"] = f"/api/bundles/{bundle.practice_set_id}/{bundle.digest}"
+    scope = "private" if bundle.is_premium else "public"
+    if immutable:
+        resp.headers["Cache-Control"] = f"{scope}, max-age={bundle.max_age}, immutable"
+    else:
+        resp.headers["Cache-Control"] = f"{scope}, no-cache"
+    return resp
+
+
+def main(argv: list[str] | None = None) -> None:
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    ids = (argv if argv is not None else sys.argv[1:]) or [
+        item["id"]
+        for skill in catalog.skills()
+        for item in (catalog.skill_practice_sets(skill["slug"]) or {}).get("items", [])
+    ]
+    for ps_id in ids:
+        bundle = build(ps_id)
+        print(f"{ps_id}: {bundle.path if bundle else 'skipped (missing or inactive)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,503 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from models import ListeningTrack, Question
+from supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+# Catalog content (questions, options, tracks) changes only on publish, so it is
+# safe to keep in-process for a few minutes.
+CATALOG_TTL_SECONDS = float(os.getenv("CATALOG_TTL_SECONDS", "300"))
+# How long past its TTL an entry may still be served while it is refreshed in
+# the background (stale-while-revalidate).
+CATALOG_STALE_SECONDS = float(os.getenv("CATALOG_STALE_SECONDS", "600"))
+# Hot entries are refreshed this long before they expire.
+CATALOG_REFRESH_AHEAD_SECONDS = float(os.getenv("CATALOG_REFRESH_AHEAD_SECONDS", "60"))
+CATALOG_REFRESH_INTERVAL_SECONDS = float(os.getenv("CATALOG_REFRESH_INTERVAL_SECONDS", "15"))
+# Hits within the (decaying) window for an entry to count as hot.
+CATALOG_HOT_MIN_HITS = int(os.getenv("CATALOG_HOT_MIN_HITS", "3"))
+# Question lists pre-loaded per skill at startup (newest sets first).
+CATALOG_PREWARM_SETS_PER_SKILL = int(os.getenv("CATALOG_PREWARM_SETS_PER_SKILL", "5"))
+# Practice sets (with their questions) returned per /catalog/changes page.
+CATALOG_CHANGES_MAX_SETS = int(os.getenv("CATALOG_CHANGES_MAX_SETS", "50"))
+# Catalog versions are taken before commit; the version handed to clients
+# stays below anything stamped this recently (or by a transaction still
+# open), see migrations/0010_catalog_watermark.sql.
+CATALOG_COMMIT_LAG_SECONDS = int(os.getenv("CATALOG_COMMIT_LAG_SECONDS", "5"))
+# Rows per request when a query can exceed PostgREST's max-rows (1000 by
+# default), which silently truncates larger results.
+PAGE_SIZE = 1000
+
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="catalog-refresh")
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until", "loader", "hits", "refreshing")
+
+    def __init__(self, value, ttl: float, stale: float, loader):
+        now = time.monotonic()
+        self.value = value
+        self.fresh_until = now + ttl
+        self.stale_until = now + ttl + stale
+        self.loader = loader
+        self.hits = 0
+        self.refreshing = False
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: BaseException | None = None
+
+
+class TTLCache:
+    """
+    Thread-safe key -> value cache with a time-to-live.
+
+    * Concurrent misses for one key share a single upstream load (single-flight).
+    * Entries past their TTL but within the stale window are served immediately
+      while one background refresh replaces them (stale-while-revalidate).
+    * Per-entry hit counts let `refresh_hot()` reload popular entries before
+      they expire.
+    * Loads that return None (unknown slug or id) are not stored, so lookups
+      of arbitrary keys cannot grow the cache.
+    * `invalidate()` bumps a generation counter; a load or refresh that
+      started before it does not store its (possibly stale) result.
+    """
+
+    def __init__(self, ttl: float, stale: float = 0.0):
+        self.ttl = ttl
+        self.stale = stale
+        self._entries: dict[Any, _Entry] = {}
+        self._inflight: dict[Any, _Flight] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        _caches.append(self)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry.fresh_until < time.monotonic():
+            return default
+        return entry.value
+
+    def set(self, key, value, loader: Callable[[], Any] | None = None, generation: int | None = None) -> None:
+        entry = _Entry(value, self.ttl, self.stale, loader)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if value is None:
+                self._entries.pop(key, None)
+                return
+            old = self._entries.get(key)
+            if old is not None:
+                entry.hits = old.hits
+                entry.loader = loader or old.loader
+            self._entries[key] = entry
+
+    def get_or_load(self, key, loader: Callable[[], Any]):
+        now = time.monotonic()
+        leader = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.hits += 1
+                if now < entry.fresh_until:
+                    return entry.value
+                if now < entry.stale_until:
+                    self._schedule_refresh(key, entry)
+                    return entry.value
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._inflight[key] = _Flight()
+                leader = True
+            generation = self._generation
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            self.set(key, flight.value, loader, generation)
+            return flight.value
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def _schedule_refresh(self, key, entry: _Entry) -> None:
+        # Caller holds self._lock.
+        if entry.refreshing or entry.loader is None:
+            return
+        entry.refreshing = True
+        _refresh_pool.submit(self._refresh, key, entry, self._generation)
+
+    def _refresh(self, key, entry: _Entry, generation: int) -> None:
+        try:
+            self.set(key, entry.loader(), entry.loader, generation)
+        except Exception:
+            # Keep serving the stale value until it ages out.
+            logger.exception("Catalog refresh failed for %r", key)
+        finally:
+            # Only matters when the entry was kept (failed or discarded load).
+            entry.refreshing = False
+
+    def refresh_hot(self, min_hits: int, ahead: float) -> int:
+        """
+        Schedule refreshes for popular entries about to expire; decay hit
+        counts so popularity tracks recent traffic. Returns refreshes queued.
+        """
+        now = time.monotonic()
+        queued = 0
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry.hits >= min_hits and entry.fresh_until - now < ahead and not entry.refreshing:
+                    self._schedule_refresh(key, entry)
+                    queued += 1
+                entry.hits //= 2
+            expired = [k for k, e in self._entries.items() if e.stale_until < now]
+            for k in expired:
+                del self._entries[k]
+        return queued
+
+    def invalidate(self, key=None) -> None:
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+_caches: list[TTLCache] = []
+
+_skills_cache = TTLCache(CATALOG_TTL_SECONDS, CATALOG_STALE_SECONDS)
+_skill_sets_cache = TTLCache(CATALOG_TTL_SECONDS, CATALOG_STALE_SECONDS)
+_questions_cache = TTLCache(CATALOG_TTL_SECONDS, CATALOG_STALE_SECONDS)
+_question_by_id = TTLCache(CATALOG_TTL_SECONDS)
+
+_QUESTION_COLUMNS = (
+    "id,practice_set_id,skill_id,type,task_type,order_index,prompt,passage,max_score,"
+    "listening_track_id,audio_start_sec,audio_end_sec,"
+    "question_options(id,question_id,option_index,text,is_correct)"
+)
+
+
+def _load_skills() -> list[dict]:
+    sb = get_supabase()
+    return (
+        sb.table("skills")
+        .select("id,slug,name,description,color_hex,icon_key")
+        .order("name")
+        .execute()
+        .data
+        or []
+    )
+
+
+def _load_skill_practice_sets(slug: str) -> dict | None:
+    sb = get_supabase()
+
+    # 1) Fetch skill
+    skill_rows = sb.table("skills").select("id,slug,name").eq("slug", slug).execute().data or []
+    if not skill_rows:
+        return None
+    skill = skill_rows[0]
+
+    # 2) Fetch sets + aggregated question counts in ONE call
+    # Make sure your DB has a relation from questions.practice_set_id to practice_sets.id
+    rows = (
+        sb.table("practice_sets")
+        .select(
+            "id,title,level_tag,short_description,estimated_minutes,is_premium,"
+            "questions(count)"
+        )
+        .eq("skill_id", skill["id"])
+        .eq("is_active", True)
+        .order("created_at", desc=True)
+        .execute()
+        .data
+        or []
+    )
+
+    sets = []
+    for row in rows:
+        # Supabase returns something like: "questions": [{"count": 12}]
+        questions_rel = row.get("questions") or []
+        q_count = 0
+        if questions_rel and isinstance(questions_rel, list):
+            first = questions_rel[0] or {}
+            q_count = first.get("count", 0) or 0
+
+        sets.append(
+            {
+                "id": row["id"],
+                "title": row["title"],
+                "level_tag": row.get("level_tag"),
+                "short_description": row.get("short_description"),
+                "estimated_minutes": row.get("estimated_minutes"),
+                "is_premium": row.get("is_premium"),
+                "question_count": q_count,
+            }
+        )
+
+    return {
+        "skill": {
+            "slug": skill["slug"],
+            "name": skill["name"],
+        },
+        "items": sets,
+    }
+
+
+def _load_practice_set_questions(ps_id: str) -> tuple[Question, ...] | None:
+    sb = get_supabase()
+    ps = sb.table("practice_sets").select("id").eq("id", ps_id).execute().data or []
+    if not ps:
+        return None
+
+    rows = (
+        sb.table("questions")
+        .select(_QUESTION_COLUMNS)
+        .eq("practice_set_id", ps_id)
+        .order("order_index")
+        .execute()
+        .data
+        or []
+    )
+
+    return tuple(_build_questions(sb, rows))
+
+
+def _build_questions(sb, rows: list[dict]) -> list[Question]:
+    track_ids = list({r["listening_track_id"] for r in rows if r.get("listening_track_id")})
+    track_map: dict[str, ListeningTrack] = {}
+    if track_ids:
+        tracks = (
+            sb.table("listening_tracks")
+            .select("id,title,audio_path,duration_seconds")
+            .in_("id", track_ids)
+            .execute()
+            .data
+            or []
+        )
+        track_map = {t["id"]: ListeningTrack.from_row(t) for t in tracks}
+
+    questions = [Question.from_row(r, track_map) for r in rows]
+    for q in questions:
+        _question_by_id.set(q.id, q)
+    return questions
+
+
+def skills() -> list[dict]:
+    return _skills_cache.get_or_load("all", _load_skills)
+
+
+def skill_practice_sets(slug: str) -> dict | None:
+    """
+    `{"skill": ..., "items": [...]}` for a skill, or None if the slug is unknown.
+    """
+    return _skill_sets_cache.get_or_load(slug, lambda: _load_skill_practice_sets(slug))
+
+
+def practice_set_questions(ps_id: str) -> tuple[Question, ...] | None:
+    """
+    Questions (with options and listening tracks) for a practice set, ordered by
+    ``order_index``. Returns None when the practice set does not exist.
+    """
+    return _questions_cache.get_or_load(ps_id, lambda: _load_practice_set_questions(ps_id))
+
+
+def reload_practice_set_questions(ps_id: str) -> tuple[Question, ...] | None:
+    """
+    Like `practice_set_questions()`, but always read from the database (and
+    refresh the cache with the result).
+    """
+    questions = _load_practice_set_questions(ps_id)
+    _questions_cache.set(ps_id, questions, lambda: _load_practice_set_questions(ps_id))
+    return questions
+
+
+def questions_by_id(question_ids) -> dict[str, Question]:
+    """
+    Look up individual questions (with options), fetching all cache misses in
+    a single query.
+    """
+    out: dict[str, Question] = {}
+    missing = []
+    for qid in set(question_ids):
+        if not qid:
+            continue
+        q = _question_by_id.get(qid)
+        if q is None:
+            missing.append(qid)
+        else:
+            out[qid] = q
+    if missing:
+        sb = get_supabase()
+        rows = sb.table("questions").select(_QUESTION_COLUMNS).in_("id", missing).execute().data or []
+        for q in _build_questions(sb, rows):
+            out[q.id] = q
+    return out
+
+
+def changes(since: int, limit: int = CATALOG_CHANGES_MAX_SETS) -> dict:
+    """
+    Skills and practice sets (with full questions/options) stamped after
+    catalog version `since` (see migrations/0003_catalog_versions.sql), plus
+    removed ids. Pages at `limit` sets; `version` is what the client passes
+    as `since` next time, `has_more` says whether to call again right away.
+    `version` never passes the safe watermark, so changes stamped too
+    recently to be sure nothing earlier is still uncommitted are returned
+    again on the next call.
+    """
+    sb = get_supabase()
+    # Before the reads: every version at or below it is committed by now.
+    watermark = sb.rpc("catalog_watermark", {"p_lag_seconds": CATALOG_COMMIT_LAG_SECONDS}).execute().data
+    sets = (
+        sb.table("practice_sets")
+        .select(
+            "id,skill_id,title,level_tag,short_description,estimated_minutes,"
+            "is_premium,is_active,catalog_version"
+        )
+        .gt("catalog_version", since)
+        .order("catalog_version")
+        .limit(limit + 1)
+        .execute()
+        .data
+        or []
+    )
+    has_more = len(sets) > limit
+    sets = sets[:limit]
+    # When paging, only report other changes up to the last returned set so
+    # nothing between pages is skipped.
+    upto = sets[-1]["catalog_version"] if has_more else None
+
+    skills_q = (
+        sb.table("skills")
+        .select("id,slug,name,description,color_hex,icon_key,catalog_version")
+        .gt("catalog_version", since)
+    )
+    tombstones_q = sb.table("catalog_tombstones").select("kind,id,catalog_version").gt("catalog_version", since)
+    if upto is not None:
+        skills_q = skills_q.lte("catalog_version", upto)
+        tombstones_q = tombstones_q.lte("catalog_version", upto)
+    changed_skills = skills_q.order("catalog_version").execute().data or []
+    tombstones = tombstones_q.execute().data or []
+
+    active = [s for s in sets if s.get("is_active")]
+    by_set: dict[str, list[Question]] = {s["id"]: [] for s in active}
+    if active:
+        rows: list[dict] = []
+        start = 0
+        while True:
+            page = (
+                sb.table("questions")
+                .select(_QUESTION_COLUMNS)
+                .in_("practice_set_id", list(by_set))
+                .order("practice_set_id")
+                .order("order_index")
+                .order("id")
+                .range(start, start + PAGE_SIZE - 1)
+                .execute()
+                .data
+                or []
+            )
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+        for q in _build_questions(sb, rows):
+            by_set[q.practice_set_id].append(q)
+        # These lists are as fresh as it gets; refresh the shared cache too.
+        for ps_id, questions in by_set.items():
+            _questions_cache.set(ps_id, tuple(questions), lambda ps_id=ps_id: _load_practice_set_questions(ps_id))
+
+    versions = [r["catalog_version"] for r in (*sets, *changed_skills, *tombstones)]
+    version = max(versions, default=since)
+    if version > watermark:
+        # Stop paging too: the rest is as recent and comes with the next sync.
+        version, has_more = max(since, watermark), False
+    return {
+        "since": since,
+        "version": version,
+        "has_more": has_more,
+        "skills": changed_skills,
+        "practice_sets": [
+            {**ps, "questions": [q.to_dict() for q in by_set[ps["id"]]]} for ps in active
+        ],
+        "removed": {
+            "skills": [t["id"] for t in tombstones if t["kind"] == "skill"],
+            "practice_sets": [s["id"] for s in sets if not s.get("is_active")]
+            + [t["id"] for t in tombstones if t["kind"] == "practice_set"],
+        },
+    }
+
+
+def invalidate(ps_id: str | None = None) -> None:
+    _questions_cache.invalidate(ps_id)
+    _question_by_id.invalidate()
+    _skill_sets_cache.invalidate()
+    _skills_cache.invalidate()
+
+
+def prewarm() -> None:
+    """
+    Load skills, every skill's practice-set list and the newest sets' questions
+    so the first requests after a deploy are served from memory.
+    """
+    started = time.monotonic()
+    loaded_sets = 0
+    for skill in skills():
+        listing = skill_practice_sets(skill["slug"])
+        for item in (listing or {}).get("items", [])[:CATALOG_PREWARM_SETS_PER_SKILL]:
+            practice_set_questions(item["id"])
+            loaded_sets += 1
+    logger.info("Catalog prewarmed (%d question sets) in %.0f ms", loaded_sets, (time.monotonic() - started) * 1000)
+
+
+_refresher_started = False
+_refresher_lock = threading.Lock()
+
+
+def _refresher_loop() -> None:
+    try:
+        prewarm()
+    except Exception:
+        logger.exception("Catalog prewarm failed")
+    while True:
+        time.sleep(CATALOG_REFRESH_INTERVAL_SECONDS)
+        try:
+            for cache in _caches:
+                cache.refresh_hot(CATALOG_HOT_MIN_HITS, CATALOG_REFRESH_AHEAD_SECONDS)
+        except Exception:
+            logger.exception("Catalog hot-entry refresh failed")
+
+
+def start_background_refresh() -> None:
+    """
+    Start (once per process) the daemon thread that prewarms the catalog and
+    keeps hot entries fresh.
+    """
+    global _refresher_started
+    with _refresher_lock:
+        if _refresher_started:
+            return
+        _refresher_started = True
+    threading.Thread(target=_refresher_loop, name="catalog-refresher", daemon=True).start()
@@ -0,0 +1,418 @@
+from __future__ import annotations
+
+import atexit
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from ai_helpers import writing_eval_columns
+
+logger = logging.getLogger(__name__)
+
+# Near-duplicate essay detection. Every evaluated writing answer gets a
+# MinHash signature of its word shingles, bucketed per question by LSH bands,
+# so a new answer is compared only against the few essays sharing a bucket:
+# lookup cost depends on the number of bands, not on the number of essays.
+# Near-duplicates are linked to the matched evaluation (and matches against
+# another user's essay flagged as likely copying); an answer close enough to
+# one of the same user's evaluated answers in the same mode reuses that
+# evaluation instead of calling the model.
+
+# .npz file so the index survives restarts ("" keeps it in memory only).
+# Every worker process keeps its own index and saves by merging it into the
+# file under a lock, so workers share each other's essays after a save and
+# none overwrites another's.
+ESSAY_INDEX_PATH = os.getenv("ESSAY_INDEX_PATH", os.path.join(tempfile.gettempdir(), "ielts-essay-index.npz"))
+ESSAY_INDEX_SAVE_SECONDS = int(os.getenv("ESSAY_INDEX_SAVE_SECONDS", "60"))
+# Estimated Jaccard similarity (of word 5-gram sets) to record a duplicate,
+# and to reuse the matched essay's evaluation instead of calling the model.
+# Each changed word breaks up to 5 shingles: three words changed in a
+# 250-word essay is about 0.88.
+DUPLICATE_SIMILARITY = float(os.getenv("ESSAY_DUPLICATE_SIMILARITY", "0.6"))
+REUSE_SIMILARITY = float(os.getenv("ESSAY_REUSE_SIMILARITY", "0.8"))
+# Shorter answers are not indexed: a few shingles say little about copying.
+MIN_WORDS = int(os.getenv("ESSAY_MIN_WORDS", "40"))
+SHINGLE_WORDS = 5
+# 32 bands x 4 rows: pairs at 0.6 similarity share a bucket with ~99%
+# probability, pairs at 0.2 with ~5%.
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+# Templated essays can fill a bucket; only the newest entries are compared.
+MAX_CANDIDATES = 200
+# Best matches looked at per answer (for a live link target and a reusable
+# evaluation).
+MAX_MATCHES = 5
+
+# Fixed seed: persisted signatures must be comparable across restarts.
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 2**31, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 2**32, NUM_PERM, dtype=np.uint64)
+# Odd multipliers folding a band's ROWS values into one 64-bit bucket hash
+# (wrapping arithmetic; a rare collision only adds a candidate to verify).
+_BAND_MIX = _rng.integers(1, 2**63, ROWS, dtype=np.uint64) | np.uint64(1)
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def shingles(text: str) -> set[str]:
+    words = _WORD.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return set()
+    return {" ".join(words[i : i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def signature(text: str) -> np.ndarray | None:
+    """
+    MinHash signature (NUM_PERM uint32) of the essay's shingle set, or None
+    for answers too short to index.
+    """
+    grams = shingles(text)
+    if not grams:
+        return None
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little") for g in grams),
+        np.uint64,
+        len(grams),
+    )
+    # (a * x + b) mod p for every permutation at once; a < 2**31 and x < 2**32
+    # keep the product inside uint64.
+    mins = ((np.outer(_A, hashes) + _B[:, None]) % _PRIME).min(axis=1)
+    return np.minimum(mins, 2**32 - 1).astype(np.uint32)
+
+
+def band_hashes(signatures: np.ndarray) -> np.ndarray:
+    """
+    (n, BANDS) uint64 LSH bucket hashes of (n, NUM_PERM) signatures.
+    """
+    bands = signatures.astype(np.uint64).reshape(len(signatures), BANDS, ROWS)
+    return (bands * _BAND_MIX).sum(axis=2, dtype=np.uint64)
+
+
+class Match:
+    __slots__ = ("key", "evaluation_id", "user_id", "similarity")
+
+    def __init__(self, key, evaluation_id, user_id, similarity):
+        self.key = key
+        self.evaluation_id = evaluation_id
+        self.user_id = user_id
+        self.similarity = similarity
+
+
+class EssayIndex:
+    """
+    Signatures in one growing (n, NUM_PERM) array plus parallel metadata
+    lists; buckets map hash((question_id, band, bucket hash)) to a row
+    position, or a list of them once shared. Int keys and singleton values
+    keep ~BANDS entries per essay cheap to build and invisible to the GC.
+    Removed entries keep their position (key set to None) until the next
+    save/load compacts them away.
+    """
+
+    def __init__(self):
+        self.keys: list[str | None] = []
+        self.question_ids: list[str] = []
+        self.evaluation_ids: list[str] = []
+        self.user_ids: list[str] = []
+        self.signatures = np.zeros((0, NUM_PERM), dtype=np.uint32)
+        self._pos: dict[str, int] = {}
+        self._buckets: dict[int, int | list[int]] = {}
+        self._lock = threading.Lock()
+        # Keys removed since the last save, so merging the file does not
+        # bring them back.
+        self._removed: set[str] = set()
+        self.saved_at = time.monotonic()
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _bucket(self, pos: int, question_id: str, hashes: list[int]) -> None:
+        buckets = self._buckets
+        for band, h in enumerate(hashes):
+            key = hash((question_id, band, h))
+            current = buckets.get(key)
+            if current is None:
+                buckets[key] = pos
+            elif isinstance(current, list):
+                current.append(pos)
+            else:
+                buckets[key] = [current, pos]
+
+    def _append(self, key, question_id, evaluation_id, user_id, sig) -> None:
+        pos = len(self.keys)
+        if pos >= self.signatures.shape[0]:
+            grow = max(256, self.signatures.shape[0])
+            self.signatures = np.concatenate([self.signatures, np.zeros((grow, NUM_PERM), dtype=np.uint32)])
+        self.signatures[pos] = sig
+        self.keys.append(key)
+        self.question_ids.append(question_id)
+        self.evaluation_ids.append(evaluation_id)
+        self.user_ids.append(user_id)
+        self._pos[key] = pos
+        self._bucket(pos, question_id, band_hashes(sig[None])[0].tolist())
+
+    def add(self, question_id: str, key: str, text: str, evaluation_id: str, user_id: str) -> bool:
+        """
+        Index an evaluated answer (`key` e.g. "practice:<answer id>"). False
+        if it is too short or already indexed.
+        """
+        sig = signature(text)
+        if sig is None:
+            return False
+        with self._lock:
+            if key in self._pos:
+                return False
+            self._append(key, question_id, evaluation_id, user_id, sig)
+            self.dirty = True
+        return True
+
+    def remove(self, key: str) -> bool:
+        """
+        Forget an indexed answer (e.g. its evaluation was archived). False if
+        it was not indexed.
+        """
+        with self._lock:
+            pos = self._pos.pop(key, None)
+            if pos is None:
+                return False
+            self.keys[pos] = None
+            self._removed.add(key)
+            self.dirty = True
+        return True
+
+    def merge(self, other: "EssayIndex") -> int:
+        """
+        Add the entries of `other` this index does not have (and has not
+        removed). Returns how many were added.
+        """
+        added = 0
+        with self._lock:
+            for pos, key in enumerate(other.keys):
+                if key is None or key in self._pos or key in self._removed:
+                    continue
+                self._append(
+                    key, other.question_ids[pos], other.evaluation_ids[pos], other.user_ids[pos], other.signatures[pos]
+                )
+                added += 1
+        return added
+
+    def matches(
+        self, question_id: str, text: str, exclude_key: str | None = None, limit: int = MAX_MATCHES
+    ) -> list[Match]:
+        """
+        Up to `limit` indexed answers to the same question sharing an LSH
+        bucket with `text`, most similar first.
+        """
+        sig = signature(text)
+        if sig is None:
+            return []
+        with self._lock:
+            candidates: set[int] = set()
+            for band, h in enumerate(band_hashes(sig[None])[0].tolist()):
+                found = self._buckets.get(hash((question_id, band, h)))
+                if isinstance(found, list):
+                    candidates.update(found[-MAX_CANDIDATES:])
+                elif found is not None:
+                    candidates.add(found)
+            candidates.discard(self._pos.get(exclude_key, -1))
+            candidates = [pos for pos in candidates if self.keys[pos] is not None]
+            if not candidates:
+                return []
+            rows = np.array(candidates, dtype=np.int64)
+            similarity = (self.signatures[rows] == sig).mean(axis=1)
+            order = np.argsort(-similarity, kind="stable")[:limit]
+            return [
+                Match(self.keys[pos], self.evaluation_ids[pos], self.user_ids[pos], float(similarity[i]))
+                for i, pos in ((int(i), int(rows[i])) for i in order)
+            ]
+
+    def save(self, path: str) -> None:
+        """
+        Merge the file at `path` (saved by other workers) into this index,
+        then write the result back, holding an exclusive lock on
+        `path`.lock throughout.
+        """
+        with open(f"{path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(path):
+                    try:
+                        self.merge(EssayIndex.load(path))
+                    except Exception:
+                        logger.exception("Could not merge essay index from %s; overwriting it", path)
+                self._write(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, path: str) -> None:
+        with self._lock:
+            live = [pos for pos, key in enumerate(self.keys) if key is not None]
+            tmp = f"{path}.{os.getpid()}.tmp.npz"
+            # MinHash values are incompressible; plain savez is much faster.
+            np.savez(
+                tmp,
+                keys=np.array([self.keys[pos] for pos in live], dtype=str),
+                question_ids=np.array([self.question_ids[pos] for pos in live], dtype=str),
+                evaluation_ids=np.array([self.evaluation_ids[pos] for pos in live], dtype=str),
+                user_ids=np.array([self.user_ids[pos] for pos in live], dtype=str),
+                signatures=self.signatures[live],
+                params=np.array([NUM_PERM, BANDS, SHINGLE_WORDS], dtype=np.int64),
+            )
+            self._removed.clear()
+            self.dirty = False
+            self.saved_at = time.monotonic()
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "EssayIndex":
+        index = cls()
+        with np.load(path) as data:
+            if list(data["params"]) != [NUM_PERM, BANDS, SHINGLE_WORDS]:
+                logger.info("Essay index at %s was built with other parameters; starting empty", path)
+                return index
+            index.keys = data["keys"].tolist()
+            index.question_ids = data["question_ids"].tolist()
+            index.evaluation_ids = data["evaluation_ids"].tolist()
+            index.user_ids = data["user_ids"].tolist()
+            index.signatures = data["signatures"].astype(np.uint32)
+        index._pos = {key: pos for pos, key in enumerate(index.keys)}
+        for pos, (qid, hashes) in enumerate(zip(index.question_ids, band_hashes(index.signatures).tolist())):
+            index._bucket(pos, qid, hashes)
+        return index
+
+
+_index: EssayIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> EssayIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = EssayIndex()
+                if ESSAY_INDEX_PATH and os.path.exists(ESSAY_INDEX_PATH):
+                    try:
+                        index = EssayIndex.load(ESSAY_INDEX_PATH)
+                    except Exception:
+                        logger.exception("Could not load essay index from %s; starting empty", ESSAY_INDEX_PATH)
+                _index = index
+    return _index
+
+
+def save() -> None:
+    """
+    Save the index if it changed since the last save (also run at exit).
+    """
+    index = _index
+    if not ESSAY_INDEX_PATH or index is None or not index.dirty:
+        return
+    try:
+        index.save(ESSAY_INDEX_PATH)
+    except Exception:
+        logger.exception("Could not save essay index to %s", ESSAY_INDEX_PATH)
+
+
+atexit.register(save)
+
+
+def record(question_id: str, key: str, text: str, evaluation_id: str, user_id: str) -> None:
+    """
+    Add an evaluated answer to the index, saving it at most every
+    ESSAY_INDEX_SAVE_SECONDS (and at exit).
+    """
+    index = get_index()
+    if not index.add(question_id, key, text, evaluation_id, user_id):
+        return
+    if time.monotonic() - index.saved_at >= ESSAY_INDEX_SAVE_SECONDS:
+        save()
+
+
+def _mode(key: str) -> str:
+    # Keys are "<mode>:<answer id>".
+    return key.split(":", 1)[0]
+
+
+def evaluation_columns(sb, question_id: str, key: str, text: str, user_id: str, evaluate) -> dict:
+    """
+    `writing_evaluations` columns for an answer: copied from the same user's
+    near-identical evaluated answer in the same mode (>= REUSE_SIMILARITY),
+    otherwise from `evaluate()`; plus the duplicate link to the best match
+    reaching DUPLICATE_SIMILARITY whose evaluation still exists.
+    """
+    index = get_index()
+    matches = [m for m in index.matches(question_id, text, exclude_key=key) if m.similarity >= DUPLICATE_SIMILARITY]
+    if not matches:
+        return writing_eval_columns(evaluate())
+
+    columns = writing_eval_columns({})
+    rows = {
+        r["id"]: r
+        for r in (
+            sb.table("writing_evaluations")
+            .select(",".join(["id", *columns]))
+            .in_("id", [m.evaluation_id for m in matches])
+            .execute()
+            .data
+            or []
+        )
+    }
+    # Evaluations archived (or deleted) since they were indexed can no longer
+    # be linked to (the column is a foreign key) or copied: forget them.
+    for m in matches:
+        if m.evaluation_id not in rows:
+            index.remove(m.key)
+            metrics.incr("essays.evicted")
+    matches = [m for m in matches if m.evaluation_id in rows]
+    if not matches:
+        return writing_eval_columns(evaluate())
+
+    best = matches[0]
+    duplicate = {"duplicate_of_evaluation_id": best.evaluation_id, "duplicate_similarity": round(best.similarity, 3)}
+    metrics.incr("essays.near_duplicates")
+    if best.user_id != user_id:
+        metrics.incr("essays.cross_user_duplicates")
+        logger.info("Answer %s matches %s of another user (similarity %.2f)", key, best.key, best.similarity)
+
+    # Only the user's own evaluation from the same mode is reused: another
+    # user's was written for their answer and target band, and exam answers
+    # are graded by the exam-tier model.
+    reusable = next(
+        (
+            m
+            for m in matches
+            if m.similarity >= REUSE_SIMILARITY and m.user_id == user_id and _mode(m.key) == _mode(key)
+        ),
+        None,
+    )
+    if reusable is not None:
+        metrics.incr("essays.reused_evaluations")
+        return {**{c: rows[reusable.evaluation_id].get(c) for c in columns}, **duplicate}
+    return {**writing_eval_columns(evaluate()), **duplicate}
+
+
+def insert_evaluations(sb, rows: list[dict]) -> list[dict]:
+    """
+    Insert `writing_evaluations` rows. If a linked evaluation was archived
+    between the lookup and the insert (foreign key violation), insert them
+    again without the duplicate links rather than lose the evaluations.
+    """
+    from postgrest.exceptions import APIError  # lazy: heavy import
+
+    try:
+        return sb.table("writing_evaluations").insert(rows).execute().data or []
+    except APIError as e:
+        if getattr(e, "code", None) != "23503" or not any(r.get("duplicate_of_evaluation_id") for r in rows):
+            raise
+    metrics.incr("essays.stale_duplicate_links")
+    unlinked = [{**r, "duplicate_of_evaluation_id": None, "duplicate_similarity": None} for r in rows]
+    return sb.table("writing_evaluations").insert(unlinked).execute().data or []
@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from flask import abort, jsonify, request
+
+import admission
+import metrics
+from supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+# Pub/sub for evaluation status updates, delivered to clients over
+# Server-Sent Events (see routes/events.py). Events are stored in the
+# evaluation_events outbox (migrations/0008_evaluation_events.sql), whose id
+# is the SSE event id; each worker process pushes the events it publishes to
+# its own subscribers at once and polls the outbox for the ones published
+# by other workers. Channels are per user; each subscriber has a bounded
+# buffer so a slow client can never grow memory.
+EVENTS_TABLE = "evaluation_events"
+SUBSCRIBER_BUFFER = int(os.getenv("EVENTS_SUBSCRIBER_BUFFER", "64"))
+# Events replayed to a reconnecting client (Last-Event-ID) at most.
+REPLAY_BUFFER = int(os.getenv("EVENTS_REPLAY_BUFFER", "20"))
+POLL_SECONDS = float(os.getenv("EVENTS_POLL_SECONDS", "1"))
+# Ids are taken before commit, so an event can become visible after a
+# higher one: each poll re-reads this much history and skips what it has
+# already delivered.
+POLL_OVERLAP_SECONDS = float(os.getenv("EVENTS_POLL_OVERLAP_SECONDS", "10"))
+# Subscribed users per outbox query (ids travel in the URL).
+POLL_USERS_PER_QUERY = 200
+RETENTION_SECONDS = int(os.getenv("EVENTS_RETENTION_SECONDS", "86400"))
+PRUNE_EVERY_SECONDS = 600
+# Background workers for evaluations requested with `?async=1`, sized like
+# the "ai" admission class: the 202 releases the request's ai slot, so this
+# pool is what bounds concurrent async model calls.
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", str(admission.CLASSES["ai"].limit or 4)))
+# Async evaluations waiting for a worker; beyond this they are shed with 503
+# like requests over the ai class queue.
+EVAL_QUEUE = int(os.getenv("EVAL_QUEUE", str(2 * EVAL_WORKERS)))
+
+_lock = threading.Lock()
+_subscribers: dict[str, set["Subscriber"]] = {}
+# Outbox ids already pushed to this process's subscribers -> when.
+_delivered: OrderedDict[int, float] = OrderedDict()
+_poller: threading.Thread | None = None
+_eval_pool = ThreadPoolExecutor(max_workers=EVAL_WORKERS, thread_name_prefix="eval")
+# Async evaluations queued or running on _eval_pool.
+_eval_pending = 0
+
+
+class Subscriber:
+    def __init__(self, user_id: str, maxlen: int = SUBSCRIBER_BUFFER):
+        self.user_id = user_id
+        self.dropped = 0
+        # Outbox ids sent as Last-Event-ID replay; the poller may still
+        # deliver them live.
+        self.replayed: set[int] = set()
+        self._buffer: deque = deque()
+        self._maxlen = maxlen
+        self._cond = threading.Condition()
+
+    def push(self, event: dict) -> None:
+        with self._cond:
+            if len(self._buffer) >= self._maxlen:
+                self._buffer.popleft()
+                self.dropped += 1
+                metrics.incr("events.dropped")
+            self._buffer.append(event)
+            self._cond.notify()
+
+    def get(self, timeout: float) -> dict | None:
+        with self._cond:
+            if not self._buffer:
+                self._cond.wait(timeout)
+            return self._buffer.popleft() if self._buffer else None
+
+
+def subscribe(user_id: str, last_event_id: int | None = None) -> Subscriber:
+    _start_poller()
+    sub = Subscriber(user_id)
+    with _lock:
+        _subscribers.setdefault(user_id, set()).add(sub)
+    if last_event_id is not None:
+        for event in _replay(user_id, last_event_id):
+            sub.replayed.add(event["id"])
+            sub.push(event)
+    return sub
+
+
+def unsubscribe(sub: Subscriber) -> None:
+    with _lock:
+        subs = _subscribers.get(sub.user_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del _subscribers[sub.user_id]
+
+
+def _event(row: dict) -> dict:
+    return {"id": row["id"], "type": row["type"], "data": row["data"]}
+
+
+def events_after(user_id: str, last_event_id: int, limit: int = REPLAY_BUFFER) -> list[dict]:
+    """
+    The user's stored events with an id above `last_event_id`, oldest first,
+    each with its `created_at`.
+    """
+    rows = (
+        get_supabase()
+        .table(EVENTS_TABLE)
+        .select("id,type,data,created_at")
+        .eq("user_id", user_id)
+        .gt("id", last_event_id)
+        .order("id")
+        .limit(limit)
+        .execute()
+        .data
+        or []
+    )
+    return [{**_event(r), "created_at": r["created_at"]} for r in rows]
+
+
+def _replay(user_id: str, last_event_id: int) -> list[dict]:
+    try:
+        return [_event(e) for e in events_after(user_id, last_event_id)]
+    except Exception:
+        logger.exception("Could not replay events for %s", user_id)
+        return []
+
+
+def _deliver(user_id: str, event: dict) -> None:
+    """
+    Push an event to this process's subscribers, once per outbox id.
+    """
+    with _lock:
+        if event["id"] is not None:
+            if event["id"] in _delivered:
+                return
+            _delivered[event["id"]] = time.monotonic()
+        subs = list(_subscribers.get(user_id, ()))
+    for sub in subs:
+        if event["id"] not in sub.replayed:
+            sub.push(event)
+
+
+def publish(user_id: str, event_type: str, data: dict) -> None:
+    _start_poller()
+    try:
+        rows = (
+            get_supabase()
+            .table(EVENTS_TABLE)
+            .insert({"user_id": user_id, "type": event_type, "data": data})
+            .execute()
+            .data
+        )
+        event_id = rows[0]["id"]
+    except Exception:
+        # Still reaches this worker's streams, just without an id to resume
+        # from; never fail the evaluation over its status event.
+        logger.exception("Could not store %s event for %s", event_type, user_id)
+        metrics.incr("events.store_failures")
+        event_id = None
+    _deliver(user_id, {"id": event_id, "type": event_type, "data": data})
+    metrics.incr("events.published")
+
+
+def _poll_once(since: datetime) -> None:
+    with _lock:
+        users = list(_subscribers)
+        cutoff = time.monotonic() - 2 * POLL_OVERLAP_SECONDS
+        while _delivered and next(iter(_delivered.values())) < cutoff:
+            _delivered.popitem(last=False)
+    sb = get_supabase()
+    for i in range(0, len(users), POLL_USERS_PER_QUERY):
+        rows = (
+            sb.table(EVENTS_TABLE)
+            .select("id,user_id,type,data")
+            .in_("user_id", users[i : i + POLL_USERS_PER_QUERY])
+            .gte("created_at", since.isoformat())
+            .order("id")
+            .execute()
+            .data
+            or []
+        )
+        for row in rows:
+            _deliver(row["user_id"], _event(row))
+
+
+def _prune() -> None:
+    before = datetime.now(timezone.utc) - timedelta(seconds=RETENTION_SECONDS)
+    get_supabase().table(EVENTS_TABLE).delete().lt("created_at", before.isoformat()).execute()
+
+
+def _poll_forever() -> None:
+    last_prune = 0.0
+    while True:
+        time.sleep(POLL_SECONDS)
+        try:
+            if _subscribers:
+                _poll_once(datetime.now(timezone.utc) - timedelta(seconds=POLL_OVERLAP_SECONDS))
+            if time.monotonic() - last_prune >= PRUNE_EVERY_SECONDS:
+                last_prune = time.monotonic()
+                _prune()
+        except Exception:
+            metrics.incr("events.poll_failures")
+            logger.exception("Polling %s failed", EVENTS_TABLE)
+
+
+def _start_poller() -> None:
+    global _poller
+    with _lock:
+        if _poller is None:
+            _poller = threading.Thread(target=_poll_forever, name="events-poller", daemon=True)
+            _poller.start()
+
+
+def wants_async() -> bool:
+    """
+    Client asked to get 202 now and the result over SSE.
+    """
+    return request.args.get("async") == "1" or "respond-async" in (request.headers.get("Prefer") or "")
+
+
+def _status(user_id: str, kind: str, ref_id: str, session_id: str | None, status: str, **extra) -> None:
+    publish(
+        user_id,
+        "evaluation",
+        {"kind": kind, "ref_id": ref_id, "session_id": session_id, "status": status, **extra},
+    )
+
+
+def run_evaluation(
+    user_id: str,
+    kind: str,
+    ref_id: str,
+    session_id: str | None,
+    work: Callable[[], dict],
+) -> dict:
+    """
+    Run `work` (model call + insert, returning the stored row) and publish
+    running/completed/failed transitions for it.
+    """
+    _status(user_id, kind, ref_id, session_id, "running")
+    try:
+        row = work()
+    except Exception:
+        # Exception text can carry SDK / PostgREST internals; clients get a
+        # stable code, the caller logs the exception.
+        _status(user_id, kind, ref_id, session_id, "failed", error="evaluation_failed")
+        raise
+    _status(user_id, kind, ref_id, session_id, "completed", result=row)
+    return row
+
+
+def submit_evaluation(
+    user_id: str,
+    kind: str,
+    ref_id: str,
+    session_id: str | None,
+    work: Callable[[], dict],
+) -> dict:
+    """
+    Queue `work` on the evaluation pool, freeing the request thread; the
+    outcome is pushed to the user's event stream. Returns the 202 body, or
+    aborts with 503 + Retry-After when the pool's queue is full.
+    """
+    global _eval_pending
+    with _lock:
+        full = _eval_pending >= EVAL_WORKERS + EVAL_QUEUE
+        if not full:
+            _eval_pending += 1
+    if full:
+        metrics.incr("events.async_shed")
+        resp = jsonify({"error": "Server busy, retry shortly"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(admission.CLASSES["ai"].retry_after)
+        abort(resp)
+    _status(user_id, kind, ref_id, session_id, "queued")
+
+    def _run():
+        global _eval_pending
+        try:
+            run_evaluation(user_id, kind, ref_id, session_id, work)
+        except Exception:
+            logger.exception("Background %s evaluation failed for %s", kind, ref_id)
+        finally:
+            with _lock:
+                _eval_pending -= 1
+
+    _eval_pool.submit(_run)
+    return {"status": "queued", "kind": kind, "ref_id": ref_id, "session_id": session_id}
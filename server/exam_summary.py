@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from typing import Iterator
+
+from models import ExamAnswer, SpeakingEvaluation, WritingEvaluation
+import catalog
+
+
+def iter_exam_sections(sb, exam_id: str) -> Iterator[dict]:
+    """
+    Yield the results summary of each section of an exam session: answers
+    (with options and correct answers), writing evaluations and speaking
+    attempts with their evaluations. Sections are produced one at a time so
+    callers can stream them without holding the whole exam in memory.
+    """
+    # Build section summaries
+    sections = (
+        sb.table("exam_section_results")
+        .select("id,skill_id,time_taken_seconds,total_questions,correct_questions,score")
+        .eq("exam_session_id", exam_id)
+        .execute()
+        .data
+        or []
+    )
+
+    for s in sections:
+        # skill slug
+        skill = (
+            sb.table("skills")
+            .select("slug")
+            .eq("id", s["skill_id"])
+            .single()
+            .execute()
+            .data
+        )
+
+        # raw answers for this section
+        answers = ExamAnswer.from_rows(
+            sb.table("exam_answers")
+            .select("id,question_id,option_id,answer_text,is_correct")
+            .eq("section_result_id", s["id"])
+            .execute()
+            .data
+            or []
+        )
+
+        writing_evals = WritingEvaluation.from_rows(
+            sb.table("writing_evaluations")
+            .select("*")
+            .eq("exam_section_result_id", s["id"])
+            .execute()
+            .data
+            or []
+        )
+        writing_by_answer = {w.exam_answer_id: w for w in writing_evals if w.exam_answer_id}
+
+        # questions + options for every answered question, in one lookup
+        questions = catalog.questions_by_id(a.question_id for a in answers)
+
+        answer_dicts = []
+        for a in answers:
+            q = questions.get(a.question_id)
+            user_option = q.option(a.option_id) if q else None
+            correct_opt = q.correct_option if q else None
+            correct_text = correct_opt.text if correct_opt else None
+            w_eval = writing_by_answer.get(a.id)
+
+            # option_id / answer id are not exposed to the client
+            answer_dicts.append(
+                {
+                    "question_id": a.question_id,
+                    "answer_text": a.answer_text,
+                    "is_correct": a.is_correct,
+                    "prompt": q.prompt if q else None,
+                    "user_answer": user_option.text if user_option else a.answer_text,
+                    "correct_option_text": correct_text,
+                    "correct_answer": correct_text,  # alias for frontend
+                    "options": [o.to_dict(include_correct=True) for o in q.options] if q else [],
+                    "writing_eval": w_eval.to_dict() if w_eval else None,
+                }
+            )
+
+        # speaking attempts (if any) tied to this section
+        speaking_attempts = (
+            sb.table("speaking_attempts")
+            .select("id,audio_path,duration_seconds,question_id")
+            .eq("exam_section_result_id", s["id"])
+            .execute()
+            .data
+            or []
+        )
+        attempt_ids = [a["id"] for a in speaking_attempts]
+        speaking_evals = SpeakingEvaluation.from_rows(
+            sb.table("speaking_evaluations")
+            .select("*")
+            .in_("attempt_id", attempt_ids or [""])
+            .execute()
+            .data
+            or []
+        )
+        eval_by_attempt = {e.attempt_id: e for e in speaking_evals}
+        speaking_questions = catalog.questions_by_id(at.get("question_id") for at in speaking_attempts)
+
+        speaking_summary = []
+        for at in speaking_attempts:
+            ev = eval_by_attempt.get(at["id"])
+            sq = speaking_questions.get(at.get("question_id"))
+            speaking_summary.append(
+                {
+                    **at,
+                    "question_prompt": sq.prompt if sq else None,
+                    "evaluation": ev.to_dict() if ev else None,
+                }
+            )
+
+        yield {
+            "section_result_id": s["id"],
+            "skill_slug": skill["slug"],
+            "time_taken_seconds": s.get("time_taken_seconds"),
+            "total_questions": s.get("total_questions"),
+            "correct_questions": s.get("correct_questions"),
+            "score": s.get("score"),
+            "answers": answer_dicts,
+            "writing_evaluations": [w.to_dict() for w in writing_evals],
+            "speaking_attempts": speaking_summary,
+        }
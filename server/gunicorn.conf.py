@@ -0,0 +1,18 @@
+"""
+Gunicorn settings, picked up by `gunicorn app:app` run from this directory.
+
+The admission caps (admission.py) are shares of the request threads per
+worker, so `threads` must come from the same WEB_THREADS variable; pass
+`--threads` on the command line only together with a matching WEB_THREADS.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# gthread: one thread per in-flight request, including open SSE streams
+# (routes/events.py). With `-k gevent` streams are cheap; raise
+# ADMISSION_STREAM_LIMIT to match.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("WEB_THREADS", "16"))
+# Model calls and streamed exam summaries routinely run past the 30s default.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, g, jsonify, make_response, request
+
+import metrics
+
+# Recent `Idempotency-Key`s and the responses they produced. Mobile clients
+# retry on flaky networks; replaying the stored response avoids duplicate rows
+# and, for evaluations, a second paid model call.
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# Optional SQLite file so stored responses survive a worker restart and are
+# shared between workers on one host.
+IDEMPOTENCY_DB_PATH = os.getenv("IDEMPOTENCY_DB_PATH")
+# How long a duplicate waits for the original in-flight request to finish.
+# Duplicates of requests in a capped admission class ("ai", "heavy") do not
+# wait: they would hold one of the class's few slots doing nothing, so a
+# burst of client retries could fill the class. They get 409 + Retry-After.
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "120"))
+
+
+class _Stored:
+    __slots__ = ("fingerprint", "status", "body", "content_type", "created_at")
+
+    def __init__(self, fingerprint: str, status: int, body: bytes, content_type: str, created_at: float):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.created_at = created_at
+
+
+class IdempotencyStore:
+    """
+    Bounded LRU of key -> stored response, optionally backed by SQLite, plus
+    an in-flight table so concurrent duplicates wait for the first request.
+    """
+
+    def __init__(self, max_keys: int, ttl: float, db_path: str | None = None):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._lru: OrderedDict[str, _Stored] = OrderedDict()
+        self._inflight: dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+                " key TEXT PRIMARY KEY, fingerprint TEXT, status INTEGER,"
+                " body BLOB, content_type TEXT, created_at REAL)"
+            )
+
+    def get(self, key: str) -> _Stored | None:
+        now = time.time()
+        with self._lock:
+            stored = self._lru.get(key)
+            if stored is not None:
+                if now - stored.created_at > self.ttl:
+                    del self._lru[key]
+                    return None
+                self._lru.move_to_end(key)
+                return stored
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT fingerprint, status, body, content_type, created_at FROM idempotency_keys WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None or now - row[4] > self.ttl:
+            return None
+        stored = _Stored(row[0], row[1], bytes(row[2]), row[3], row[4])
+        self._remember(key, stored)
+        return stored
+
+    def put(self, key: str, stored: _Stored) -> None:
+        self._remember(key, stored)
+        if self._db is not None:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO idempotency_keys VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, stored.fingerprint, stored.status, stored.body, stored.content_type, stored.created_at),
+                )
+                self._db.execute(
+                    "DELETE FROM idempotency_keys WHERE created_at < ?", (time.time() - self.ttl,)
+                )
+
+    def _remember(self, key: str, stored: _Stored) -> None:
+        with self._lock:
+            self._lru[key] = stored
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_keys:
+                self._lru.popitem(last=False)
+
+    def begin(self, key: str) -> threading.Event | None:
+        """
+        Claim `key` for execution. Returns None if this caller should run the
+        request, or the Event of the request already running it.
+        """
+        with self._lock:
+            event = self._inflight.get(key)
+            if event is not None:
+                return event
+            self._inflight[key] = threading.Event()
+            return None
+
+    def finish(self, key: str) -> None:
+        with self._lock:
+            event = self._inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+store = IdempotencyStore(IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_DB_PATH)
+
+
+def _replay(stored: _Stored) -> Response:
+    resp = Response(stored.body, status=stored.status, content_type=stored.content_type)
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def idempotent(view):
+    """
+    Honour an `Idempotency-Key` header on a POST view: the first request runs,
+    later requests with the same key (same user, route and body) get the stored
+    response replayed, and duplicates arriving while it runs wait for it (or
+    get 409 at once in a capped admission class). Server errors are not
+    stored, so a retry after a 5xx runs again.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        raw_key = request.headers.get("Idempotency-Key")
+        if not raw_key:
+            return view(*args, **kwargs)
+
+        key = f"{request.headers.get('X-User-Id', '')}:{request.method}:{request.path}:{raw_key}"
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        while True:
+            stored = store.get(key)
+            if stored is not None:
+                if stored.fingerprint != fingerprint:
+                    return jsonify({"error": "Idempotency-Key reused with a different request body"}), 422
+                metrics.incr("idempotency.replayed")
+                return _replay(stored)
+            running = store.begin(key)
+            if running is None:
+                if store.get(key) is not None:
+                    # Finished between our lookup and the claim; replay it.
+                    store.finish(key)
+                    continue
+                break
+            admitted = g.get("admission")
+            if admitted is not None and admitted[0].limit:
+                metrics.incr("idempotency.in_progress")
+                resp = jsonify({"error": "A request with this Idempotency-Key is still in progress"})
+                resp.status_code = 409
+                resp.headers["Retry-After"] = str(admitted[0].retry_after)
+                return resp
+            metrics.incr("idempotency.waited")
+            if not running.wait(IDEMPOTENCY_WAIT_SECONDS):
+                return jsonify({"error": "A request with this Idempotency-Key is still in progress"}), 409
+            # The original finished: loop to replay it (or run, if it failed).
+
+        try:
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code < 500 and not resp.is_streamed:
+                store.put(
+                    key,
+                    _Stored(fingerprint, resp.status_code, resp.get_data(), resp.content_type, time.time()),
+                )
+            return resp
+        finally:
+            store.finish(key)
+
+    return wrapper
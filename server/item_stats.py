@@ -0,0 +1,189 @@
+"""
+Per-question item analytics: correctness rate and per-option pick counts
+across all practice and exam answers.
+
+Answers are streamed in (answered_at, id) keyset pages; each page is folded
+into small per-question deltas and merged, together with the new checkpoint,
+by the `apply_question_item_stats` database function (see
+migrations/0002_question_item_stats.sql). Memory is bounded by the page size
+and an interrupted run resumes from the last committed page.
+
+    cd server && python item_stats.py [--batch-size 5000] [--max-batches N]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import time
+from collections import Counter
+
+import catalog
+import metrics
+from supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+STATS_TABLE = "question_item_stats"
+CHECKPOINT_TABLE = "question_item_stats_checkpoints"
+SOURCES = ("practice_answers", "exam_answers")
+BATCH_SIZE = int(os.getenv("ITEM_STATS_BATCH_SIZE", "5000"))
+CACHE_TTL_SECONDS = int(os.getenv("ITEM_STATS_CACHE_TTL_SECONDS", "600"))
+
+_cache = catalog.TTLCache(CACHE_TTL_SECONDS)
+
+
+def _checkpoint(sb, source: str) -> tuple[str, str] | None:
+    rows = (
+        sb.table(CHECKPOINT_TABLE)
+        .select("last_answered_at,last_id")
+        .eq("source", source)
+        .execute()
+        .data
+        or []
+    )
+    return (rows[0]["last_answered_at"], rows[0]["last_id"]) if rows else None
+
+
+def _page(sb, source: str, after: tuple[str, str] | None, limit: int) -> list[dict]:
+    query = sb.table(source).select("id,question_id,option_id,is_correct,answered_at")
+    if after is not None:
+        at, last_id = after
+        query = query.or_(f'answered_at.gt."{at}",and(answered_at.eq."{at}",id.gt.{last_id})')
+    else:
+        query = query.not_.is_("answered_at", "null")
+    return query.order("answered_at").order("id").limit(limit).execute().data or []
+
+
+def _deltas(rows: list[dict]) -> list[dict]:
+    attempts: Counter = Counter()
+    graded: Counter = Counter()
+    correct: Counter = Counter()
+    picks: dict[str, Counter] = {}
+    for row in rows:
+        qid = row.get("question_id")
+        if not qid:
+            continue
+        attempts[qid] += 1
+        if row.get("is_correct") is not None:
+            graded[qid] += 1
+            if row["is_correct"]:
+                correct[qid] += 1
+        if row.get("option_id"):
+            picks.setdefault(qid, Counter())[row["option_id"]] += 1
+    return [
+        {
+            "question_id": qid,
+            "attempts": n,
+            "graded": graded[qid],
+            "correct": correct[qid],
+            "option_counts": dict(picks.get(qid, {})),
+        }
+        for qid, n in attempts.items()
+    ]
+
+
+def run_source(sb, source: str, batch_size: int = BATCH_SIZE, max_batches: int | None = None) -> int:
+    """
+    Process `source` from its checkpoint to the end (or `max_batches`
+    pages). Returns the number of answer rows processed.
+    """
+    after = _checkpoint(sb, source)
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = _page(sb, source, after, batch_size)
+        if not rows:
+            break
+        last = rows[-1]
+        after = (last["answered_at"], last["id"])
+        sb.rpc(
+            "apply_question_item_stats",
+            {
+                "p_source": source,
+                "p_last_answered_at": last["answered_at"],
+                "p_last_id": last["id"],
+                "p_rows_processed": len(rows),
+                "p_deltas": _deltas(rows),
+            },
+        ).execute()
+        processed += len(rows)
+        batches += 1
+        metrics.incr(f"item_stats.{source}.rows", len(rows))
+        if len(rows) < batch_size:
+            break
+    return processed
+
+
+def run(batch_size: int = BATCH_SIZE, max_batches: int | None = None) -> dict[str, int]:
+    sb = get_supabase()
+    started = time.monotonic()
+    processed = {source: run_source(sb, source, batch_size, max_batches) for source in SOURCES}
+    logger.info("Item stats updated %s in %.1f s", processed, time.monotonic() - started)
+    if any(processed.values()):
+        _cache.invalidate()
+    return processed
+
+
+def _load_practice_set_stats(ps_id: str) -> list[dict] | None:
+    questions = catalog.practice_set_questions(ps_id)
+    if questions is None:
+        return None
+    ids = [q.id for q in questions]
+    rows = (
+        get_supabase()
+        .table(STATS_TABLE)
+        .select("question_id,attempts,graded,correct,option_counts,updated_at")
+        .in_("question_id", ids if ids else ["_none_"])
+        .execute()
+        .data
+        or []
+    )
+    by_id = {r["question_id"]: r for r in rows}
+
+    out = []
+    for q in questions:
+        row = by_id.get(q.id) or {}
+        option_counts = row.get("option_counts") or {}
+        picked = sum(option_counts.values())
+        out.append(
+            {
+                "question_id": q.id,
+                "order_index": q.order_index,
+                "attempts": row.get("attempts", 0),
+                "graded": row.get("graded", 0),
+                "correct_rate": round(row["correct"] / row["graded"], 4) if row.get("graded") else None,
+                "options": [
+                    {
+                        "option_id": o.id,
+                        "option_index": o.option_index,
+                        "picks": option_counts.get(o.id, 0),
+                        "pick_rate": round(option_counts.get(o.id, 0) / picked, 4) if picked else None,
+                    }
+                    for o in q.options
+                ],
+                "updated_at": row.get("updated_at"),
+            }
+        )
+    return out
+
+
+def practice_set_stats(ps_id: str) -> list[dict] | None:
+    """
+    Cached item stats for every question of a practice set, in question
+    order. None if the practice set does not exist.
+    """
+    return _cache.get_or_load(ps_id, lambda: _load_practice_set_stats(ps_id))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(run(args.batch_size, args.max_batches))
+
+
+if __name__ == "__main__":
+    main()
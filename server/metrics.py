@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+
+# Samples kept per timer; enough for a stable p95 without unbounded growth.
+_TIMER_WINDOW = 1024
+
+_lock = threading.Lock()
+_counters: dict[str, int] = {}
+_timers: dict[str, deque] = {}
+_ratios: dict[str, tuple[str, str]] = {}
+
+
+def incr(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name: str, value: float) -> None:
+    """
+    Record one sample (e.g. a latency in milliseconds) for `name`.
+    """
+    with _lock:
+        window = _timers.get(name)
+        if window is None:
+            window = _timers[name] = deque(maxlen=_TIMER_WINDOW)
+        window.append(value)
+
+
+def register_ratio(name: str, numerator: str, denominator: str) -> None:
+    """
+    Expose `numerator / denominator` (two counters) as a derived metric.
+    """
+    with _lock:
+        _ratios[name] = (numerator, denominator)
+
+
+def counter(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def percentile(name: str, pct: float) -> float | None:
+    with _lock:
+        samples = sorted(_timers.get(name) or ())
+    if not samples:
+        return None
+    idx = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+    return samples[idx]
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(_counters)
+        timers = {k: sorted(v) for k, v in _timers.items()}
+        ratios = dict(_ratios)
+
+    out_timers = {}
+    for name, samples in timers.items():
+        if not samples:
+            continue
+        out_timers[name] = {
+            "count": len(samples),
+            "avg": sum(samples) / len(samples),
+            "p50": samples[len(samples) // 2],
+            "p95": samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+            "max": samples[-1],
+        }
+    out_ratios = {}
+    for name, (num, den) in ratios.items():
+        d = counters.get(den, 0)
+        out_ratios[name] = (counters.get(num, 0) / d) if d else 0.0
+    return {"counters": counters, "timers": out_timers, "ratios": out_ratios}
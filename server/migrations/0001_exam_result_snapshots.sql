@@ -0,0 +1,14 @@
+-- Completed exam summaries, serialized once by POST /api/exam-sessions/<id>/complete
+-- and served by GET /api/exam-sessions/<id>/result.
+-- payload_gz_b64: base64 of the gzip-compressed JSON summary.
+
+create table if not exists public.exam_result_snapshots (
+    exam_session_id uuid primary key references public.exam_sessions(id) on delete cascade,
+    user_id uuid not null,
+    payload_gz_b64 text not null,
+    payload_bytes integer not null,
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists exam_result_snapshots_user_id_idx
+    on public.exam_result_snapshots (user_id);
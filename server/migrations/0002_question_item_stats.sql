@@ -0,0 +1,84 @@
+-- Per-question item analytics, filled by `python item_stats.py` and served by
+-- GET /api/practice-sets/<id>/item-stats.
+-- graded: answers with a non-null is_correct (objective questions).
+-- option_counts: {"<option_id>": picks, ...} across all answers.
+
+create table if not exists public.question_item_stats (
+    question_id uuid primary key references public.questions(id) on delete cascade,
+    attempts bigint not null default 0,
+    graded bigint not null default 0,
+    correct bigint not null default 0,
+    option_counts jsonb not null default '{}'::jsonb,
+    updated_at timestamptz not null default now()
+);
+
+-- Keyset position reached in each answer table; the pipeline resumes here.
+create table if not exists public.question_item_stats_checkpoints (
+    source text primary key,
+    last_answered_at timestamptz not null,
+    last_id uuid not null,
+    rows_processed bigint not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+-- Merge one chunk of deltas and advance the checkpoint in a single
+-- transaction, so a crashed run never double-counts when it resumes.
+-- p_deltas: [{"question_id", "attempts", "graded", "correct", "option_counts"}, ...]
+create or replace function public.apply_question_item_stats(
+    p_source text,
+    p_last_answered_at timestamptz,
+    p_last_id uuid,
+    p_rows_processed bigint,
+    p_deltas jsonb
+) returns void
+language plpgsql
+as $$
+declare
+    d jsonb;
+begin
+    for d in select value from jsonb_array_elements(p_deltas) loop
+        insert into public.question_item_stats as s
+            (question_id, attempts, graded, correct, option_counts, updated_at)
+        values (
+            (d->>'question_id')::uuid,
+            (d->>'attempts')::bigint,
+            (d->>'graded')::bigint,
+            (d->>'correct')::bigint,
+            coalesce(d->'option_counts', '{}'::jsonb),
+            now()
+        )
+        on conflict (question_id) do update set
+            attempts = s.attempts + excluded.attempts,
+            graded = s.graded + excluded.graded,
+            correct = s.correct + excluded.correct,
+            option_counts = (
+                select coalesce(jsonb_object_agg(key, total), '{}'::jsonb)
+                from (
+                    select key, sum(value::bigint) as total
+                    from (
+                        select * from jsonb_each_text(s.option_counts)
+                        union all
+                        select * from jsonb_each_text(excluded.option_counts)
+                    ) merged
+                    group by key
+                ) summed
+            ),
+            updated_at = now();
+    end loop;
+
+    insert into public.question_item_stats_checkpoints
+        (source, last_answered_at, last_id, rows_processed, updated_at)
+    values (p_source, p_last_answered_at, p_last_id, p_rows_processed, now())
+    on conflict (source) do update set
+        last_answered_at = excluded.last_answered_at,
+        last_id = excluded.last_id,
+        rows_processed = question_item_stats_checkpoints.rows_processed + excluded.rows_processed,
+        updated_at = now();
+end;
+$$;
+
+-- The pipeline pages each answer table by (answered_at, id).
+create index if not exists practice_answers_answered_at_id_idx
+    on public.practice_answers (answered_at, id);
+create index if not exists exam_answers_answered_at_id_idx
+    on public.exam_answers (answered_at, id);
@@ -0,0 +1,115 @@
+-- Catalog version stamps for GET /api/catalog/changes?since=<version>.
+-- One global, monotonic sequence: every publish/edit of a skill or practice
+-- set (or of a set's questions, options or tracks) stamps the row with the
+-- next value, so "everything after version N" is a single range query.
+
+create sequence if not exists public.catalog_version_seq;
+
+alter table public.skills
+    add column if not exists catalog_version bigint not null default nextval('public.catalog_version_seq');
+alter table public.practice_sets
+    add column if not exists catalog_version bigint not null default nextval('public.catalog_version_seq');
+
+create index if not exists skills_catalog_version_idx on public.skills (catalog_version);
+create index if not exists practice_sets_catalog_version_idx on public.practice_sets (catalog_version);
+
+-- Hard-deleted skills / practice sets (deactivated sets are reported from
+-- practice_sets.is_active instead).
+create table if not exists public.catalog_tombstones (
+    kind text not null,
+    id uuid not null,
+    catalog_version bigint not null default nextval('public.catalog_version_seq'),
+    deleted_at timestamptz not null default now(),
+    primary key (kind, id)
+);
+
+create index if not exists catalog_tombstones_catalog_version_idx on public.catalog_tombstones (catalog_version);
+
+create or replace function public.catalog_stamp_version() returns trigger
+language plpgsql
+as $$
+begin
+    new.catalog_version := nextval('public.catalog_version_seq');
+    return new;
+end;
+$$;
+
+create or replace function public.catalog_record_tombstone() returns trigger
+language plpgsql
+as $$
+begin
+    insert into public.catalog_tombstones (kind, id)
+    values (tg_argv[0], old.id)
+    on conflict (kind, id) do update
+        set catalog_version = nextval('public.catalog_version_seq'), deleted_at = now();
+    return old;
+end;
+$$;
+
+-- Question / option / track edits bump the owning practice set (which the
+-- practice_sets trigger then stamps).
+create or replace function public.catalog_bump_practice_set() returns trigger
+language plpgsql
+as $$
+declare
+    row_data jsonb;
+    old_data jsonb;
+    ps_id uuid;
+begin
+    row_data := to_jsonb(case when tg_op = 'DELETE' then old else new end);
+    if tg_table_name = 'question_options' then
+        select q.practice_set_id into ps_id
+        from public.questions q
+        where q.id = (row_data->>'question_id')::uuid;
+    else
+        ps_id := (row_data->>'practice_set_id')::uuid;
+    end if;
+    if ps_id is not null then
+        update public.practice_sets set catalog_version = 0 where id = ps_id;
+    end if;
+    -- A question / track moved to another set changes the old set too.
+    if tg_op = 'UPDATE' and tg_table_name <> 'question_options' then
+        old_data := to_jsonb(old);
+        if (old_data->>'practice_set_id') is distinct from (row_data->>'practice_set_id') then
+            update public.practice_sets set catalog_version = 0
+            where id = (old_data->>'practice_set_id')::uuid;
+        end if;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists skills_catalog_version on public.skills;
+create trigger skills_catalog_version
+    before insert or update on public.skills
+    for each row execute function public.catalog_stamp_version();
+
+drop trigger if exists practice_sets_catalog_version on public.practice_sets;
+create trigger practice_sets_catalog_version
+    before insert or update on public.practice_sets
+    for each row execute function public.catalog_stamp_version();
+
+drop trigger if exists skills_catalog_tombstone on public.skills;
+create trigger skills_catalog_tombstone
+    after delete on public.skills
+    for each row execute function public.catalog_record_tombstone('skill');
+
+drop trigger if exists practice_sets_catalog_tombstone on public.practice_sets;
+create trigger practice_sets_catalog_tombstone
+    after delete on public.practice_sets
+    for each row execute function public.catalog_record_tombstone('practice_set');
+
+drop trigger if exists questions_catalog_version on public.questions;
+create trigger questions_catalog_version
+    after insert or update or delete on public.questions
+    for each row execute function public.catalog_bump_practice_set();
+
+drop trigger if exists question_options_catalog_version on public.question_options;
+create trigger question_options_catalog_version
+    after insert or update or delete on public.question_options
+    for each row execute function public.catalog_bump_practice_set();
+
+drop trigger if exists listening_tracks_catalog_version on public.listening_tracks;
+create trigger listening_tracks_catalog_version
+    after insert or update or delete on public.listening_tracks
+    for each row execute function public.catalog_bump_practice_set();
@@ -0,0 +1,120 @@
+-- Multi-step writes as single-transaction RPCs, called with sb.rpc(...).
+-- Each replaces a chain of PostgREST calls that could fail half-way.
+-- "Not found" is raised as SQLSTATE P0002 so routes can map it to 404.
+
+-- POST /api/payments/session/<id>/confirm:
+-- mark paid, start a 30-day subscription, grant premium, log the event.
+create or replace function public.confirm_payment_session(
+    p_payment_session_id uuid,
+    p_user_id uuid
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_plan_id uuid;
+    v_now timestamptz := now();
+    v_until timestamptz := now() + interval '30 days';
+    v_subscription public.subscriptions;
+begin
+    update public.payment_sessions
+    set status = 'paid', completed_at = v_now
+    where id = p_payment_session_id and user_id = p_user_id
+    returning plan_id into v_plan_id;
+    if not found then
+        raise exception 'Payment session not found' using errcode = 'P0002';
+    end if;
+
+    insert into public.subscriptions
+        (user_id, plan_id, payment_session_id, status, current_period_start, current_period_end)
+    values (p_user_id, v_plan_id, p_payment_session_id, 'active', v_now, v_until)
+    returning * into v_subscription;
+
+    update public.profiles
+    set is_premium = true, premium_until = v_until, updated_at = v_now
+    where user_id = p_user_id;
+
+    -- The audit event stays best-effort, as before: its failure must not undo
+    -- the grant.
+    begin
+        insert into public.premium_events (user_id, event_type, reason, created_at)
+        values (p_user_id, 'grant', 'mock_payment', v_now);
+    exception when others then
+        null;
+    end;
+
+    return jsonb_build_object(
+        'subscription', to_jsonb(v_subscription),
+        'profile', jsonb_build_object('is_premium', true)
+    );
+end;
+$$;
+
+-- POST /api/practice-sessions/<id>/complete:
+-- score the session from its answers, stamp it, and return everything the
+-- summary needs (answers, writing evaluations, set and skill) in one call.
+create or replace function public.complete_practice_session(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_time_taken_seconds integer
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_practice_set_id uuid;
+    v_total integer;
+    v_correct integer;
+    v_score numeric;
+    v_now timestamptz := now();
+begin
+    select practice_set_id into v_practice_set_id
+    from public.practice_sessions
+    where id = p_session_id and user_id = p_user_id
+    for update;
+    if not found then
+        raise exception 'Session not found' using errcode = 'P0002';
+    end if;
+
+    select count(*) into v_total from public.questions where practice_set_id = v_practice_set_id;
+    select count(*) into v_correct
+    from public.practice_answers
+    where session_id = p_session_id and is_correct is true;
+    v_score := case when v_total > 0 then v_correct::numeric / v_total * 100 else 0 end;
+
+    update public.practice_sessions
+    set completed_at = v_now,
+        time_taken_seconds = coalesce(p_time_taken_seconds, 0),
+        total_questions = v_total,
+        correct_questions = v_correct,
+        score = v_score
+    where id = p_session_id;
+
+    return jsonb_build_object(
+        'completed_at', v_now,
+        'total_questions', v_total,
+        'correct_questions', v_correct,
+        'score', v_score,
+        'practice_set', (
+            select jsonb_build_object(
+                'id', ps.id, 'title', ps.title, 'skill_slug', s.slug, 'skill_name', s.name
+            )
+            from public.practice_sets ps
+            join public.skills s on s.id = ps.skill_id
+            where ps.id = v_practice_set_id
+        ),
+        'answers', coalesce((
+            select jsonb_agg(jsonb_build_object(
+                'id', a.id, 'question_id', a.question_id, 'option_id', a.option_id,
+                'answer_text', a.answer_text, 'is_correct', a.is_correct
+            ) order by a.answered_at, a.id)
+            from public.practice_answers a
+            where a.session_id = p_session_id
+        ), '[]'::jsonb),
+        'writing_evaluations', coalesce((
+            select jsonb_agg(to_jsonb(w))
+            from public.writing_evaluations w
+            join public.practice_answers a on a.id = w.practice_answer_id
+            where a.session_id = p_session_id
+        ), '[]'::jsonb)
+    );
+end;
+$$;
@@ -0,0 +1,48 @@
+-- Indexes for the predicates the routes filter on, one per access path.
+-- INCLUDE columns cover the selected fields where they are small, so those
+-- reads become index-only scans. Large text columns (answer_text, feedback)
+-- are deliberately left out. Checked by bench/explain_check.py.
+-- Note: `create index concurrently` cannot run inside a transaction; apply
+-- this file outside one (psql -f) on a live database.
+
+-- complete_practice_session(): answers of one practice session.
+create index concurrently if not exists practice_answers_session_id_idx
+    on public.practice_answers (session_id)
+    include (question_id, option_id, is_correct);
+
+-- Section completion counts correct answers; the exam summary and section
+-- writing-eval load a section's answers.
+create index concurrently if not exists exam_answers_section_result_id_is_correct_idx
+    on public.exam_answers (section_result_id, is_correct)
+    include (question_id, option_id);
+
+-- Writing evaluations by the answer they grade (practice summary) and by
+-- exam section (exam summary, section writing-eval skip list).
+create index concurrently if not exists writing_evaluations_practice_answer_id_idx
+    on public.writing_evaluations (practice_answer_id)
+    where practice_answer_id is not null;
+create index concurrently if not exists writing_evaluations_exam_section_result_id_idx
+    on public.writing_evaluations (exam_section_result_id)
+    include (exam_answer_id)
+    where exam_section_result_id is not null;
+
+-- Speaking attempts of an exam section (exam summary).
+create index concurrently if not exists speaking_attempts_exam_section_result_id_idx
+    on public.speaking_attempts (exam_section_result_id)
+    include (question_id, duration_seconds)
+    where exam_section_result_id is not null;
+
+-- Correct-option lookup when grading an answer.
+create index concurrently if not exists question_options_question_id_is_correct_idx
+    on public.question_options (question_id, is_correct)
+    include (id);
+
+-- A practice set's questions in order (catalog loads, RPC question count).
+create index concurrently if not exists questions_practice_set_id_order_index_idx
+    on public.questions (practice_set_id, order_index);
+
+-- Recent sessions: a user's sessions, newest completion first. DESC matches
+-- PostgREST's `order=completed_at.desc` (nulls first).
+create index concurrently if not exists practice_sessions_user_id_completed_at_idx
+    on public.practice_sessions (user_id, completed_at desc)
+    include (practice_set_id, total_questions, correct_questions, score);
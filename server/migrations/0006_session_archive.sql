@@ -0,0 +1,237 @@
+-- Hot/cold archival of completed sessions (see archive.py).
+-- A completed session older than the cutoff is moved, with its answers and
+-- evaluations, into one compact archive row: summary columns for listing
+-- plus a jsonb payload of the original rows (TOAST-compressed). Each call to
+-- archive_*_sessions() moves one batch in one transaction: copy, then
+-- delete the hot rows, so an interrupted run simply resumes with the next
+-- oldest sessions.
+
+create table if not exists public.practice_session_archive (
+    session_id uuid primary key,
+    user_id uuid not null,
+    practice_set_id uuid,
+    started_at timestamptz,
+    completed_at timestamptz not null,
+    time_taken_seconds integer,
+    total_questions integer,
+    correct_questions integer,
+    score numeric,
+    -- {"session": {...}, "answers": [...], "writing_evaluations": [...]}
+    payload jsonb not null,
+    archived_at timestamptz not null default now()
+);
+
+create index if not exists practice_session_archive_user_id_completed_at_idx
+    on public.practice_session_archive (user_id, completed_at desc);
+
+create table if not exists public.exam_session_archive (
+    exam_session_id uuid primary key,
+    user_id uuid not null,
+    started_at timestamptz,
+    completed_at timestamptz not null,
+    total_time_seconds integer,
+    -- {"session", "section_results", "answers", "writing_evaluations",
+    --  "speaking_attempts", "speaking_evaluations"}
+    payload jsonb not null,
+    -- The exam_result_snapshots payload, so the results screen keeps working.
+    result_gz_b64 text,
+    archived_at timestamptz not null default now()
+);
+
+create index if not exists exam_session_archive_user_id_completed_at_idx
+    on public.exam_session_archive (user_id, completed_at desc);
+
+-- Archived evaluations stay queryable per user for band history.
+create table if not exists public.evaluation_archive (
+    id uuid primary key,
+    kind text not null check (kind in ('writing', 'speaking')),
+    user_id uuid not null,
+    created_at timestamptz not null,
+    session_id uuid not null,
+    row jsonb not null
+);
+
+create index if not exists evaluation_archive_user_id_kind_created_at_idx
+    on public.evaluation_archive (user_id, kind, created_at);
+
+-- lz4 (PostgreSQL 14+) compresses and decompresses faster than the default
+-- pglz. Servers built without lz4 keep pglz instead of failing the migration.
+do $$
+begin
+    alter table public.practice_session_archive alter column payload set compression lz4;
+    alter table public.exam_session_archive alter column payload set compression lz4;
+    alter table public.evaluation_archive alter column row set compression lz4;
+exception when feature_not_supported then
+    raise notice 'lz4 is not available; archive payloads use pglz';
+end;
+$$;
+
+-- Move up to p_limit of the oldest practice sessions completed before
+-- p_before. Returns {"sessions", "answers", "evaluations"} counts.
+create or replace function public.archive_practice_sessions(
+    p_before timestamptz,
+    p_limit integer
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_ids uuid[];
+    v_answers integer;
+    v_evaluations integer;
+begin
+    select coalesce(array_agg(id), '{}') into v_ids
+    from (
+        select id
+        from public.practice_sessions
+        where completed_at is not null and completed_at < p_before
+        order by completed_at, id
+        limit p_limit
+        for update skip locked
+    ) s;
+    if cardinality(v_ids) = 0 then
+        return jsonb_build_object('sessions', 0, 'answers', 0, 'evaluations', 0);
+    end if;
+
+    insert into public.evaluation_archive (id, kind, user_id, created_at, session_id, row)
+    select w.id, 'writing', w.user_id, w.created_at, a.session_id, to_jsonb(w)
+    from public.writing_evaluations w
+    join public.practice_answers a on a.id = w.practice_answer_id
+    where a.session_id = any(v_ids)
+    on conflict (id) do nothing;
+
+    insert into public.practice_session_archive (
+        session_id, user_id, practice_set_id, started_at, completed_at,
+        time_taken_seconds, total_questions, correct_questions, score, payload
+    )
+    select
+        s.id, s.user_id, s.practice_set_id, s.started_at, s.completed_at,
+        s.time_taken_seconds, s.total_questions, s.correct_questions, s.score,
+        jsonb_build_object(
+            'session', to_jsonb(s),
+            'answers', coalesce((
+                select jsonb_agg(to_jsonb(a) order by a.answered_at, a.id)
+                from public.practice_answers a
+                where a.session_id = s.id
+            ), '[]'::jsonb),
+            'writing_evaluations', coalesce((
+                select jsonb_agg(to_jsonb(w))
+                from public.writing_evaluations w
+                join public.practice_answers a on a.id = w.practice_answer_id
+                where a.session_id = s.id
+            ), '[]'::jsonb)
+        )
+    from public.practice_sessions s
+    where s.id = any(v_ids)
+    on conflict (session_id) do nothing;
+
+    delete from public.writing_evaluations w
+    using public.practice_answers a
+    where a.id = w.practice_answer_id and a.session_id = any(v_ids);
+    get diagnostics v_evaluations = row_count;
+    delete from public.practice_answers where session_id = any(v_ids);
+    get diagnostics v_answers = row_count;
+    delete from public.practice_sessions where id = any(v_ids);
+
+    return jsonb_build_object(
+        'sessions', cardinality(v_ids), 'answers', v_answers, 'evaluations', v_evaluations
+    );
+end;
+$$;
+
+-- Move the given exam sessions (the caller picks them and makes sure each
+-- has a result snapshot first). Sessions that are not completed before
+-- p_before are skipped.
+create or replace function public.archive_exam_sessions(
+    p_session_ids uuid[],
+    p_before timestamptz
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_ids uuid[];
+    v_sections uuid[];
+    v_attempts uuid[];
+    v_answers integer;
+    v_evaluations integer;
+    v_speaking integer;
+begin
+    select coalesce(array_agg(id), '{}') into v_ids
+    from (
+        select id
+        from public.exam_sessions
+        where id = any(p_session_ids) and completed_at is not null and completed_at < p_before
+        for update skip locked
+    ) s;
+    if cardinality(v_ids) = 0 then
+        return jsonb_build_object('sessions', 0, 'answers', 0, 'evaluations', 0);
+    end if;
+    select coalesce(array_agg(id), '{}') into v_sections
+    from public.exam_section_results where exam_session_id = any(v_ids);
+    select coalesce(array_agg(id), '{}') into v_attempts
+    from public.speaking_attempts where exam_session_id = any(v_ids);
+
+    insert into public.evaluation_archive (id, kind, user_id, created_at, session_id, row)
+    select w.id, 'writing', w.user_id, w.created_at, r.exam_session_id, to_jsonb(w)
+    from public.writing_evaluations w
+    join public.exam_section_results r on r.id = w.exam_section_result_id
+    where r.id = any(v_sections)
+    union all
+    select e.id, 'speaking', e.user_id, e.created_at, t.exam_session_id, to_jsonb(e)
+    from public.speaking_evaluations e
+    join public.speaking_attempts t on t.id = e.attempt_id
+    where t.id = any(v_attempts)
+    on conflict (id) do nothing;
+
+    insert into public.exam_session_archive (
+        exam_session_id, user_id, started_at, completed_at, total_time_seconds, payload, result_gz_b64
+    )
+    select
+        s.id, s.user_id, s.started_at, s.completed_at, s.total_time_seconds,
+        jsonb_build_object(
+            'session', to_jsonb(s),
+            'section_results', coalesce((
+                select jsonb_agg(to_jsonb(r)) from public.exam_section_results r where r.exam_session_id = s.id
+            ), '[]'::jsonb),
+            'answers', coalesce((
+                select jsonb_agg(to_jsonb(a) order by a.answered_at, a.id)
+                from public.exam_answers a
+                join public.exam_section_results r on r.id = a.section_result_id
+                where r.exam_session_id = s.id
+            ), '[]'::jsonb),
+            'writing_evaluations', coalesce((
+                select jsonb_agg(to_jsonb(w))
+                from public.writing_evaluations w
+                join public.exam_section_results r on r.id = w.exam_section_result_id
+                where r.exam_session_id = s.id
+            ), '[]'::jsonb),
+            'speaking_attempts', coalesce((
+                select jsonb_agg(to_jsonb(t)) from public.speaking_attempts t where t.exam_session_id = s.id
+            ), '[]'::jsonb),
+            'speaking_evaluations', coalesce((
+                select jsonb_agg(to_jsonb(e))
+                from public.speaking_evaluations e
+                join public.speaking_attempts t on t.id = e.attempt_id
+                where t.exam_session_id = s.id
+            ), '[]'::jsonb)
+        ),
+        (select payload_gz_b64 from public.exam_result_snapshots x where x.exam_session_id = s.id)
+    from public.exam_sessions s
+    where s.id = any(v_ids)
+    on conflict (exam_session_id) do nothing;
+
+    delete from public.speaking_evaluations where attempt_id = any(v_attempts);
+    get diagnostics v_speaking = row_count;
+    delete from public.speaking_attempts where id = any(v_attempts);
+    delete from public.writing_evaluations where exam_section_result_id = any(v_sections);
+    get diagnostics v_evaluations = row_count;
+    delete from public.exam_answers where section_result_id = any(v_sections);
+    get diagnostics v_answers = row_count;
+    delete from public.exam_section_results where id = any(v_sections);
+    -- Cascades to exam_result_snapshots; the blob now lives in the archive.
+    delete from public.exam_sessions where id = any(v_ids);
+
+    return jsonb_build_object(
+        'sessions', cardinality(v_ids), 'answers', v_answers, 'evaluations', v_evaluations + v_speaking
+    );
+end;
+$$;
@@ -0,0 +1,13 @@
+-- Near-duplicate links recorded by essay_index.py: the evaluation of an
+-- earlier, near-identical answer to the same question (reused when close
+-- enough) and the estimated similarity. Joined with user_id this flags
+-- likely copying.
+
+alter table public.writing_evaluations
+    add column if not exists duplicate_of_evaluation_id uuid
+        references public.writing_evaluations(id) on delete set null,
+    add column if not exists duplicate_similarity real;
+
+create index if not exists writing_evaluations_duplicate_of_evaluation_id_idx
+    on public.writing_evaluations (duplicate_of_evaluation_id)
+    where duplicate_of_evaluation_id is not null;
@@ -0,0 +1,21 @@
+-- Outbox of evaluation status events (events.py). Every worker process
+-- inserts the events it publishes here and polls it for the users it has
+-- open streams for, so an async evaluation finishing on one worker reaches
+-- an SSE stream held by another. The bigserial id is the SSE event id:
+-- unique across workers, so Last-Event-ID replay works after a reconnect
+-- to any of them. Rows older than EVENTS_RETENTION_SECONDS are pruned by
+-- the workers.
+
+create table if not exists public.evaluation_events (
+    id bigserial primary key,
+    user_id uuid not null,
+    type text not null,
+    data jsonb not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists evaluation_events_user_id_id_idx
+    on public.evaluation_events (user_id, id);
+
+create index if not exists evaluation_events_created_at_idx
+    on public.evaluation_events (created_at);
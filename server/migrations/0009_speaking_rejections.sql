@@ -0,0 +1,28 @@
+-- Recordings rejected by pre-analysis (audio_analysis.py: silent or too
+-- short) are stored with the reason and no bands, so they never count as
+-- a band of 0 in trends or averages. Rows written before this migration
+-- carried 0.0 bands; they are recognised by their fixed feedback text.
+
+alter table public.speaking_evaluations
+    add column if not exists rejected_reason text;
+
+alter table public.speaking_evaluations
+    alter column overall_band drop not null,
+    alter column band_fluency drop not null,
+    alter column band_lexical drop not null,
+    alter column band_grammar drop not null,
+    alter column band_pronunciation drop not null;
+
+update public.speaking_evaluations
+set rejected_reason = case
+        when feedback_short = 'Your recording is too short to assess.' then 'too_short'
+        else 'silent'
+    end,
+    overall_band = null,
+    band_fluency = null,
+    band_lexical = null,
+    band_grammar = null,
+    band_pronunciation = null
+where rejected_reason is null
+  and overall_band = 0
+  and feedback_short in ('Your recording is too short to assess.', 'No speech was detected in your recording.');
@@ -0,0 +1,71 @@
+-- Safe watermark for catalog delta sync (catalog.changes).
+--
+-- catalog_version is taken from the sequence when the row is written, not
+-- when its transaction commits: if T1 takes version 10, then T2 takes 11
+-- and commits first, a sync in between sees 11 but not 10. A client that
+-- stored 11 as its version would never receive T1's change. So rows also
+-- record when they were stamped, and catalog_watermark() returns the
+-- highest version it is safe to resume from: the highest stamped before
+-- every transaction still writing started (from pg_stat_activity, when
+-- visible), and at least p_lag_seconds ago. catalog.changes() never hands
+-- out a version above it; newer rows are returned again on the next sync.
+
+alter table public.skills
+    add column if not exists catalog_stamped_at timestamptz not null default clock_timestamp();
+alter table public.practice_sets
+    add column if not exists catalog_stamped_at timestamptz not null default clock_timestamp();
+alter table public.catalog_tombstones
+    add column if not exists catalog_stamped_at timestamptz not null default clock_timestamp();
+
+create index if not exists skills_catalog_stamped_at_idx on public.skills (catalog_stamped_at);
+create index if not exists practice_sets_catalog_stamped_at_idx on public.practice_sets (catalog_stamped_at);
+create index if not exists catalog_tombstones_catalog_stamped_at_idx
+    on public.catalog_tombstones (catalog_stamped_at);
+
+create or replace function public.catalog_stamp_version() returns trigger
+language plpgsql
+as $$
+begin
+    new.catalog_version := nextval('public.catalog_version_seq');
+    new.catalog_stamped_at := clock_timestamp();
+    return new;
+end;
+$$;
+
+create or replace function public.catalog_record_tombstone() returns trigger
+language plpgsql
+as $$
+begin
+    insert into public.catalog_tombstones (kind, id)
+    values (tg_argv[0], old.id)
+    on conflict (kind, id) do update
+        set catalog_version = nextval('public.catalog_version_seq'),
+            catalog_stamped_at = clock_timestamp(),
+            deleted_at = now();
+    return old;
+end;
+$$;
+
+-- security definer: reading other sessions' xact_start needs the owner's
+-- pg_read_all_stats; without it only the lag applies.
+create or replace function public.catalog_watermark(p_lag_seconds integer)
+returns bigint
+language sql
+stable
+security definer
+set search_path = public, pg_catalog
+as $$
+    with cutoff as (
+        select least(
+            clock_timestamp() - make_interval(secs => p_lag_seconds),
+            (select min(xact_start) from pg_stat_activity where backend_xid is not null)
+        ) as at
+    )
+    select coalesce(max(v), 0) from (
+        select max(catalog_version) as v from public.skills, cutoff where catalog_stamped_at < cutoff.at
+        union all
+        select max(catalog_version) from public.practice_sets, cutoff where catalog_stamped_at < cutoff.at
+        union all
+        select max(catalog_version) from public.catalog_tombstones, cutoff where catalog_stamped_at < cutoff.at
+    ) versions;
+$$;
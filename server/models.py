@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+from utils import to_jsonable
+
+
+class _Row:
+    """
+    Base for compact, __slots__-backed views over PostgREST rows.
+
+    Subclasses list their columns in ``__slots__``; ``from_row`` copies only
+    those keys out of the raw dict and ``to_dict`` serializes them back without
+    going through a generic ``to_jsonable`` walk.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **values: Any):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    def from_row(cls, row: dict):
+        obj = cls.__new__(cls)
+        get = row.get
+        for name in cls.__slots__:
+            setattr(obj, name, get(name))
+        return obj
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict]) -> list:
+        return [cls.from_row(r) for r in rows]
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(id={getattr(self, 'id', None)!r})"
+
+
+class QuestionOption(_Row):
+    __slots__ = ("id", "question_id", "option_index", "text", "is_correct")
+
+    def to_dict(self, include_correct: bool = False) -> dict:
+        out = {"id": self.id, "option_index": self.option_index, "text": self.text}
+        if include_correct:
+            out["is_correct"] = self.is_correct
+        return out
+
+
+class ListeningTrack(_Row):
+    __slots__ = ("id", "title", "audio_path", "duration_seconds")
+
+
+class Question(_Row):
+    __slots__ = (
+        "id",
+        "practice_set_id",
+        "skill_id",
+        "type",
+        "task_type",
+        "order_index",
+        "prompt",
+        "passage",
+        "max_score",
+        "listening_track_id",
+        "audio_start_sec",
+        "audio_end_sec",
+        "options",
+        "listening_track",
+    )
+
+    # Columns that are serialized as-is; `options` / `listening_track` are nested.
+    _PUBLIC = (
+        "id",
+        "type",
+        "order_index",
+        "prompt",
+        "passage",
+        "max_score",
+        "listening_track_id",
+        "audio_start_sec",
+        "audio_end_sec",
+    )
+
+    @classmethod
+    def from_row(cls, row: dict, track_map: dict[str, ListeningTrack] | None = None):
+        """
+        Build a question from a row, optionally carrying an embedded
+        ``question_options(...)`` relation.
+        """
+        obj = super().from_row(row)
+        raw_opts = row.get("question_options") or row.get("options") or []
+        opts = [QuestionOption.from_row(o) for o in raw_opts]
+        opts.sort(key=lambda o: o.option_index if o.option_index is not None else 0)
+        obj.options = tuple(opts)
+        track_id = obj.listening_track_id
+        obj.listening_track = track_map.get(track_id) if (track_map and track_id) else None
+        return obj
+
+    @property
+    def correct_option(self) -> QuestionOption | None:
+        for opt in self.options:
+            if opt.is_correct is True:
+                return opt
+        return None
+
+    def option(self, option_id: str | None) -> QuestionOption | None:
+        if not option_id:
+            return None
+        for opt in self.options:
+            if opt.id == option_id:
+                return opt
+        return None
+
+    def to_dict(self, include_correct: bool = False) -> dict:
+        out = {name: getattr(self, name) for name in self._PUBLIC}
+        out["options"] = [o.to_dict(include_correct) for o in self.options]
+        if self.listening_track is not None:
+            out["listening_track"] = self.listening_track.to_dict()
+        return out
+
+
+class PracticeAnswer(_Row):
+    __slots__ = ("id", "session_id", "question_id", "option_id", "answer_text", "is_correct")
+
+
+class ExamAnswer(_Row):
+    __slots__ = (
+        "id",
+        "exam_session_id",
+        "section_result_id",
+        "question_id",
+        "option_id",
+        "answer_text",
+        "is_correct",
+    )
+
+
+class _Evaluation(_Row):
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row: dict):
+        # Evaluation rows may carry numerics/timestamps; normalize once here.
+        obj = cls.__new__(cls)
+        get = row.get
+        for name in cls.__slots__:
+            setattr(obj, name, to_jsonable(get(name)))
+        return obj
+
+
+class WritingEvaluation(_Evaluation):
+    __slots__ = (
+        "id",
+        "created_at",
+        "mode",
+        "practice_answer_id",
+        "exam_answer_id",
+        "exam_session_id",
+        "exam_section_result_id",
+        "user_id",
+        "question_id",
+        "overall_band",
+        "band_task_response",
+        "band_coherence",
+        "band_lexical",
+        "band_grammar",
+        "is_good_enough",
+        "feedback_short",
+        "feedback_detailed",
+        "model_answer",
+        "duplicate_of_evaluation_id",
+        "duplicate_similarity",
+    )
+
+
+class SpeakingEvaluation(_Evaluation):
+    __slots__ = (
+        "id",
+        "created_at",
+        "attempt_id",
+        "user_id",
+        "question_id",
+        "mode",
+        "overall_band",
+        "band_fluency",
+        "band_lexical",
+        "band_grammar",
+        "band_pronunciation",
+        "is_good_enough",
+        "feedback_short",
+        "feedback_detailed",
+        "transcript",
+        "rejected_reason",
+    )
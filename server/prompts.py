@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from string import Template
+
+from ai_schemas import SPEAKING_FIELDS, WRITING_FIELDS, describe
+
+
+class PromptTemplate:
+    """
+    A versioned examiner prompt: a fixed system instruction (sent once per
+    model instance, not per request) and a per-request user template.
+    """
+
+    __slots__ = ("name", "version", "system", "_user")
+
+    def __init__(self, name: str, version: int, system: str, user: str):
+        self.name = name
+        self.version = version
+        self.system = system
+        self._user = Template(user)
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}-v{self.version}"
+
+    def render(self, **values) -> str:
+        return self._user.substitute(**values)
+
+
+WRITING_EXAMINER = PromptTemplate(
+    name="writing-examiner",
+    version=2,
+    system=(
+        "You are an official IELTS Writing examiner. "
+        "Score the candidate strictly by IELTS criteria and respond with JSON ONLY using the schema: "
+        f"{describe(WRITING_FIELDS)}. "
+        "Do not include any text outside the JSON object."
+    ),
+    user=(
+        "Task type: $task_type\n"
+        "Target band threshold: $target_band\n"
+        "Question prompt:\n$prompt\n\n"
+        "Candidate answer:\n$candidate_answer\n"
+    ),
+)
+
+SPEAKING_EXAMINER = PromptTemplate(
+    name="speaking-examiner",
+    version=2,
+    system=(
+        "You are an official IELTS Speaking examiner. "
+        "Listen to the provided audio and respond ONLY with JSON using the schema: "
+        f"{describe(SPEAKING_FIELDS)}. "
+        "Be strict: penalize off-topic answers, very short answers, and missing details. "
+        "Set on_topic=false if the response does not address the question; reduce overall_band accordingly. "
+        "Set is_good_enough=false when the response is below the target_band or off-topic. "
+        "No additional commentary or code fences."
+    ),
+    user=(
+        "Question: $question_text\n"
+        "Target band threshold: $target_band\n"
+        "Approximate duration (seconds): $duration_seconds\n"
+        "Evaluate the speaking performance, check whether the answer addresses the question, "
+        "and transcribe the response. Penalize if the response is shorter than 5 seconds or clearly irrelevant."
+    ),
+)
+
+PROMPTS = {p.name: p for p in (WRITING_EXAMINER, SPEAKING_EXAMINER)}
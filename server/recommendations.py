@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import archive
+import catalog
+import metrics
+from supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+# Adaptive practice-set recommendations. A per-set difficulty index (attempts
+# and correct/total question counts across all users) is built offline in
+# keyset-paged batches and then only topped up with newly completed sessions,
+# so a request scores the candidate sets in memory against the user's own
+# accuracy per skill/level.
+
+INDEX_BATCH_SIZE = int(os.getenv("RECOMMENDATION_INDEX_BATCH_SIZE", "1000"))
+INDEX_REFRESH_SECONDS = int(os.getenv("RECOMMENDATION_INDEX_REFRESH_SECONDS", "300"))
+# Optional .npz file so the index survives restarts and only the delta is
+# fetched on boot.
+INDEX_PATH = os.getenv("RECOMMENDATION_INDEX_PATH")
+# Expected accuracy we aim for: hard enough to stretch, easy enough to finish.
+TARGET_ACCURACY = float(os.getenv("RECOMMENDATION_TARGET_ACCURACY", "0.7"))
+# Pseudo-observations pulling sparse accuracies towards their parent mean.
+PRIOR_WEIGHT = 10.0
+DEFAULT_ACCURACY = 0.6
+# Skills graded by the examiner model, where is_correct (and so accuracy) is
+# not recorded.
+SUBJECTIVE_SKILLS = frozenset({"writing", "speaking"})
+
+
+class DifficultyIndex:
+    """
+    Compact per-set aggregates in parallel NumPy arrays, with a
+    (completed_at, ids-at-that-instant) watermark for incremental refresh.
+    """
+
+    def __init__(self):
+        self.ids: list[str] = []
+        self._pos: dict[str, int] = {}
+        self.attempts = np.zeros(0, dtype=np.int32)
+        self.correct = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.int64)
+        self.watermark: str | None = None
+        self._watermark_ids: set[str] = set()
+        self.refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _slot(self, ps_id: str) -> int:
+        pos = self._pos.get(ps_id)
+        if pos is None:
+            pos = self._pos[ps_id] = len(self.ids)
+            self.ids.append(ps_id)
+            if pos >= self.attempts.size:
+                grow = max(64, self.attempts.size)
+                self.attempts = np.concatenate([self.attempts, np.zeros(grow, dtype=np.int32)])
+                self.correct = np.concatenate([self.correct, np.zeros(grow, dtype=np.int64)])
+                self.total = np.concatenate([self.total, np.zeros(grow, dtype=np.int64)])
+        return pos
+
+    def add_sessions(self, rows: list[dict]) -> int:
+        """
+        Fold completed sessions into the aggregates; rows already seen at the
+        watermark instant are skipped. Returns how many were new.
+        """
+        added = 0
+        with self._lock:
+            for row in rows:
+                completed_at = row["completed_at"]
+                if completed_at == self.watermark and row["id"] in self._watermark_ids:
+                    continue
+                total = row.get("total_questions") or 0
+                if total:
+                    pos = self._slot(row["practice_set_id"])
+                    self.attempts[pos] += 1
+                    self.correct[pos] += row.get("correct_questions") or 0
+                    self.total[pos] += total
+                if completed_at != self.watermark:
+                    self.watermark = completed_at
+                    self._watermark_ids = set()
+                self._watermark_ids.add(row["id"])
+                added += 1
+        return added
+
+    def stats(self, ps_id: str) -> tuple[int, int, int]:
+        pos = self._pos.get(ps_id)
+        if pos is None:
+            return 0, 0, 0
+        return int(self.attempts[pos]), int(self.correct[pos]), int(self.total[pos])
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            n = len(self.ids)
+            tmp = f"{path}.tmp.npz"
+            np.savez_compressed(
+                tmp,
+                ids=np.array(self.ids, dtype=str),
+                attempts=self.attempts[:n],
+                correct=self.correct[:n],
+                total=self.total[:n],
+                watermark=np.array([self.watermark or ""], dtype=str),
+                watermark_ids=np.array(sorted(self._watermark_ids), dtype=str),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "DifficultyIndex":
+        index = cls()
+        with np.load(path) as data:
+            index.ids = [str(i) for i in data["ids"]]
+            index._pos = {ps_id: i for i, ps_id in enumerate(index.ids)}
+            index.attempts = data["attempts"].astype(np.int32)
+            index.correct = data["correct"].astype(np.int64)
+            index.total = data["total"].astype(np.int64)
+            index.watermark = str(data["watermark"][0]) or None
+            index._watermark_ids = {str(i) for i in data["watermark_ids"]}
+        return index
+
+
+def _load_index() -> DifficultyIndex:
+    if INDEX_PATH and os.path.exists(INDEX_PATH):
+        try:
+            return DifficultyIndex.load(INDEX_PATH)
+        except Exception:
+            logger.exception("Could not read recommendation index %s; rebuilding", INDEX_PATH)
+    return DifficultyIndex()
+
+
+_index = _load_index()
+_refresh_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recommendation-index")
+_refresh_lock = threading.Lock()
+_refresh_pending = False
+
+
+def refresh_index(index: DifficultyIndex | None = None) -> int:
+    """
+    Fetch sessions completed since the watermark in keyset-ordered batches
+    and fold them into the index. Returns the number of sessions added.
+    """
+    index = index or _index
+    sb = get_supabase()
+    started = time.monotonic()
+    added = 0
+    while True:
+        query = (
+            sb.table("practice_sessions")
+            .select("id,practice_set_id,completed_at,total_questions,correct_questions")
+            .not_.is_("completed_at", "null")
+        )
+        if index.watermark:
+            query = query.gte("completed_at", index.watermark)
+        rows = query.order("completed_at").order("id").limit(INDEX_BATCH_SIZE).execute().data or []
+        new = index.add_sessions(rows)
+        added += new
+        if len(rows) < INDEX_BATCH_SIZE or not new:
+            break
+    index.refreshed_at = time.time()
+    if added and INDEX_PATH:
+        index.save(INDEX_PATH)
+    metrics.observe("recommendations.index_refresh_ms", (time.monotonic() - started) * 1000)
+    return added
+
+
+def _refresh_logged() -> None:
+    global _refresh_pending
+    try:
+        refresh_index()
+    except Exception:
+        logger.exception("Recommendation index refresh failed")
+    finally:
+        with _refresh_lock:
+            _refresh_pending = False
+
+
+def ensure_fresh() -> None:
+    """
+    Schedule a background top-up when the index is older than
+    INDEX_REFRESH_SECONDS; requests keep using the current index meanwhile.
+    """
+    global _refresh_pending
+    if time.time() - _index.refreshed_at < INDEX_REFRESH_SECONDS:
+        return
+    with _refresh_lock:
+        if _refresh_pending:
+            return
+        _refresh_pending = True
+    _refresh_pool.submit(_refresh_logged)
+
+
+def _smoothed(correct: float, total: float, prior: float) -> float:
+    return (correct + PRIOR_WEIGHT * prior) / (total + PRIOR_WEIGHT)
+
+
+def _user_accuracy(sb, user_id: str, set_info: dict[str, tuple[str, str | None]]):
+    """
+    The user's completed-set ids and (correct, total) per skill and per
+    (skill, level), from their completed practice sessions.
+    """
+    rows = (
+        sb.table("practice_sessions")
+        .select("practice_set_id,total_questions,correct_questions")
+        .eq("user_id", user_id)
+        .not_.is_("completed_at", "null")
+        .execute()
+        .data
+        or []
+    ) + archive.practice_sessions(sb, user_id, columns="practice_set_id,total_questions,correct_questions")
+    done: set[str] = set()
+    by_skill: dict[str, list[int]] = {}
+    by_level: dict[tuple[str, str | None], list[int]] = {}
+    for row in rows:
+        ps_id = row["practice_set_id"]
+        done.add(ps_id)
+        info = set_info.get(ps_id)
+        total = row.get("total_questions") or 0
+        if info is None or not total:
+            continue
+        correct = row.get("correct_questions") or 0
+        for acc in (by_skill.setdefault(info[0], [0, 0]), by_level.setdefault(info, [0, 0])):
+            acc[0] += correct
+            acc[1] += total
+    return done, by_skill, by_level
+
+
+def recommend(user_id: str, skill_slug: str | None = None, limit: int = 5, include_premium: bool = False) -> list[dict]:
+    """
+    Next best practice sets for the user: unattempted sets whose predicted
+    accuracy (user's skill/level accuracy adjusted by the set's relative
+    difficulty) is closest to TARGET_ACCURACY.
+    """
+    ensure_fresh()
+    sb = get_supabase()
+
+    candidates: list[tuple[str, dict]] = []
+    for skill in catalog.skills():
+        if skill_slug and skill["slug"] != skill_slug:
+            continue
+        listing = catalog.skill_practice_sets(skill["slug"]) or {}
+        candidates.extend((skill["slug"], item) for item in listing.get("items", []))
+    set_info = {item["id"]: (slug, item.get("level_tag")) for slug, item in candidates}
+
+    done, user_skill, user_level = _user_accuracy(sb, user_id, set_info)
+
+    # Global accuracy per skill from the index: the baseline a set's own
+    # accuracy is compared against.
+    skill_totals: dict[str, list[int]] = {}
+    for slug, item in candidates:
+        _, correct, total = _index.stats(item["id"])
+        acc = skill_totals.setdefault(slug, [0, 0])
+        acc[0] += correct
+        acc[1] += total
+
+    scored = []
+    for slug, item in candidates:
+        if item["id"] in done or (item.get("is_premium") and not include_premium):
+            continue
+        attempts, correct, total = _index.stats(item["id"])
+        entry = {**item, "skill": slug, "attempts": attempts}
+        if slug in SUBJECTIVE_SKILLS:
+            # No accuracy signal: prefer well-trodden sets, then catalog order.
+            entry.update(predicted_accuracy=None, difficulty=None)
+            scored.append((0.5 + min(attempts, 100) / 1000.0, entry))
+            continue
+
+        skill_acc = _smoothed(*skill_totals[slug], DEFAULT_ACCURACY)
+        set_acc = _smoothed(correct, total, skill_acc)
+        u_skill = _smoothed(*user_skill.get(slug, (0, 0)), skill_acc)
+        u_level = _smoothed(*user_level.get((slug, item.get("level_tag")), (0, 0)), u_skill)
+        predicted = min(1.0, max(0.0, u_level + (set_acc - skill_acc)))
+        entry.update(predicted_accuracy=round(predicted, 3), difficulty=round(1.0 - set_acc, 3))
+        scored.append((1.0 - abs(predicted - TARGET_ACCURACY), entry))
+
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    metrics.incr("recommendations.requests")
+    return [entry for _, entry in scored[:limit]]
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, Response, request
+
+import catalog
+import metrics
+from routes.practice import recent_practice_sessions
+from routes.premium import active_plans, latest_subscription
+from routes.profile import fetch_or_create_profile
+from supabase_client import get_supabase
+from utils import get_current_user_id, to_jsonable
+
+bootstrap_bp = Blueprint("bootstrap", __name__, url_prefix="/api")
+
+BOOTSTRAP_WORKERS = int(os.getenv("BOOTSTRAP_WORKERS", "8"))
+# Smaller payloads are not worth the gzip round trip.
+BOOTSTRAP_GZIP_MIN_BYTES = 1024
+
+_pool = ThreadPoolExecutor(max_workers=BOOTSTRAP_WORKERS, thread_name_prefix="bootstrap")
+
+
+@bootstrap_bp.get("/bootstrap")
+def bootstrap():
+    """
+    Everything the app needs at launch in one response: the payloads of
+    /me, /subscriptions/current, /skills, /practice-sessions/recent and
+    (unless `?plans=0`) /plans. Independent reads run concurrently on one
+    Supabase client; the profile is read once and shared.
+    """
+    user_id = get_current_user_id()
+    sb = get_supabase()
+
+    started = time.monotonic()
+    profile_f = _pool.submit(fetch_or_create_profile, sb, user_id)
+    subscription_f = _pool.submit(latest_subscription, sb, user_id)
+    skills_f = _pool.submit(catalog.skills)
+    recent_f = _pool.submit(recent_practice_sessions, sb, user_id)
+    plans_f = _pool.submit(active_plans, sb) if request.args.get("plans") != "0" else None
+
+    profile = profile_f.result()
+    payload = {
+        "me": profile,
+        "subscription": {
+            "subscription": subscription_f.result(),
+            "profile": {
+                "is_premium": profile.get("is_premium"),
+                "premium_until": profile.get("premium_until"),
+            },
+        },
+        "skills": skills_f.result(),
+        "recent_sessions": recent_f.result(),
+    }
+    if plans_f is not None:
+        payload["plans"] = plans_f.result()
+    metrics.observe("bootstrap.ms", (time.monotonic() - started) * 1000)
+
+    body = json.dumps(to_jsonable(payload), separators=(",", ":")).encode("utf-8")
+    resp = Response(mimetype="application/json")
+    if len(body) >= BOOTSTRAP_GZIP_MIN_BYTES and "gzip" in (request.headers.get("Accept-Encoding") or ""):
+        resp.set_data(gzip.compress(body, compresslevel=6))
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp.set_data(body)
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
@@ -1,84 +1,29 @@
 from __future__ import annotations
-from flask import Blueprint, jsonify, abort
+from flask import Blueprint, jsonify, abort, request
 from supabase_client import get_supabase
+import archive
+import bundles
+import catalog
+import item_stats
+import search
+from storage_urls import attach_audio_urls
+from admission import priority
+from utils import get_current_user_id
 
 content_bp = Blueprint("content", __name__, url_prefix="/api")
 
 
 @content_bp.get("/skills")
 def list_skills():
-    sb = get_supabase()
-    res = (
-        sb.table("skills")
-        .select("id,slug,name,description,color_hex,icon_key")
-        .order("name")
-        .execute()
-    )
-    return jsonify(res.data or [])
+    return jsonify(catalog.skills())
 
 
 @content_bp.get("/skills/<slug>/practice-sets")
 def skill_practice_sets(slug: str):
-    sb = get_supabase()
-
-    # 1) Fetch skill
-    skill_resp = (
-        sb.table("skills")
-        .select("id,slug,name")
-        .eq("slug", slug)
-        .execute()
-    )
-    skill_rows = skill_resp.data or []
-    if not skill_rows:
+    listing = catalog.skill_practice_sets(slug)
+    if listing is None:
         abort(404, description="Skill not found")
-    skill = skill_rows[0]
-
-    # 2) Fetch sets + aggregated question counts in ONE call
-    # Make sure your DB has a relation from questions.practice_set_id to practice_sets.id
-    sets_resp = (
-        sb.table("practice_sets")
-        .select(
-            "id,title,level_tag,short_description,estimated_minutes,is_premium,"
-            "questions(count)"
-        )
-        .eq("skill_id", skill["id"])
-        .eq("is_active", True)
-        .order("created_at", desc=True)
-        .execute()
-    )
-
-    rows = sets_resp.data or []
-
-    sets = []
-    for row in rows:
-        # Supabase returns something like: "questions": [{"count": 12}]
-        questions_rel = row.get("questions") or []
-        q_count = 0
-        if questions_rel and isinstance(questions_rel, list):
-            first = questions_rel[0] or {}
-            q_count = first.get("count", 0) or 0
-
-        sets.append(
-            {
-                "id": row["id"],
-                "title": row["title"],
-                "level_tag": row.get("level_tag"),
-                "short_description": row.get("short_description"),
-                "estimated_minutes": row.get("estimated_minutes"),
-                "is_premium": row.get("is_premium"),
-                "question_count": q_count,
-            }
-        )
-
-    return jsonify(
-        {
-            "skill": {
-                "slug": skill["slug"],
-                "name": skill["name"],
-            },
-            "items": sets,
-        }
-    )
+    return jsonify(listing)
 
 
 @content_bp.get("/practice-sets/<ps_id>")
@@ -121,6 +66,7 @@ def get_practice_set(ps_id: str):
         .data
         or []
     )
+    attach_audio_urls(tracks)
     return jsonify(
         {
             "practice_set": ps,
@@ -133,58 +79,118 @@ def get_practice_set(ps_id: str):
 
 @content_bp.get("/practice-sets/<ps_id>/questions")
 def practice_set_questions(ps_id: str):
-    sb = get_supabase()
-    ps = (
-        sb.table("practice_sets")
+    qs = catalog.practice_set_questions(ps_id)
+    if qs is None:
+        abort(404, description="Practice set not found")
+    out = [q.to_dict() for q in qs]
+    attach_audio_urls(q["listening_track"] for q in out if "listening_track" in q)
+    return jsonify(out)
+
+
+def _ensure_bundle_access(bundle: bundles.Bundle) -> None:
+    # Same rule as starting a practice session on the set.
+    if not bundle.is_premium:
+        return
+    user_id = get_current_user_id()
+    profile = get_supabase().table("profiles").select("is_premium").eq("user_id", user_id).single().execute().data
+    if not (profile and profile.get("is_premium")):
+        abort(403, description="Premium required for this practice set")
+
+
+@content_bp.get("/practice-sets/<ps_id>/bundle")
+@priority("heavy")
+def practice_set_bundle(ps_id: str):
+    """
+    Everything needed to run a practice set in one gzip'd JSON document.
+    """
+    bundle = bundles.current(ps_id)
+    if bundle is None:
+        abort(404, description="Practice set not found")
+    _ensure_bundle_access(bundle)
+    return bundles.response(bundle, immutable=False)
+
+
+@content_bp.get("/bundles/<ps_id>/<digest>")
+def practice_set_bundle_artifact(ps_id: str, digest: str):
+    bundle = bundles.by_digest(ps_id, digest)
+    if bundle is None:
+        abort(404, description="Bundle not found")
+    _ensure_bundle_access(bundle)
+    return bundles.response(bundle, immutable=True)
+
+
+def _has_completed_set(sb, user_id: str, ps_id: str) -> bool:
+    rows = (
+        sb.table("practice_sessions")
         .select("id")
-        .eq("id", ps_id)
-        .single()
+        .eq("user_id", user_id)
+        .eq("practice_set_id", ps_id)
+        .not_.is_("completed_at", "null")
+        .limit(1)
         .execute()
         .data
     )
-    if not ps:
-        abort(404, description="Practice set not found")
-
-    qs = (
-        sb.table("questions")
-        .select(
-            "id,type,order_index,prompt,passage,max_score,"
-            "listening_track_id,audio_start_sec,audio_end_sec"
-        )
+    if rows:
+        return True
+    archived = (
+        sb.table(archive.PRACTICE_ARCHIVE_TABLE)
+        .select("session_id")
+        .eq("user_id", user_id)
         .eq("practice_set_id", ps_id)
-        .order("order_index")
+        .limit(1)
         .execute()
         .data
-        or []
     )
-
-    # Map listening tracks
-    track_ids = [q["listening_track_id"] for q in qs if q.get("listening_track_id")]
-    track_map = {}
-    if track_ids:
-        tracks = (
-            sb.table("listening_tracks")
-            .select("id,title,audio_path,duration_seconds")
-            .in_("id", track_ids)
-            .execute()
-            .data
-            or []
-        )
-        track_map = {t["id"]: t for t in tracks}
-
-    # Attach options and listening track
-    for q in qs:
-        opts = (
-            sb.table("question_options")
-            .select("id,option_index,text")
-            .eq("question_id", q["id"])
-            .order("option_index")
-            .execute()
-            .data
-            or []
-        )
-        q["options"] = opts
-        if q.get("listening_track_id") and q["listening_track_id"] in track_map:
-            q["listening_track"] = track_map[q["listening_track_id"]]
-
-    return jsonify(qs)
+    return bool(archived)
+
+
+@content_bp.get("/practice-sets/<ps_id>/item-stats")
+def practice_set_item_stats(ps_id: str):
+    """
+    Per-question correctness rate and option pick counts (see item_stats.py).
+    Option pick rates point at the answer key, so they are only included
+    once the user has completed the set.
+    """
+    user_id = get_current_user_id()
+    stats = item_stats.practice_set_stats(ps_id)
+    if stats is None:
+        abort(404, description="Practice set not found")
+    if not _has_completed_set(get_supabase(), user_id, ps_id):
+        stats = [{k: v for k, v in q.items() if k != "options"} for q in stats]
+    return jsonify({"practice_set_id": ps_id, "questions": stats})
+
+
+@content_bp.get("/search")
+def search_content():
+    """
+    Ranked full-text search over questions, practice sets and FAQs, served
+    from the in-memory index. `q` is required; optional `kind` (comma
+    separated: question, practice_set, faq), `skill` (slug) and `limit`.
+    """
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        abort(400, description="q required")
+    kinds = {k for k in (request.args.get("kind") or "").split(",") if k} or None
+    if kinds and not kinds <= {"question", "practice_set", "faq"}:
+        abort(400, description="kind must be question, practice_set or faq")
+    limit = min(max(request.args.get("limit", 20, type=int), 1), search.SEARCH_MAX_LIMIT)
+    results = search.search(query, limit, kinds, request.args.get("skill") or None)
+    return jsonify({"query": query, "results": results})
+
+
+@content_bp.get("/catalog/changes")
+@priority("heavy")
+def catalog_changes():
+    """
+    Delta sync: everything changed after `?since=<version>` (0 = full
+    catalog). Call again with the returned `version` while `has_more`.
+    Changes from the last few seconds can come again in the next sync.
+    """
+    since = request.args.get("since", 0, type=int)
+    if since < 0:
+        abort(400, description="since must be a non-negative catalog version")
+    out = catalog.changes(since)
+    attach_audio_urls(
+        q["listening_track"] for ps in out["practice_sets"] for q in ps["questions"] if "listening_track" in q
+    )
+    return jsonify(out)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+import events
+from utils import get_current_user_id
+from admission import priority
+
+events_bp = Blueprint("events", __name__, url_prefix="/api")
+
+HEARTBEAT_SECONDS = 15
+# Streams are closed after this long; EventSource clients reconnect with
+# Last-Event-ID and get anything they missed replayed. On sync/gthread
+# gunicorn workers an open stream holds a request thread for this whole
+# time (the "stream" admission class caps how many can), so the default is
+# short: with `-k gevent` streams are cheap and this can be raised. Clients
+# shed with 503 here (or without EventSource) use /api/events/poll instead.
+MAX_STREAM_SECONDS = float(os.getenv("EVENTS_MAX_STREAM_SECONDS", "60"))
+POLL_LIMIT = 100
+
+
+@events_bp.get("/events")
+@priority("stream")
+def event_stream():
+    """
+    Server-Sent Events stream of the user's evaluation status updates.
+    Optional `?session_id=` narrows it to one practice/exam session and
+    `?ref_id=` to one answer or speaking attempt. Practice speaking attempts
+    belong to no session (their events carry session_id null), so follow
+    those with `ref_id=<attempt id>`.
+    """
+    user_id = get_current_user_id()
+    session_id = request.args.get("session_id")
+    ref_id = request.args.get("ref_id")
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    sub = events.subscribe(user_id, int(last_id) if last_id and last_id.isdigit() else None)
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            deadline = time.monotonic() + MAX_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                event = sub.get(timeout=HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                if session_id and event["data"].get("session_id") != session_id:
+                    continue
+                if ref_id and event["data"].get("ref_id") != ref_id:
+                    continue
+                payload = json.dumps(event["data"], separators=(",", ":"))
+                # Events the outbox could not store have no id to resume from.
+                event_id = f"id: {event['id']}\n" if event["id"] is not None else ""
+                yield f"{event_id}event: {event['type']}\ndata: {payload}\n\n"
+        finally:
+            events.unsubscribe(sub)
+
+    resp = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@events_bp.get("/events/poll")
+def poll_events():
+    """
+    The evaluation status updates `/api/events` would stream, as one JSON
+    page: events after `?after=<event id>` (default 0), with the same
+    `session_id` / `ref_id` filters. Pass the returned `next_after` back.
+    It stays below events younger than the outbox's commit-lag window, so
+    those come again on the next poll: dedupe by `id`.
+    """
+    user_id = get_current_user_id()
+    after = request.args.get("after", 0, type=int)
+    session_id = request.args.get("session_id")
+    ref_id = request.args.get("ref_id")
+    page = events.events_after(user_id, after, POLL_LIMIT)
+
+    # An event committed late can have a lower id than one already seen, so
+    # the cursor only moves past events older than the overlap window.
+    settled = datetime.now(timezone.utc) - timedelta(seconds=events.POLL_OVERLAP_SECONDS)
+    next_after = after
+    for event in page:
+        if datetime.fromisoformat(event["created_at"]) >= settled:
+            break
+        next_after = event["id"]
+    items = [
+        {"id": e["id"], "type": e["type"], "data": e["data"]}
+        for e in page
+        if (not session_id or e["data"].get("session_id") == session_id)
+        and (not ref_id or e["data"].get("ref_id") == ref_id)
+    ]
+    return jsonify({"events": items, "next_after": next_after})
@@ -1,11 +1,27 @@
 from __future__ import annotations
-from flask import Blueprint, jsonify, request, abort
+from flask import Blueprint, Response, jsonify, request, abort, stream_with_context
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+import itertools
+import logging
+import os
 from supabase_client import get_supabase
-from utils import get_current_user_id, to_jsonable
+from events import publish, run_evaluation, submit_evaluation, wants_async
+from idempotency import idempotent
+from utils import get_current_user_id, iter_json_object, to_jsonable
 from ai_helpers import evaluate_ielts_writing
+from exam_summary import iter_exam_sections
+from models import ExamAnswer
+import snapshots
+import catalog
+import metrics
+from admission import priority
 
 exam_bp = Blueprint("exam", __name__, url_prefix="/api")
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent model calls when grading a whole writing section.
+WRITING_BATCH_CONCURRENCY = int(os.getenv("WRITING_BATCH_CONCURRENCY", "4"))
 
 
 def _ensure_premium(user_id: str):
@@ -51,6 +67,7 @@ def create_exam_section():
 
 
 @exam_bp.post("/exam-answers")
+@idempotent
 def add_exam_answer():
     user_id = get_current_user_id()
     body = request.get_json(force=True) or {}
@@ -87,6 +104,8 @@ def add_exam_answer():
 
 
 @exam_bp.post("/writing-eval/exam/<exam_answer_id>")
+@priority("ai")
+@idempotent
 def create_writing_eval_for_exam(exam_answer_id: str):
     user_id = get_current_user_id()
     sb = get_supabase()
@@ -119,39 +138,44 @@ def create_writing_eval_for_exam(exam_answer_id: str):
     if not q:
         abort(404, description="Question not found")
 
-    eval_res = evaluate_ielts_writing(
-        q.get("prompt") or "",
-        ans.get("answer_text") or "",
-        q.get("task_type") or "Task 2",
-        target_band,
-    )
-
-    row = (
-        sb.table("writing_evaluations")
-        .insert(
-            {
-                "mode": "exam",
-                "practice_answer_id": None,
-                "exam_answer_id": exam_answer_id,
-                "exam_session_id": ans["exam_session_id"],
-                "exam_section_result_id": ans["section_result_id"],
-                "user_id": user_id,
-                "question_id": q["id"],
-                "overall_band": eval_res.get("overall_band"),
-                "band_task_response": eval_res.get("task_response"),
-                "band_coherence": eval_res.get("coherence_and_cohesion"),
-                "band_lexical": eval_res.get("lexical_resource"),
-                "band_grammar": eval_res.get("grammatical_range_and_accuracy"),
-                "is_good_enough": eval_res.get("is_good_enough"),
-                "feedback_short": eval_res.get("feedback_short"),
-                "feedback_detailed": eval_res.get("feedback_detailed"),
-                "model_answer": eval_res.get("model_answer"),
-            }
+    def work() -> dict:
+        import essay_index  # lazy: keeps numpy off the startup path
+
+        text = ans.get("answer_text") or ""
+        key = f"exam:{exam_answer_id}"
+        columns = essay_index.evaluation_columns(
+            get_supabase(),
+            q["id"],
+            key,
+            text,
+            user_id,
+            lambda: evaluate_ielts_writing(
+                q.get("prompt") or "", text, q.get("task_type") or "Task 2", target_band, mode="exam"
+            ),
         )
-        .execute()
-        .data[0]
-    )
-    return jsonify(to_jsonable(row)), 201
+
+        row = essay_index.insert_evaluations(
+            get_supabase(),
+            [
+                {
+                    "mode": "exam",
+                    "practice_answer_id": None,
+                    "exam_answer_id": exam_answer_id,
+                    "exam_session_id": ans["exam_session_id"],
+                    "exam_section_result_id": ans["section_result_id"],
+                    "user_id": user_id,
+                    "question_id": q["id"],
+                    **columns,
+                }
+            ],
+        )[0]
+        essay_index.record(q["id"], key, text, row["id"], user_id)
+        snapshots.refresh_async(ans["exam_session_id"])
+        return to_jsonable(row)
+
+    if wants_async():
+        return jsonify(submit_evaluation(user_id, "writing", exam_answer_id, ans["exam_session_id"], work)), 202
+    return jsonify(run_evaluation(user_id, "writing", exam_answer_id, ans["exam_session_id"], work)), 201
 
 
 @exam_bp.post("/exam-sections/<section_id>/complete")
@@ -179,7 +203,141 @@ def complete_section(section_id: str):
     return jsonify(updated)
 
 
+@exam_bp.post("/exam-sections/<section_id>/writing-eval")
+@priority("ai")
+@idempotent
+def create_writing_evals_for_section(section_id: str):
+    """
+    Grade every writing answer of an exam section in one round: one query for
+    the answers, concurrent model calls, one bulk insert.
+    """
+    user_id = get_current_user_id()
+    sb = get_supabase()
+    body = request.get_json(silent=True) or {}
+    target_band = float(body.get("target_band") or 7.0)
+
+    sec = (
+        sb.table("exam_section_results")
+        .select("id,exam_session_id,skill_id")
+        .eq("id", section_id)
+        .single()
+        .execute()
+        .data
+    )
+    if not sec:
+        abort(404, description="Section not found")
+    sess = sb.table("exam_sessions").select("user_id").eq("id", sec["exam_session_id"]).single().execute().data
+    if not sess or sess["user_id"] != user_id:
+        abort(404, description="Exam session not found")
+    skill = sb.table("skills").select("slug").eq("id", sec["skill_id"]).single().execute().data
+    if not skill or skill["slug"] != "writing":
+        abort(400, description="Not a writing section")
+
+    answers = ExamAnswer.from_rows(
+        sb.table("exam_answers")
+        .select("id,exam_session_id,section_result_id,question_id,answer_text")
+        .eq("section_result_id", section_id)
+        .execute()
+        .data
+        or []
+    )
+    already = {
+        w["exam_answer_id"]
+        for w in (
+            sb.table("writing_evaluations")
+            .select("exam_answer_id")
+            .eq("exam_section_result_id", section_id)
+            .execute()
+            .data
+            or []
+        )
+    }
+    questions = catalog.questions_by_id(a.question_id for a in answers)
+    pending = [
+        a
+        for a in answers
+        if a.id not in already and a.answer_text and questions.get(a.question_id) is not None
+    ]
+
+    import essay_index  # lazy: keeps numpy off the startup path
+
+    def _evaluate(a: ExamAnswer):
+        q = questions[a.question_id]
+        return essay_index.evaluation_columns(
+            sb,
+            a.question_id,
+            f"exam:{a.id}",
+            a.answer_text or "",
+            user_id,
+            lambda: evaluate_ielts_writing(
+                q.prompt or "", a.answer_text or "", q.task_type or "Task 2", target_band, mode="exam"
+            ),
+        )
+
+    rows = []
+    errors = []
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(WRITING_BATCH_CONCURRENCY, len(pending))) as pool:
+            futures = {pool.submit(_evaluate, a): a for a in pending}
+            for future, a in futures.items():
+                try:
+                    columns = future.result()
+                except Exception:
+                    # The exception text can carry SDK / PostgREST internals;
+                    # it goes to the log, the client gets a stable code.
+                    logger.exception("Writing evaluation failed for exam answer %s", a.id)
+                    metrics.incr("exam.writing_batch.failures")
+                    errors.append({"exam_answer_id": a.id, "error": "evaluation_failed"})
+                    continue
+                rows.append(
+                    {
+                        "mode": "exam",
+                        "practice_answer_id": None,
+                        "exam_answer_id": a.id,
+                        "exam_session_id": sec["exam_session_id"],
+                        "exam_section_result_id": section_id,
+                        "user_id": user_id,
+                        "question_id": a.question_id,
+                        **columns,
+                    }
+                )
+
+    inserted = essay_index.insert_evaluations(sb, rows) if rows else []
+    texts = {a.id: a.answer_text for a in pending}
+    for r in inserted or []:
+        key = f"exam:{r['exam_answer_id']}"
+        essay_index.record(r["question_id"], key, texts.get(r["exam_answer_id"]) or "", r["id"], user_id)
+        publish(
+            user_id,
+            "evaluation",
+            {
+                "kind": "writing",
+                "ref_id": r["exam_answer_id"],
+                "session_id": sec["exam_session_id"],
+                "status": "completed",
+                "result": to_jsonable(r),
+            },
+        )
+    if inserted:
+        snapshots.refresh_async(sec["exam_session_id"])
+    # 201 when anything was graded; 502 when every pending essay failed
+    # (the client should retry); 200 when there was nothing left to grade.
+    status = 201 if inserted else 502 if errors else 200
+    return (
+        jsonify(
+            {
+                "section_result_id": section_id,
+                "evaluations": [to_jsonable(r) for r in inserted or []],
+                "skipped_already_evaluated": sum(1 for a in answers if a.id in already),
+                "errors": errors,
+            }
+        ),
+        status,
+    )
+
+
 @exam_bp.post("/exam-sessions/<exam_id>/complete")
+@priority("heavy")
 def complete_exam(exam_id: str):
     user_id = get_current_user_id()
     body = request.get_json(silent=True) or {}
@@ -213,184 +371,37 @@ def complete_exam(exam_id: str):
         .data[0]
     )
 
-    # Build section summaries
-    sections = (
-        sb.table("exam_section_results")
-        .select("id,skill_id,time_taken_seconds,total_questions,correct_questions,score")
-        .eq("exam_session_id", exam_id)
-        .execute()
-        .data
-        or []
-    )
-
-    out_sections = []
-
-    for s in sections:
-        # skill slug
-        skill = (
-            sb.table("skills")
-            .select("slug")
-            .eq("id", s["skill_id"])
-            .single()
-            .execute()
-            .data
-        )
-
-        # raw answers for this section
-        answers = (
-            sb.table("exam_answers")
-            .select("id,question_id,option_id,answer_text,is_correct")
-            .eq("section_result_id", s["id"])
-            .execute()
-            .data
-            or []
-        )
-
-        writing_evals = (
-            sb.table("writing_evaluations")
-            .select("*")
-            .eq("exam_section_result_id", s["id"])
-            .execute()
-            .data
-            or []
-        )
-        writing_by_answer = {
-            w.get("exam_answer_id"): w for w in writing_evals if w.get("exam_answer_id")
-        }
-
-        # simple caches to avoid querying the same question over and over
-        question_cache: dict[str, dict] = {}
-        correct_option_cache: dict[str, dict | None] = {}
-        options_cache: dict[str, list] = {}
-
-        for a in answers:
-            qid = a["question_id"]
-
-            # question prompt (cached)
-            if qid not in question_cache:
-                q = (
-                    sb.table("questions")
-                    .select("prompt")
-                    .eq("id", qid)
-                    .single()
-                    .execute()
-                    .data
-                )
-                question_cache[qid] = q or {}
-            q = question_cache[qid]
-            a["prompt"] = q.get("prompt")
-
-            # user answer text
-            user_answer = a.get("answer_text")
-            user_option_text = None
-
-            if a.get("option_id"):
-                opt = (
-                    sb.table("question_options")
-                    .select("text,question_id")
-                    .eq("id", a["option_id"])
-                    .single()
-                    .execute()
-                    .data
-                )
-                if opt:
-                    user_option_text = opt["text"]
-                    user_answer = user_option_text
-
-            a["user_answer"] = user_answer
-
-            # correct option text (cached per question)
-            if qid not in correct_option_cache:
-                opts = (
-                    sb.table("question_options")
-                    .select("text,is_correct,option_index")
-                    .eq("question_id", qid)
-                    .order("option_index")
-                    .execute()
-                    .data
-                    or []
-                )
-                correct_opt = None
-                for o in opts:
-                    if o.get("is_correct"):
-                        correct_opt = o
-                        break
-                correct_option_cache[qid] = correct_opt
-                options_cache[qid] = opts
-
-            correct_opt = correct_option_cache[qid]
-            correct_text = correct_opt["text"] if correct_opt else None
-
-            a["correct_option_text"] = correct_text
-            a["correct_answer"] = correct_text  # alias for frontend
-            a["options"] = options_cache.get(qid, [])
-
-            # we don't need to expose option_id to the client
-            a.pop("option_id", None)
-
-            w_eval = writing_by_answer.get(a["id"])
-            a["writing_eval"] = to_jsonable(w_eval) if w_eval else None
-            a.pop("id", None)
-
-        # speaking attempts (if any) tied to this section
-        speaking_attempts = (
-            sb.table("speaking_attempts")
-            .select("id,audio_path,duration_seconds,question_id")
-            .eq("exam_section_result_id", s["id"])
-            .execute()
-            .data
-            or []
-        )
-        attempt_ids = [a["id"] for a in speaking_attempts]
-        speaking_evals = (
-            sb.table("speaking_evaluations")
-            .select("*")
-            .in_("attempt_id", attempt_ids or [""])
-            .execute()
-            .data
-            or []
-        )
-        eval_by_attempt = {e["attempt_id"]: e for e in speaking_evals}
-        question_prompt_cache: dict[str, str | None] = {}
-
-        speaking_summary = []
-        for at in speaking_attempts:
-            ev = eval_by_attempt.get(at["id"])
-            qid = at.get("question_id")
-            if qid not in question_prompt_cache:
-                qp = (
-                    sb.table("questions")
-                    .select("prompt")
-                    .eq("id", qid)
-                    .single()
-                    .execute()
-                    .data
-                )
-                question_prompt_cache[qid] = qp.get("prompt") if qp else None
-            speaking_summary.append(
-                {
-                    **at,
-                    "question_prompt": question_prompt_cache.get(qid),
-                    "evaluation": to_jsonable(ev) if ev else None,
-                }
-            )
-
-        out_sections.append(
-            {
-                "section_result_id": s["id"],
-                "skill_slug": skill["slug"],
-                "time_taken_seconds": s.get("time_taken_seconds"),
-                "total_questions": s.get("total_questions"),
-                "correct_questions": s.get("correct_questions"),
-                "score": s.get("score"),
-                "answers": answers,
-                "writing_evaluations": [to_jsonable(w) for w in writing_evals],
-                "speaking_attempts": speaking_summary,
-            }
-        )
-
-    summary = {
-        "exam_session": updated,
-        "sections": out_sections,
-    }
-    return jsonify(summary)
+    # Stream sections as they are built (chunked transfer): time-to-first-byte
+    # no longer waits for the whole exam, and peak memory is one section. The
+    # same chunks are gzip'd on the fly into the result snapshot.
+    sections = iter_exam_sections(sb, exam_id)
+    # Build the first section before the 200 goes out, so a failing query
+    # (the common case) still surfaces as an error status.
+    first = list(itertools.islice(sections, 1))
+
+    def generate():
+        encoder = snapshots.StreamingEncoder()
+        try:
+            for chunk in iter_json_object({"exam_session": updated}, "sections", itertools.chain(first, sections)):
+                encoder.feed(chunk)
+                yield chunk
+        except Exception:
+            # Headers are already sent: the client sees a truncated body (not
+            # valid JSON) and no snapshot is stored, so /result stays 404.
+            logger.exception("Exam %s summary stream aborted after the response started", exam_id)
+            return
+        snapshots.save_blob(exam_id, user_id, encoder.finish(), sb)
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+@exam_bp.get("/exam-sessions/<exam_id>/result")
+def get_exam_result(exam_id: str):
+    """
+    Serve the summary stored when the exam was completed (one read).
+    """
+    user_id = get_current_user_id()
+    resp = snapshots.response(get_supabase(), exam_id, user_id)
+    if resp is None:
+        abort(404, description="Exam result not found")
+    return resp
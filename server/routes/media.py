@@ -0,0 +1,63 @@
+from __future__ import annotations
+from flask import Blueprint, abort, send_file
+from catalog import CATALOG_TTL_SECONDS, TTLCache
+from storage_urls import is_own_speaking_path, local_audio_file
+from supabase_client import get_supabase
+from utils import get_current_user_id
+
+media_bp = Blueprint("media", __name__, url_prefix="/api")
+
+AUDIO_MAX_AGE_SECONDS = 24 * 3600
+
+# audio_path -> whether it is a listening track. Only paths of files that
+# exist under LOCAL_AUDIO_DIR are looked up, so the keys stay bounded.
+_listening_paths = TTLCache(CATALOG_TTL_SECONDS)
+
+
+def _is_listening_track(audio_path: str) -> bool:
+    def load() -> bool:
+        rows = (
+            get_supabase()
+            .table("listening_tracks")
+            .select("id")
+            .eq("audio_path", audio_path)
+            .limit(1)
+            .execute()
+            .data
+            or []
+        )
+        return bool(rows)
+
+    return _listening_paths.get_or_load(audio_path, load)
+
+
+@media_bp.get("/audio/<path:audio_path>")
+def get_audio(audio_path: str):
+    # Only locally-stored assets are served here; storage-backed tracks are
+    # returned to the client as signed URLs instead.
+    path = local_audio_file(audio_path)
+    if path is None:
+        abort(404, description="Audio not found")
+    # Listening tracks are public catalog content; anything else (speaking
+    # recordings) is only served to the user who recorded it, from their own
+    # folder, and must never be stored by shared caches.
+    if _is_listening_track(audio_path):
+        # conditional=True makes Werkzeug answer Range requests with 206 partial
+        # content, so players can seek to `audio_start_sec` without a full download.
+        return send_file(path, conditional=True, max_age=AUDIO_MAX_AGE_SECONDS)
+    user_id = get_current_user_id()
+    owned = is_own_speaking_path(user_id, audio_path) and (
+        get_supabase()
+        .table("speaking_attempts")
+        .select("id")
+        .eq("audio_path", audio_path)
+        .eq("user_id", user_id)
+        .limit(1)
+        .execute()
+        .data
+    )
+    if not owned:
+        abort(404, description="Audio not found")
+    resp = send_file(path, conditional=True)
+    resp.headers["Cache-Control"] = "private, no-store"
+    return resp
@@ -2,8 +2,14 @@ from __future__ import annotations
 from flask import Blueprint, jsonify, request, abort
 from datetime import datetime, timezone
 from supabase_client import get_supabase
-from utils import get_current_user_id, to_jsonable
+from events import run_evaluation, submit_evaluation, wants_async
+from idempotency import idempotent
+from utils import get_current_user_id, is_uuid, to_jsonable
 from ai_helpers import evaluate_ielts_writing
+from models import PracticeAnswer, WritingEvaluation
+import archive
+import catalog
+from admission import priority
 
 practice_bp = Blueprint("practice", __name__, url_prefix="/api")
 
@@ -14,6 +20,26 @@ def _get_profile(user_id: str):
     return res.data
 
 
+@practice_bp.get("/recommendations/practice-sets")
+def recommended_practice_sets():
+    """
+    Next best practice sets for the user, optionally for one `?skill=` slug.
+    """
+    user_id = get_current_user_id()
+    limit = max(1, min(request.args.get("limit", 5, type=int), 20))
+    profile = _get_profile(user_id)
+
+    import recommendations  # lazy: keeps numpy off the startup path
+
+    items = recommendations.recommend(
+        user_id,
+        request.args.get("skill"),
+        limit,
+        include_premium=bool(profile and profile.get("is_premium")),
+    )
+    return jsonify({"items": items})
+
+
 @practice_bp.post("/practice-sessions")
 def create_practice_session():
     user_id = get_current_user_id()
@@ -42,6 +68,7 @@ def create_practice_session():
 
 
 @practice_bp.post("/practice-sessions/<session_id>/answers")
+@idempotent
 def add_practice_answer(session_id: str):
     user_id = get_current_user_id()
     sb = get_supabase()
@@ -76,6 +103,8 @@ def add_practice_answer(session_id: str):
 
 
 @practice_bp.post("/writing-eval/practice/<practice_answer_id>")
+@priority("ai")
+@idempotent
 def create_writing_eval_for_practice(practice_answer_id: str):
     user_id = get_current_user_id()
     sb = get_supabase()
@@ -108,218 +137,160 @@ def create_writing_eval_for_practice(practice_answer_id: str):
     if not q:
         abort(404, description="Question not found")
 
-    eval_res = evaluate_ielts_writing(
-        q.get("prompt") or "",
-        ans.get("answer_text") or "",
-        q.get("task_type") or "Task 2",
-        target_band,
-    )
-    print("Writing eval result:", eval_res)
-
-    row = (
-        sb.table("writing_evaluations")
-        .insert(
-            {
-                "mode": "practice",
-                "practice_answer_id": practice_answer_id,
-                "exam_answer_id": None,
-                "exam_session_id": None,
-                "exam_section_result_id": None,
-                "user_id": user_id,
-                "question_id": q["id"],
-                "overall_band": eval_res.get("overall_band"),
-                "band_task_response": eval_res.get("task_response"),
-                "band_coherence": eval_res.get("coherence_and_cohesion"),
-                "band_lexical": eval_res.get("lexical_resource"),
-                "band_grammar": eval_res.get("grammatical_range_and_accuracy"),
-                "is_good_enough": eval_res.get("is_good_enough"),
-                "feedback_short": eval_res.get("feedback_short"),
-                "feedback_detailed": eval_res.get("feedback_detailed"),
-                "model_answer": eval_res.get("model_answer"),
-            }
+    def work() -> dict:
+        import essay_index  # lazy: keeps numpy off the startup path
+
+        text = ans.get("answer_text") or ""
+        key = f"practice:{practice_answer_id}"
+        columns = essay_index.evaluation_columns(
+            get_supabase(),
+            q["id"],
+            key,
+            text,
+            user_id,
+            lambda: evaluate_ielts_writing(q.get("prompt") or "", text, q.get("task_type") or "Task 2", target_band),
         )
-        .execute()
-        .data[0]
-    )
-    print("Inserted writing eval:", row)
-    return jsonify(to_jsonable(row)), 201
+        print("Writing eval result:", columns)
+
+        row = essay_index.insert_evaluations(
+            get_supabase(),
+            [
+                {
+                    "mode": "practice",
+                    "practice_answer_id": practice_answer_id,
+                    "exam_answer_id": None,
+                    "exam_session_id": None,
+                    "exam_section_result_id": None,
+                    "user_id": user_id,
+                    "question_id": q["id"],
+                    **columns,
+                }
+            ],
+        )[0]
+        print("Inserted writing eval:", row)
+        essay_index.record(q["id"], key, text, row["id"], user_id)
+        return to_jsonable(row)
+
+    if wants_async():
+        return jsonify(submit_evaluation(user_id, "writing", practice_answer_id, ans["session_id"], work)), 202
+    return jsonify(run_evaluation(user_id, "writing", practice_answer_id, ans["session_id"], work)), 201
 
 
 @practice_bp.post("/practice-sessions/<session_id>/complete")
 def complete_practice_session(session_id: str):
     user_id = get_current_user_id()
     sb = get_supabase()
-
-    # 1) Validate session ownership
-    sess = (
-        sb.table("practice_sessions")
-        .select("id,user_id,practice_set_id")
-        .eq("id", session_id)
-        .single()
-        .execute()
-        .data
-    )
-    if not sess or sess["user_id"] != user_id:
-        abort(404, description="Session not found")
-
     body = request.get_json(silent=True) or {}
-    time_taken = body.get("time_taken_seconds") or 0
-    ps_id = sess["practice_set_id"]
-
-    # 2) Load all answers for this session
-    answers_raw = (
-        sb.table("practice_answers")
-        .select("id, question_id, option_id, answer_text, is_correct")
-        .eq("session_id", session_id)
-        .execute()
-        .data
-        or []
-    )
-
-    answer_ids = [a["id"] for a in answers_raw]
-    writing_evals = (
-        sb.table("writing_evaluations")
-        .select("*")
-        .in_("practice_answer_id", answer_ids if answer_ids else ["_none_"])
-        .execute()
-        .data
-        or []
-    )
-    writing_by_answer = {w["practice_answer_id"]: w for w in writing_evals}
-
-    # 3) Fetch all questions + options for this practice set
-    qrows = (
-        sb.table("questions")
-        .select("id, prompt, question_options(id, text, is_correct)")
-        .eq("practice_set_id", ps_id)
-        .execute()
-        .data
-        or []
-    )
-    qmap = {q["id"]: q for q in qrows}
+    # The RPC takes whole seconds (an integer column); clients may send
+    # fractional ones.
+    raw_time_taken = body.get("time_taken_seconds") or 0
+    try:
+        time_taken = None if isinstance(raw_time_taken, bool) else round(float(raw_time_taken))
+    except (TypeError, ValueError, OverflowError):
+        time_taken = None
+    if time_taken is None or not 0 <= time_taken < 2**31:
+        abort(400, description="time_taken_seconds must be a non-negative number of seconds")
+    if not is_uuid(session_id):
+        abort(404, description="Session not found")
 
-    # 4) Build enriched answer list
+    # 1) Score + stamp the session and load answers / evaluations / set info
+    #    in one transaction (migrations/0004_transaction_rpcs.sql).
+    from postgrest.exceptions import APIError  # lazy: heavy import
+
+    try:
+        result = sb.rpc(
+            "complete_practice_session",
+            {"p_session_id": session_id, "p_user_id": user_id, "p_time_taken_seconds": time_taken},
+        ).execute().data
+    except APIError as e:
+        # P0002: no such row for this user.
+        if getattr(e, "code", None) == "P0002":
+            abort(404, description="Session not found")
+        raise
+
+    answers_raw = PracticeAnswer.from_rows(result["answers"])
+    writing_evals = WritingEvaluation.from_rows(result["writing_evaluations"])
+    writing_by_answer = {w.practice_answer_id: w for w in writing_evals}
+
+    # 2) All questions + options for this practice set (shared catalog cache)
+    ps = result["practice_set"]
+    questions = catalog.practice_set_questions(ps["id"]) or ()
+    qmap = {q.id: q for q in questions}
+
+    # 3) Build enriched answer list
     enriched_answers = []
     for ans in answers_raw:
-        qid = ans["question_id"]
-        q = qmap.get(qid)
-        w_eval = writing_by_answer.get(ans["id"])
+        q = qmap.get(ans.question_id)
+        w_eval = writing_by_answer.get(ans.id)
 
-        prompt = q["prompt"] if q else None
-        raw_opts = q.get("question_options", []) if q else []
-
-        option_map = {opt["id"]: opt for opt in raw_opts}
-        user_option = option_map.get(ans["option_id"])
-        user_option_text = user_option["text"] if user_option else None
-
-        correct_option_text = None
-        for opt in raw_opts:
-            if opt.get("is_correct") is True:
-                correct_option_text = opt["text"]
-                break
-
-        user_answer_final = ans["answer_text"] or user_option_text
+        user_option = q.option(ans.option_id) if q else None
+        user_option_text = user_option.text if user_option else None
+        correct_opt = q.correct_option if q else None
+        correct_option_text = correct_opt.text if correct_opt else None
 
         enriched_answers.append(
             {
-                "question_id": qid,
-                "prompt": prompt,
-                "user_answer": user_answer_final,
+                "question_id": ans.question_id,
+                "prompt": q.prompt if q else None,
+                "user_answer": ans.answer_text or user_option_text,
                 "user_option_text": user_option_text,
-                "answer_text": ans["answer_text"],
-                "is_correct": ans["is_correct"],
+                "answer_text": ans.answer_text,
+                "is_correct": ans.is_correct,
                 "correct_option_text": correct_option_text,
                 "correct_answer": correct_option_text,  # alias for frontend
-                "writing_eval": to_jsonable(w_eval) if w_eval else None,
+                "writing_eval": w_eval.to_dict() if w_eval else None,
             }
         )
 
-    # 5) Calculate stats
-    total_q = (
-        sb.table("questions")
-        .select("id", count="exact")
-        .eq("practice_set_id", ps_id)
-        .execute()
-        .count
-        or 0
-    )
-    total_correct = sum(1 for a in answers_raw if a.get("is_correct") is True)
-    completed_at = datetime.now(timezone.utc).isoformat()
-    score = float(total_correct) / total_q * 100 if total_q else 0.0
-
-    # 6) Update session meta
-    sb.table("practice_sessions").update(
-        {
-            "completed_at": completed_at,
-            "time_taken_seconds": time_taken,
-            "total_questions": total_q,
-            "correct_questions": total_correct,
-            "score": score,
-        }
-    ).eq("id", session_id).execute()
-
-    # 7) Get practice set & skill
-    ps = (
-        sb.table("practice_sets")
-        .select("id,title,skill_id")
-        .eq("id", ps_id)
-        .single()
-        .execute()
-        .data
-    )
-    skill = (
-        sb.table("skills")
-        .select("slug, name")
-        .eq("id", ps["skill_id"])
-        .single()
-        .execute()
-        .data
-    )
-
-    # 8) Final response
+    # 4) Final response
     return jsonify(
         {
-            "practice_set": {
-                "id": ps["id"],
-                "title": ps["title"],
-                "skill_slug": skill["slug"],
-                "skill_name": skill.get("name"),
-            },
+            "practice_set": ps,
             "stats": {
-                "total_questions": total_q,
-                "correct_questions": total_correct,
+                "total_questions": result["total_questions"],
+                "correct_questions": result["correct_questions"],
                 "time_taken_seconds": time_taken,
-                "score": score,
+                "score": float(result["score"]),
             },
             "answers": enriched_answers,
-            "writing_evaluations": [to_jsonable(w) for w in writing_evals],
-            "completed_at": completed_at,
+            "writing_evaluations": [w.to_dict() for w in writing_evals],
+            "completed_at": result["completed_at"],
         }
     )
 
 
-@practice_bp.get("/practice-sessions/recent")
-def recent_sessions():
-    user_id = get_current_user_id()
-    sb = get_supabase()
+def recent_practice_sessions(sb, user_id: str, limit: int = 10) -> list[dict]:
+    """
+    The user's latest practice sessions with set title and skill slug
+    attached (one batched set lookup; skills come from the catalog cache).
+    """
     rows = (
         sb.table("practice_sessions")
         .select("id,practice_set_id,completed_at,total_questions,correct_questions,score")
         .eq("user_id", user_id)
         .order("completed_at", desc=True)
-        .limit(10)
+        .limit(limit)
         .execute()
         .data
         or []
     )
-    # Attach practice set title and skill slug
-    out = []
+    if len(rows) < limit:
+        # Older history has been moved to the archive (always the oldest sessions).
+        rows += archive.practice_sessions(sb, user_id, limit - len(rows))
+    set_ids = list({r["practice_set_id"] for r in rows})
+    sets: dict[str, dict] = {}
+    if set_ids:
+        ps_rows = sb.table("practice_sets").select("id,title,skill_id").in_("id", set_ids).execute().data or []
+        sets = {ps["id"]: ps for ps in ps_rows}
+    skill_slugs = {sk["id"]: sk["slug"] for sk in catalog.skills()}
     for r in rows:
-        ps = (
-            sb.table("practice_sets").select("title,skill_id").eq("id", r["practice_set_id"]).single().execute().data
-        )
-        skill = sb.table("skills").select("slug").eq("id", ps["skill_id"]).single().execute().data
-        r.update({"practice_set_title": ps["title"], "skill_slug": skill["slug"]})
-        out.append(r)
-    return jsonify(out)
+        ps = sets.get(r["practice_set_id"]) or {}
+        r.update({"practice_set_title": ps.get("title"), "skill_slug": skill_slugs.get(ps.get("skill_id"))})
+    return rows
+
+
+@practice_bp.get("/practice-sessions/recent")
+def recent_sessions():
+    user_id = get_current_user_id()
+    return jsonify(recent_practice_sessions(get_supabase(), user_id))
 
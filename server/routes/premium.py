@@ -1,17 +1,32 @@
 from __future__ import annotations
 from flask import Blueprint, jsonify, request, abort
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from supabase_client import get_supabase
-from utils import get_current_user_id
+from utils import get_current_user_id, is_uuid
 
 premium_bp = Blueprint("premium", __name__, url_prefix="/api")
 
 
+def active_plans(sb) -> list[dict]:
+    return sb.table("subscription_plans").select("id,name,description,price_cents,currency,billing_interval").eq("is_active", True).order("created_at", desc=True).execute().data or []
+
+
+def latest_subscription(sb, user_id: str) -> dict | None:
+    sub = (
+        sb.table("subscriptions")
+        .select("id,plan_id,status,current_period_start,current_period_end")
+        .eq("user_id", user_id)
+        .order("created_at", desc=True)
+        .limit(1)
+        .execute()
+        .data
+    )
+    return sub[0] if sub else None
+
+
 @premium_bp.get("/plans")
 def list_plans():
-    sb = get_supabase()
-    rows = sb.table("subscription_plans").select("id,name,description,price_cents,currency,billing_interval").eq("is_active", True).order("created_at", desc=True).execute().data or []
-    return jsonify(rows)
+    return jsonify(active_plans(get_supabase()))
 
 
 @premium_bp.post("/payments/session")
@@ -48,56 +63,30 @@ def create_payment_session():
 def confirm_payment_session(ps_id: str):
     user_id = get_current_user_id()
     sb = get_supabase()
-    # Mark payment as paid
-    paid = sb.table("payment_sessions").update({
-        "status": "paid",
-        "completed_at": datetime.now(timezone.utc).isoformat(),
-    }).eq("id", ps_id).eq("user_id", user_id).execute().data
-    if not paid:
+    if not is_uuid(ps_id):
         abort(404, description="Payment session not found")
-    payment = sb.table("payment_sessions").select("id,plan_id").eq("id", ps_id).single().execute().data
-    # Create subscription
-    now = datetime.now(timezone.utc)
-    sub = sb.table("subscriptions").insert({
-        "user_id": user_id,
-        "plan_id": payment["plan_id"],
-        "payment_session_id": ps_id,
-        "status": "active",
-        "current_period_start": now.isoformat(),
-        "current_period_end": (now + timedelta(days=30)).isoformat(),
-    }).execute().data[0]
-    # Update profile
-    sb.table("profiles").update({
-        "is_premium": True,
-        "premium_until": (now + timedelta(days=30)).isoformat(),
-        "updated_at": now.isoformat(),
-    }).eq("user_id", user_id).execute()
-    # Premium event (optional)
+    # Mark paid, create the subscription, grant premium and log the event in
+    # one transaction (migrations/0004_transaction_rpcs.sql).
+    from postgrest.exceptions import APIError  # lazy: heavy import
+
     try:
-        sb.table("premium_events").insert({
-            "user_id": user_id,
-            "event_type": "grant",
-            "reason": "mock_payment",
-            "created_at": now.isoformat(),
-        }).execute()
-    except Exception:
-        pass
-    return jsonify({"subscription": sub, "profile": {"is_premium": True}})
+        result = sb.rpc(
+            "confirm_payment_session",
+            {"p_payment_session_id": ps_id, "p_user_id": user_id},
+        ).execute().data
+    except APIError as e:
+        # P0002: no such row for this user.
+        if getattr(e, "code", None) == "P0002":
+            abort(404, description="Payment session not found")
+        raise
+    return jsonify(result)
 
 
 @premium_bp.get("/subscriptions/current")
 def current_subscription():
     user_id = get_current_user_id()
     sb = get_supabase()
-    sub = (
-        sb.table("subscriptions")
-        .select("id,plan_id,status,current_period_start,current_period_end")
-        .eq("user_id", user_id)
-        .order("created_at", desc=True)
-        .limit(1)
-        .execute()
-        .data
-    )
+    sub = latest_subscription(sb, user_id)
     prof = sb.table("profiles").select("is_premium,premium_until").eq("user_id", user_id).single().execute().data
-    return jsonify({"subscription": (sub[0] if sub else None), "profile": prof})
+    return jsonify({"subscription": sub, "profile": prof})
 
@@ -3,19 +3,19 @@ from __future__ import annotations
 from datetime import datetime, timezone
 
 from flask import Blueprint, jsonify, request
-from postgrest.exceptions import APIError  # <-- important
 
+from admission import priority
 from supabase_client import get_supabase
 from utils import get_current_user_id
 
 profile_bp = Blueprint("profile", __name__, url_prefix="/api")
 
 
-@profile_bp.get("/me")
-def get_me():
-    user_id = get_current_user_id()
+def fetch_or_create_profile(sb, user_id: str) -> dict:
+    """
+    The user's profile row, creating a default one on first access.
+    """
     print(f"[GET /me] Fetching profile for user_id: {user_id}")
-    sb = get_supabase()
 
     # 1) Try to fetch existing profile (no .single() to avoid errors on 0 rows)
     select_q = (
@@ -34,7 +34,7 @@ def get_me():
     if rows:
         prof = rows[0]
         print(f"[GET /me] Using existing profile: {prof}")
-        return jsonify(prof)
+        return prof
 
     # 2) No row found: create a default profile.
     #    Make this safe under race conditions.
@@ -50,11 +50,13 @@ def get_me():
         "updated_at": now,
     }
 
+    from postgrest.exceptions import APIError  # <-- important (lazy: heavy import)
+
     try:
         insert_resp = sb.table("profiles").insert(default_row).execute()
         prof = insert_resp.data[0]
         print(f"[GET /me] Created new profile: {prof}")
-        return jsonify(prof)
+        return prof
     except APIError as e:
         # If another request inserted at the same time, we can get a duplicate-key error.
         # In that case, just re-select and return the existing row.
@@ -67,12 +69,18 @@ def get_me():
             if rows2:
                 prof2 = rows2[0]
                 print(f"[GET /me] Returning existing profile after duplicate: {prof2}")
-                return jsonify(prof2)
+                return prof2
 
         # Anything else -> bubble up as 500
         raise
 
 
+@profile_bp.get("/me")
+def get_me():
+    user_id = get_current_user_id()
+    return jsonify(fetch_or_create_profile(get_supabase(), user_id))
+
+
 @profile_bp.patch("/me")
 def patch_me():
     user_id = get_current_user_id()
@@ -120,6 +128,22 @@ def patch_me():
     return jsonify(prof)
 
 
+@profile_bp.get("/me/band-trends")
+@priority("heavy")
+def get_band_trends():
+    """
+    Per-criterion band trends, weakest criteria and predicted overall band
+    for the user's writing and speaking evaluations.
+    """
+    user_id = get_current_user_id()
+    window = max(1, min(request.args.get("window", 5, type=int), 50))
+    points = max(0, min(request.args.get("points", 50, type=int), 500))
+
+    import band_analytics  # lazy: keeps numpy off the startup path
+
+    return jsonify(band_analytics.band_trends(get_supabase(), user_id, window, points))
+
+
 @profile_bp.get("/faqs")
 def get_faqs():
     sb = get_supabase()
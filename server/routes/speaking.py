@@ -2,16 +2,21 @@ from __future__ import annotations
 
 import mimetypes
 from flask import Blueprint, abort, jsonify, request
-import requests
 
+from admission import priority
 from ai_helpers import evaluate_ielts_speaking
+from storage_urls import SPEAKING_BUCKET, is_own_speaking_path, local_audio_file, signed_url
 from supabase_client import get_supabase
+from events import run_evaluation, submit_evaluation, wants_async
+from idempotency import idempotent
+import snapshots
 from utils import get_current_user_id, to_jsonable
 
 speaking_bp = Blueprint("speaking", __name__, url_prefix="/api")
 
 
 @speaking_bp.post("/speaking-attempts")
+@idempotent
 def create_speaking_attempt():
     user_id = get_current_user_id()
     sb = get_supabase()
@@ -25,6 +30,10 @@ def create_speaking_attempt():
 
     if not question_id or not audio_path or duration_seconds is None or mode not in {"practice", "exam"}:
         abort(400, description="question_id, audio_path, duration_seconds, mode required")
+    # The recording is served back (routes/media.py) to whoever owns the
+    # attempt, so it must be one the user uploaded.
+    if not is_own_speaking_path(user_id, audio_path):
+        abort(400, description="audio_path must be under the user's own folder")
 
     # Validate question exists
     q = sb.table("questions").select("id").eq("id", question_id).single().execute().data
@@ -65,6 +74,8 @@ def create_speaking_attempt():
 
 
 @speaking_bp.post("/speaking-eval/<attempt_id>")
+@priority("ai")
+@idempotent
 def create_speaking_evaluation(attempt_id: str):
     user_id = get_current_user_id()
     sb = get_supabase()
@@ -88,55 +99,82 @@ def create_speaking_evaluation(attempt_id: str):
     if not question:
         abort(404, description="Question not found")
 
-    storage = sb.storage.from_("speaking-attempts")
-    public_url = storage.get_public_url(attempt["audio_path"])
-    if not public_url:
-        abort(502, description="Could not generate audio URL")
-
-    audio_resp = requests.get(public_url, timeout=30)
-    if audio_resp.status_code >= 400:
-        abort(502, description="Failed to download audio for evaluation")
-
-    mime_type = (
-        audio_resp.headers.get("Content-Type")
-        or mimetypes.guess_type(attempt["audio_path"])[0]
-        or "audio/mpeg"
-    )
-
-    eval_res = evaluate_ielts_speaking(
-        audio_resp.content,
-        mime_type,
-        question.get("prompt") or "",
-        target_band,
-        attempt.get("duration_seconds"),
-    )
+    def work() -> dict:
+        local_path = local_audio_file(attempt["audio_path"])
+        if local_path is not None:
+            audio_bytes = local_path.read_bytes()
+            content_type = None
+        else:
+            audio_url = signed_url(SPEAKING_BUCKET, attempt["audio_path"])
+            if not audio_url:
+                abort(502, description="Could not generate audio URL")
+
+            import requests  # lazy: only the speaking evaluation downloads audio
+
+            audio_resp = requests.get(audio_url, timeout=30)
+            if audio_resp.status_code >= 400:
+                abort(502, description="Failed to download audio for evaluation")
+            audio_bytes = audio_resp.content
+            content_type = audio_resp.headers.get("Content-Type")
+
+        mime_type = (
+            content_type
+            or mimetypes.guess_type(attempt["audio_path"])[0]
+            or "audio/mpeg"
+        )
 
-    row = (
-        sb.table("speaking_evaluations")
-        .insert(
-            {
-                "attempt_id": attempt_id,
-                "user_id": user_id,
-                "question_id": attempt["question_id"],
-                "mode": attempt["mode"],
-                "overall_band": eval_res.get("overall_band"),
-                "band_fluency": eval_res.get("fluency_and_coherence"),
-                "band_lexical": eval_res.get("lexical_resource"),
-                "band_grammar": eval_res.get("grammatical_range_and_accuracy"),
-                "band_pronunciation": eval_res.get("pronunciation"),
-                "is_good_enough": eval_res.get("is_good_enough"),
-                "feedback_short": eval_res.get("feedback_short"),
-                "feedback_detailed": eval_res.get("feedback_detailed"),
-                "transcript": eval_res.get("transcript"),
-            }
+        import audio_analysis  # lazy: keeps numpy off the startup path
+
+        prepared = audio_analysis.prepare_speaking_audio(audio_bytes, mime_type)
+        if prepared.rejection:
+            # Silent / too-short recordings are graded locally; no model call.
+            eval_res = audio_analysis.rejection_evaluation(prepared.rejection)
+        else:
+            eval_res = evaluate_ielts_speaking(
+                prepared.audio_bytes,
+                prepared.mime_type,
+                question.get("prompt") or "",
+                target_band,
+                prepared.duration_seconds or attempt.get("duration_seconds"),
+                mode=attempt.get("mode") or "practice",
+            )
+
+        row = (
+            get_supabase()
+            .table("speaking_evaluations")
+            .insert(
+                {
+                    "attempt_id": attempt_id,
+                    "user_id": user_id,
+                    "question_id": attempt["question_id"],
+                    "mode": attempt["mode"],
+                    "overall_band": eval_res.get("overall_band"),
+                    "band_fluency": eval_res.get("fluency_and_coherence"),
+                    "band_lexical": eval_res.get("lexical_resource"),
+                    "band_grammar": eval_res.get("grammatical_range_and_accuracy"),
+                    "band_pronunciation": eval_res.get("pronunciation"),
+                    "is_good_enough": eval_res.get("is_good_enough"),
+                    "feedback_short": eval_res.get("feedback_short"),
+                    "feedback_detailed": eval_res.get("feedback_detailed"),
+                    "transcript": eval_res.get("transcript"),
+                    "rejected_reason": eval_res.get("rejected_reason"),
+                }
+            )
+            .execute()
+            .data[0]
         )
-        .execute()
-        .data[0]
-    )
-    response_payload = {
-        **to_jsonable(row),
-        "on_topic": eval_res.get("on_topic"),
-        "relevance_score": eval_res.get("relevance_score"),
-        "relevance_feedback": eval_res.get("relevance_feedback"),
-    }
-    return jsonify(response_payload), 201
+        if attempt["mode"] == "exam":
+            snapshots.refresh_async(attempt.get("exam_session_id"))
+        response_payload = {
+            **to_jsonable(row),
+            "on_topic": eval_res.get("on_topic"),
+            "relevance_score": eval_res.get("relevance_score"),
+            "relevance_feedback": eval_res.get("relevance_feedback"),
+            "audio_analysis": prepared.stats.to_dict() if prepared.stats else None,
+        }
+        return response_payload
+
+    session_id = attempt.get("exam_session_id")
+    if wants_async():
+        return jsonify(submit_evaluation(user_id, "speaking", attempt_id, session_id, work)), 202
+    return jsonify(run_evaluation(user_id, "speaking", attempt_id, session_id, work)), 201
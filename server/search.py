@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import bisect
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+import catalog
+import metrics
+from supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+# Full-text search over question prompts and passages, practice-set titles
+# and FAQs, answered from an in-memory inverted index with BM25 ranking.
+# The index is built from catalog.changes(0) and kept current by applying
+# catalog.changes(<last version>) every SEARCH_REFRESH_SECONDS, so a publish
+# only re-indexes the sets it touched. FAQs carry no catalog version and are
+# reloaded wholesale every SEARCH_FAQ_REFRESH_SECONDS.
+
+SEARCH_REFRESH_SECONDS = float(os.getenv("SEARCH_REFRESH_SECONDS", "30"))
+SEARCH_FAQ_REFRESH_SECONDS = float(os.getenv("SEARCH_FAQ_REFRESH_SECONDS", "600"))
+SEARCH_MAX_LIMIT = 50
+# Query terms of at least this length also match indexed terms they prefix
+# ("clim" -> "climate"), at most PREFIX_MAX_TERMS of them, scored lower than
+# an exact match.
+PREFIX_MIN_CHARS = 3
+PREFIX_MAX_TERMS = 50
+PREFIX_WEIGHT = 0.7
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Term frequency multipliers per field: a hit in a title or prompt counts
+# more than one in a long passage or answer.
+FIELD_WEIGHTS = {"title": 3.0, "prompt": 2.0, "question": 2.0, "description": 1.0, "passage": 1.0, "answer": 1.0}
+SNIPPET_CHARS = 160
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str | None) -> list[str]:
+    return _TOKEN.findall((text or "").lower())
+
+
+def _snippet(text: str | None) -> str | None:
+    if not text:
+        return None
+    text = " ".join(text.split())
+    return text if len(text) <= SNIPPET_CHARS else text[: SNIPPET_CHARS - 1].rsplit(" ", 1)[0] + "…"
+
+
+class SearchIndex:
+    """
+    Inverted index: term -> {doc key: weighted term frequency}, with document
+    lengths for BM25 and a sorted vocabulary for prefix lookups. Documents
+    can be added, replaced and removed at any time.
+    """
+
+    def __init__(self):
+        self.docs: dict[str, dict] = {}
+        self._postings: dict[str, dict[str, float]] = {}
+        self._doc_terms: dict[str, tuple[str, ...]] = {}
+        self._doc_len: dict[str, float] = {}
+        self._total_len = 0.0
+        self._vocab: list[str] = []
+        self._set_questions: dict[str, set[str]] = {}
+        self.version = 0
+        self.faqs_loaded_at = 0.0
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, key: str, meta: dict, fields: dict[str, str | None]) -> None:
+        tf: Counter = Counter()
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for term, count in Counter(tokenize(text)).items():
+                tf[term] += weight * count
+        with self.lock:
+            self.remove(key)
+            if not tf:
+                return
+            self.docs[key] = meta
+            self._doc_terms[key] = tuple(tf)
+            length = sum(tf.values())
+            self._doc_len[key] = length
+            self._total_len += length
+            for term, freq in tf.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    bisect.insort(self._vocab, term)
+                postings[key] = freq
+            if meta["kind"] == "question":
+                self._set_questions.setdefault(meta["practice_set_id"], set()).add(key)
+
+    def remove(self, key: str) -> None:
+        with self.lock:
+            meta = self.docs.pop(key, None)
+            if meta is None:
+                return
+            for term in self._doc_terms.pop(key):
+                postings = self._postings[term]
+                del postings[key]
+                if not postings:
+                    del self._postings[term]
+                    del self._vocab[bisect.bisect_left(self._vocab, term)]
+            self._total_len -= self._doc_len.pop(key)
+            if meta["kind"] == "question":
+                self._set_questions.get(meta["practice_set_id"], set()).discard(key)
+
+    def remove_practice_set(self, ps_id: str) -> None:
+        with self.lock:
+            for key in list(self._set_questions.pop(ps_id, ())):
+                self.remove(key)
+            self.remove(f"practice_set:{ps_id}")
+
+    def _expansions(self, token: str) -> list[tuple[str, float]]:
+        out = [(token, 1.0)] if token in self._postings else []
+        if len(token) >= PREFIX_MIN_CHARS:
+            i = bisect.bisect_left(self._vocab, token)
+            while i < len(self._vocab) and len(out) < PREFIX_MAX_TERMS and self._vocab[i].startswith(token):
+                if self._vocab[i] != token:
+                    out.append((self._vocab[i], PREFIX_WEIGHT))
+                i += 1
+        return out
+
+    def search(self, query: str, limit: int = 20, kinds=None, skill: str | None = None) -> list[dict]:
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        with self.lock:
+            n_docs = len(self.docs)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Counter = Counter()
+            for token in tokens:
+                # Best-matching expansion per document, so a document is not
+                # rewarded for containing many words with the same prefix.
+                best: dict[str, float] = {}
+                for term, weight in self._expansions(token):
+                    postings = self._postings[term]
+                    idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for key, tf in postings.items():
+                        norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[key] / avg_len)
+                        score = weight * idf * tf * (BM25_K1 + 1) / norm
+                        if score > best.get(key, 0.0):
+                            best[key] = score
+                scores.update(best)
+
+            def wanted(key: str) -> bool:
+                meta = self.docs[key]
+                return (kinds is None or meta["kind"] in kinds) and (skill is None or meta.get("skill_slug") == skill)
+
+            top = heapq.nlargest(limit, (item for item in scores.items() if wanted(item[0])), key=lambda kv: kv[1])
+            return [{**self.docs[key], "score": round(score, 4)} for key, score in top]
+
+    # -- loading ---------------------------------------------------------
+
+    def apply_changes(self, changes: dict, skill_slugs: dict[str, str]) -> None:
+        """
+        Re-index the practice sets (and their questions) in a
+        catalog.changes() page and drop removed ones.
+        """
+        with self.lock:
+            for ps_id in changes["removed"]["practice_sets"]:
+                self.remove_practice_set(ps_id)
+            for ps in changes["practice_sets"]:
+                self.remove_practice_set(ps["id"])
+                common = {
+                    "practice_set_id": ps["id"],
+                    "practice_set_title": ps.get("title"),
+                    "skill_slug": skill_slugs.get(ps.get("skill_id")),
+                    "is_premium": bool(ps.get("is_premium")),
+                }
+                self.add(
+                    f"practice_set:{ps['id']}",
+                    {"kind": "practice_set", "id": ps["id"], "title": ps.get("title"),
+                     "snippet": _snippet(ps.get("short_description")), **common},
+                    {"title": ps.get("title"), "description": ps.get("short_description")},
+                )
+                for q in ps["questions"]:
+                    self.add(
+                        f"question:{q['id']}",
+                        {"kind": "question", "id": q["id"], "title": _snippet(q.get("prompt")),
+                         "snippet": _snippet(q.get("passage")), "order_index": q.get("order_index"), **common},
+                        {"prompt": q.get("prompt"), "passage": q.get("passage")},
+                    )
+            self.version = max(self.version, changes["version"])
+
+    def load_faqs(self, rows: list[dict]) -> None:
+        with self.lock:
+            for key in [k for k, meta in self.docs.items() if meta["kind"] == "faq"]:
+                self.remove(key)
+            for row in rows:
+                self.add(
+                    f"faq:{row['id']}",
+                    {"kind": "faq", "id": row["id"], "title": row.get("question"),
+                     "snippet": _snippet(row.get("answer")), "category": row.get("category")},
+                    {"question": row.get("question"), "answer": row.get("answer")},
+                )
+            self.faqs_loaded_at = time.monotonic()
+
+
+_index = SearchIndex()
+_build_lock = threading.Lock()
+_built = False
+
+
+def refresh(index: SearchIndex | None = None) -> int:
+    """
+    Apply every catalog change since the index's version (all of them on the
+    first call) and reload FAQs when due. Returns the number of practice
+    sets re-indexed.
+    """
+    index = index or _index
+    started = time.monotonic()
+    skill_slugs = {s["id"]: s["slug"] for s in catalog.skills()}
+    updated = 0
+    while True:
+        page = catalog.changes(index.version)
+        index.apply_changes(page, skill_slugs)
+        updated += len(page["practice_sets"]) + len(page["removed"]["practice_sets"])
+        if not page["has_more"]:
+            break
+    if time.monotonic() - index.faqs_loaded_at >= SEARCH_FAQ_REFRESH_SECONDS or not index.faqs_loaded_at:
+        rows = get_supabase().table("faqs").select("id,category,question,answer").execute().data or []
+        index.load_faqs(rows)
+    if updated:
+        metrics.observe("search.refresh_ms", (time.monotonic() - started) * 1000)
+    return updated
+
+
+def ensure_built() -> SearchIndex:
+    """
+    The shared index, built on first use if the background builder has not
+    finished yet.
+    """
+    global _built
+    if not _built:
+        with _build_lock:
+            if not _built:
+                started = time.monotonic()
+                refresh()
+                _built = True
+                logger.info("Search index built (%d documents) in %.0f ms", len(_index), (time.monotonic() - started) * 1000)
+    return _index
+
+
+def search(query: str, limit: int = 20, kinds=None, skill: str | None = None) -> list[dict]:
+    started = time.monotonic()
+    results = ensure_built().search(query, limit, kinds, skill)
+    metrics.observe("search.ms", (time.monotonic() - started) * 1000)
+    return results
+
+
+def _refresher_loop() -> None:
+    while True:
+        try:
+            if _built:
+                refresh()
+            else:
+                ensure_built()
+        except Exception:
+            logger.exception("Search index refresh failed")
+        time.sleep(SEARCH_REFRESH_SECONDS)
+
+
+_refresher_started = False
+
+
+def start_background_refresh() -> None:
+    """
+    Start (once per process) the daemon thread that builds the index and
+    applies catalog changes as they are published.
+    """
+    global _refresher_started
+    with _build_lock:
+        if _refresher_started:
+            return
+        _refresher_started = True
+    threading.Thread(target=_refresher_loop, name="search-refresher", daemon=True).start()
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import base64
+import gzip
+import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from flask import Response, request
+
+from exam_summary import iter_exam_sections
+from supabase_client import get_supabase
+from utils import iter_json_object
+
+logger = logging.getLogger(__name__)
+
+# Completed exam summaries, stored once as gzip'd JSON (base64 in a text
+# column, see migrations/0001_exam_result_snapshots.sql) so revisiting the
+# results screen costs a single read instead of a full rebuild.
+SNAPSHOT_TABLE = "exam_result_snapshots"
+# Archived exams keep their snapshot here (see archive.py).
+ARCHIVE_TABLE = "exam_session_archive"
+
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="snapshot-refresh")
+
+
+class StreamingEncoder:
+    """
+    Gzip a JSON document incrementally while it is being streamed, so the
+    snapshot never needs the whole uncompressed payload in memory.
+    """
+
+    def __init__(self):
+        # wbits=31 -> gzip container, readable with gzip.decompress().
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self._parts: list[bytes] = []
+
+    def feed(self, chunk: str) -> None:
+        out = self._compressor.compress(chunk.encode("utf-8"))
+        if out:
+            self._parts.append(out)
+
+    def finish(self) -> bytes:
+        self._parts.append(self._compressor.flush())
+        return b"".join(self._parts)
+
+
+def save_blob(exam_session_id: str, user_id: str, blob: bytes, sb=None) -> None:
+    sb = sb or get_supabase()
+    try:
+        sb.table(SNAPSHOT_TABLE).upsert(
+            {
+                "exam_session_id": exam_session_id,
+                "user_id": user_id,
+                "payload_gz_b64": base64.b64encode(blob).decode("ascii"),
+                "payload_bytes": len(blob),
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            },
+            on_conflict="exam_session_id",
+        ).execute()
+    except Exception:
+        # A missing snapshot only costs a rebuild later; never fail the request.
+        logger.exception("Failed to store exam result snapshot for %s", exam_session_id)
+
+
+def load_blob(sb, exam_session_id: str, user_id: str) -> bytes | None:
+    rows = (
+        sb.table(SNAPSHOT_TABLE)
+        .select("user_id,payload_gz_b64")
+        .eq("exam_session_id", exam_session_id)
+        .execute()
+        .data
+        or []
+    )
+    if not rows:
+        rows = (
+            sb.table(ARCHIVE_TABLE)
+            .select("user_id,payload_gz_b64:result_gz_b64")
+            .eq("exam_session_id", exam_session_id)
+            .execute()
+            .data
+            or []
+        )
+    if not rows or rows[0]["user_id"] != user_id or not rows[0]["payload_gz_b64"]:
+        return None
+    return base64.b64decode(rows[0]["payload_gz_b64"])
+
+
+def response(sb, exam_session_id: str, user_id: str) -> Response | None:
+    """
+    Stream the stored blob as-is to clients accepting gzip; decompress for
+    the rest.
+    """
+    blob = load_blob(sb, exam_session_id, user_id)
+    if blob is None:
+        return None
+    if "gzip" in (request.headers.get("Accept-Encoding") or ""):
+        resp = Response(blob, mimetype="application/json")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response(gzip.decompress(blob), mimetype="application/json")
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def refresh(exam_session_id: str) -> None:
+    """
+    Rebuild the snapshot of an already-completed exam (e.g. after a late
+    writing/speaking evaluation). No-op if the exam has no snapshot yet.
+    """
+    sb = get_supabase()
+    existing = (
+        sb.table(SNAPSHOT_TABLE)
+        .select("user_id")
+        .eq("exam_session_id", exam_session_id)
+        .execute()
+        .data
+        or []
+    )
+    if not existing:
+        return
+    session = sb.table("exam_sessions").select("*").eq("id", exam_session_id).single().execute().data
+    if not session:
+        return
+    build(sb, session)
+
+
+def build(sb, session: dict) -> None:
+    """
+    Build and store the snapshot of a completed exam session row.
+    """
+    encoder = StreamingEncoder()
+    for chunk in iter_json_object({"exam_session": session}, "sections", iter_exam_sections(sb, session["id"])):
+        encoder.feed(chunk)
+    save_blob(session["id"], session["user_id"], encoder.finish(), sb)
+
+
+def _refresh_logged(exam_session_id: str) -> None:
+    try:
+        refresh(exam_session_id)
+    except Exception:
+        logger.exception("Exam result snapshot refresh failed for %s", exam_session_id)
+
+
+def refresh_async(exam_session_id: str | None) -> None:
+    if exam_session_id:
+        _refresh_pool.submit(_refresh_logged, exam_session_id)
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+from supabase_client import get_supabase
+
+LISTENING_BUCKET = os.getenv("LISTENING_BUCKET", "listening-tracks")
+SPEAKING_BUCKET = os.getenv("SPEAKING_BUCKET", "speaking-attempts")
+
+SIGNED_URL_TTL_SECONDS = int(os.getenv("SIGNED_URL_TTL_SECONDS", "3600"))
+# Stop handing out a cached URL this long before it actually expires, so a
+# client that starts playback right away never holds a dead link.
+SIGNED_URL_REFRESH_MARGIN_SECONDS = int(os.getenv("SIGNED_URL_REFRESH_MARGIN_SECONDS", "300"))
+
+# Optional directory holding audio assets locally (dev / self-hosted). When a
+# path exists here it is served by `routes/media.py` with Range support
+# instead of going through storage.
+LOCAL_AUDIO_DIR = os.getenv("LOCAL_AUDIO_DIR")
+
+_cache: dict[tuple[str, str, int], tuple[float, str]] = {}
+_lock = threading.Lock()
+
+
+def local_audio_file(path: str) -> Path | None:
+    if not LOCAL_AUDIO_DIR or not path:
+        return None
+    root = Path(LOCAL_AUDIO_DIR).resolve()
+    candidate = (root / path).resolve()
+    if root not in candidate.parents or not candidate.is_file():
+        return None
+    return candidate
+
+
+def is_own_speaking_path(user_id: str, path: str) -> bool:
+    """
+    Whether `path` lies in the user's own folder of the speaking bucket
+    ("<user_id>/...", where the app uploads recordings).
+    """
+    parts = (path or "").split("/")
+    return len(parts) > 1 and parts[0] == user_id and all(p not in ("", ".", "..") for p in parts[1:])
+
+
+def signed_urls(bucket: str, paths: Iterable[str], ttl: int = SIGNED_URL_TTL_SECONDS) -> dict[str, str]:
+    """
+    Resolve storage paths to URLs. Local assets map to the media endpoint,
+    cached signed URLs are reused, and all remaining paths are signed with a
+    single storage call (valid for `ttl` seconds).
+    """
+    now = time.monotonic()
+    out: dict[str, str] = {}
+    missing: list[str] = []
+    for path in dict.fromkeys(p for p in paths if p):
+        if local_audio_file(path) is not None:
+            out[path] = f"/api/audio/{path}"
+            continue
+        with _lock:
+            entry = _cache.get((bucket, path, ttl))
+        if entry and entry[0] > now:
+            out[path] = entry[1]
+        else:
+            missing.append(path)
+
+    if missing:
+        items = get_supabase().storage.from_(bucket).create_signed_urls(missing, ttl)
+        fresh_until = now + ttl - SIGNED_URL_REFRESH_MARGIN_SECONDS
+        with _lock:
+            for item in items or []:
+                url = item.get("signedURL") or item.get("signedUrl")
+                if item.get("error") or not url:
+                    continue
+                _cache[(bucket, item["path"], ttl)] = (fresh_until, url)
+                out[item["path"]] = url
+    return out
+
+
+def signed_url(bucket: str, path: str) -> str | None:
+    return signed_urls(bucket, [path]).get(path)
+
+
+def attach_audio_urls(
+    tracks: Iterable[dict], bucket: str = LISTENING_BUCKET, ttl: int = SIGNED_URL_TTL_SECONDS
+) -> None:
+    """
+    Set ``audio_url`` on every serialized listening track, signing all of them
+    in one batch.
+    """
+    tracks = [t for t in tracks if t]
+    urls = signed_urls(bucket, (t.get("audio_path") for t in tracks), ttl)
+    for t in tracks:
+        t["audio_url"] = urls.get(t.get("audio_path"))
@@ -1,7 +1,11 @@
 import os
-from supabase import create_client, Client
 
-def get_supabase() -> Client:
+
+def get_supabase():
+    # Imported lazily: the supabase SDK is a large share of cold-start import
+    # time, and `/health` never needs it.
+    from supabase import create_client
+
     url = os.environ["SUPABASE_URL"]
     key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
     return create_client(url, key)
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import sys
+import uuid
+from pathlib import Path
+
+# Tests import the server modules the way app.py does: flat, from server/.
+SERVER_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SERVER_DIR))
+sys.path.insert(0, str(SERVER_DIR / "bench"))
+
+# No background catalog/search loading when a test imports the app.
+os.environ.setdefault("CATALOG_PREWARM", "0")
+
+# Real-Postgres tests create a scratch database on this server; skipped
+# without it.
+DATABASE_URL = os.getenv("DATABASE_URL")
+MIGRATIONS_DIR = SERVER_DIR / "migrations"
+
+
+@contextlib.contextmanager
+def scratch_database(*scripts: str):
+    """
+    A fresh database with `scripts` applied in order; yields its DSN and
+    drops it afterwards.
+    """
+    import psycopg2  # lazy: only the Postgres-backed tests need it
+
+    name = f"test_{uuid.uuid4().hex[:12]}"
+    admin = psycopg2.connect(DATABASE_URL)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"create database {name}")
+    scratch = psycopg2.extensions.parse_dsn(DATABASE_URL)
+    scratch["dbname"] = name
+    dsn = psycopg2.extensions.make_dsn(**scratch)
+    try:
+        conn = psycopg2.connect(dsn)
+        with conn, conn.cursor() as cur:
+            for script in scripts:
+                cur.execute(script)
+        conn.close()
+        yield dsn
+    finally:
+        with admin.cursor() as cur:
+            cur.execute(f"drop database if exists {name} with (force)")
+        admin.close()
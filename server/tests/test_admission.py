@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import importlib
+
+import pytest
+
+import admission
+
+
+@pytest.fixture
+def reload_admission(monkeypatch):
+    def reload(threads: int):
+        monkeypatch.setenv("WEB_THREADS", str(threads))
+        return importlib.reload(admission)
+
+    yield reload
+    monkeypatch.delenv("WEB_THREADS", raising=False)
+    importlib.reload(admission)
+
+
+@pytest.mark.parametrize("threads", [5, 8, 16, 32, 64])
+def test_capped_classes_leave_interactive_headroom(reload_admission, threads):
+    classes = reload_admission(threads).CLASSES
+    capped = [classes[name].limit for name in ("ai", "heavy", "stream")]
+    assert all(capped)
+    assert threads - sum(capped) >= admission.INTERACTIVE_RESERVE
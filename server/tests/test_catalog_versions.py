@@ -0,0 +1,82 @@
+"""
+The catalog version watermark (migrations/0003 + 0010) against a real
+Postgres: a version taken by a transaction that is still open must never be
+below the version handed to a syncing client. Skipped without DATABASE_URL
+(see test_transaction_rpcs.py).
+"""
+from __future__ import annotations
+
+import pytest
+
+from conftest import DATABASE_URL, MIGRATIONS_DIR, scratch_database
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL not set")
+
+SCHEMA = """
+create table public.skills (id uuid primary key default gen_random_uuid(), slug text);
+create table public.practice_sets (
+    id uuid primary key default gen_random_uuid(), skill_id uuid references public.skills, title text
+);
+create table public.questions (
+    id uuid primary key default gen_random_uuid(), practice_set_id uuid references public.practice_sets
+);
+create table public.question_options (id uuid primary key default gen_random_uuid(), question_id uuid);
+create table public.listening_tracks (id uuid primary key default gen_random_uuid(), practice_set_id uuid);
+"""
+
+
+@pytest.fixture(scope="module")
+def dsn():
+    migrations = [
+        (MIGRATIONS_DIR / name).read_text() for name in ("0003_catalog_versions.sql", "0010_catalog_watermark.sql")
+    ]
+    with scratch_database(SCHEMA, *migrations) as scratch_dsn:
+        yield scratch_dsn
+
+
+@pytest.fixture()
+def connect(dsn):
+    conns = []
+
+    def connect(autocommit: bool = True):
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = autocommit
+        conns.append(conn)
+        return conn
+
+    yield connect
+    for conn in conns:
+        conn.close()
+
+
+def one(conn, sql: str, *params):
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchone()[0]
+
+
+def test_watermark_stays_below_open_transactions(connect):
+    db = connect()
+    set_a = one(db, "insert into public.practice_sets (title) values ('a') returning id")
+    set_b = one(db, "insert into public.practice_sets (title) values ('b') returning id")
+
+    t1 = connect(autocommit=False)
+    v1 = one(t1, "update public.practice_sets set title = 'a2' where id = %s returning catalog_version", set_a)
+    v2 = one(db, "update public.practice_sets set title = 'b2' where id = %s returning catalog_version", set_b)
+    assert v2 > v1
+
+    # T2's change is visible, T1's is not yet: resuming from v2 would skip v1.
+    assert one(db, "select max(catalog_version) from public.practice_sets") == v2
+    assert one(db, "select public.catalog_watermark(0)") < v1
+
+    t1.commit()
+    assert one(db, "select public.catalog_watermark(0)") == v2
+
+
+def test_watermark_lags_recent_stamps(connect):
+    db = connect()
+    version = one(db, "insert into public.skills (slug) values ('x') returning catalog_version")
+    assert one(db, "select public.catalog_watermark(3600)") < version
+    assert one(db, "select public.catalog_watermark(0)") >= version
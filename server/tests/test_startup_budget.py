@@ -0,0 +1,9 @@
+from __future__ import annotations
+
+import startup_report
+
+
+def test_import_app_within_budget():
+    self_us, _, total_us = startup_report.import_times(runs=3)
+    problems = startup_report.failures(self_us, total_us, startup_report.BUDGET_MS)
+    assert not problems, "; ".join(problems)
@@ -0,0 +1,380 @@
+"""
+The RPCs of migrations/0004_transaction_rpcs.sql against a real Postgres.
+
+Needs a local server the tests may create a scratch database on, and
+psycopg2 (`pip install psycopg2-binary`); skipped otherwise:
+
+    cd server && DATABASE_URL=postgresql://postgres@localhost/postgres python -m pytest -q tests
+
+The production tables live in Supabase, so SCHEMA below recreates just the
+columns the functions touch. Routes are driven through the Flask app with a
+client that forwards `sb.rpc()` to Postgres and counts round trips.
+"""
+from __future__ import annotations
+
+import re
+import uuid
+
+import pytest
+
+from conftest import DATABASE_URL, MIGRATIONS_DIR, scratch_database
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL not set")
+
+MIGRATION = MIGRATIONS_DIR / "0004_transaction_rpcs.sql"
+
+SCHEMA = """
+create table public.skills (id uuid primary key default gen_random_uuid(), slug text, name text);
+create table public.practice_sets (
+    id uuid primary key default gen_random_uuid(), skill_id uuid references public.skills, title text
+);
+create table public.questions (
+    id uuid primary key default gen_random_uuid(), practice_set_id uuid references public.practice_sets
+);
+create table public.practice_sessions (
+    id uuid primary key default gen_random_uuid(),
+    user_id uuid not null,
+    practice_set_id uuid references public.practice_sets,
+    started_at timestamptz default now(),
+    completed_at timestamptz,
+    time_taken_seconds integer,
+    total_questions integer,
+    correct_questions integer,
+    score numeric
+);
+create table public.practice_answers (
+    id uuid primary key default gen_random_uuid(),
+    session_id uuid references public.practice_sessions,
+    question_id uuid references public.questions,
+    option_id uuid,
+    answer_text text,
+    is_correct boolean,
+    answered_at timestamptz default now()
+);
+create table public.writing_evaluations (
+    id uuid primary key default gen_random_uuid(),
+    practice_answer_id uuid references public.practice_answers,
+    user_id uuid,
+    overall_band numeric,
+    created_at timestamptz default now()
+);
+create table public.subscription_plans (id uuid primary key default gen_random_uuid(), name text);
+create table public.payment_sessions (
+    id uuid primary key default gen_random_uuid(),
+    user_id uuid not null,
+    plan_id uuid references public.subscription_plans,
+    status text not null,
+    completed_at timestamptz
+);
+create table public.subscriptions (
+    id uuid primary key default gen_random_uuid(),
+    user_id uuid not null,
+    plan_id uuid references public.subscription_plans,
+    payment_session_id uuid references public.payment_sessions,
+    status text,
+    current_period_start timestamptz,
+    current_period_end timestamptz,
+    created_at timestamptz default now()
+);
+create table public.profiles (
+    user_id uuid primary key, is_premium boolean default false, premium_until timestamptz, updated_at timestamptz
+);
+create table public.premium_events (
+    id bigserial primary key, user_id uuid, event_type text, reason text, created_at timestamptz
+);
+-- Lets a test make one step of a function fail.
+create function public.fail_step() returns trigger language plpgsql as $$
+begin
+    raise exception 'injected failure';
+end;
+$$;
+"""
+
+
+@pytest.fixture(scope="module")
+def dsn():
+    """
+    A scratch database with SCHEMA and the migration applied, dropped after.
+    """
+    with scratch_database(SCHEMA, MIGRATION.read_text()) as scratch_dsn:
+        yield scratch_dsn
+
+
+@pytest.fixture()
+def db(dsn):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    yield conn
+    conn.close()
+
+
+def query(db, sql: str, *params):
+    with db.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchall() if cur.description else None
+
+
+def query_named(db, sql: str, params: dict):
+    with db.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _RPC:
+    def __init__(self, client, name: str, params: dict):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self) -> _Result:
+        from postgrest.exceptions import APIError
+
+        assert re.fullmatch(r"[a-z_]+", self.name)
+        self.client.calls.append(f"rpc:{self.name}")
+        args = ", ".join(f"{k} => %({k})s" for k in self.params)
+        try:
+            rows = query_named(self.client.db, f"select public.{self.name}({args})", self.params)
+        except psycopg2.Error as e:
+            # What PostgREST returns for a failed call, as supabase-py raises it.
+            raise APIError({"code": e.pgcode, "message": e.pgerror, "details": None, "hint": None}) from None
+        return _Result(rows[0][0])
+
+
+class PostgresClient:
+    """
+    Stands in for the Supabase client: one autocommit statement per call,
+    like PostgREST. Any table access fails the test.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.calls: list[str] = []
+
+    def rpc(self, name: str, params: dict | None = None) -> _RPC:
+        return _RPC(self, name, params or {})
+
+    def table(self, name: str):
+        raise AssertionError(f"unexpected table call: {name}")
+
+
+@pytest.fixture()
+def client(db, monkeypatch):
+    import catalog
+    import routes.practice
+    import routes.premium
+    from app import app
+
+    sb = PostgresClient(db)
+    monkeypatch.setattr(routes.practice, "get_supabase", lambda: sb)
+    monkeypatch.setattr(routes.premium, "get_supabase", lambda: sb)
+    # Served from the in-process catalog cache in production.
+    monkeypatch.setattr(catalog, "practice_set_questions", lambda ps_id: ())
+    return app.test_client(), sb
+
+
+@pytest.fixture()
+def failing(db):
+    """
+    `failing(table, when)` makes every `when` ("insert"/"update") on `table`
+    raise until the test ends.
+    """
+    added = []
+
+    def add(table: str, when: str):
+        trigger = f"fail_{table}_{when}"
+        query(db, f"create trigger {trigger} before {when} on public.{table} for each row execute function public.fail_step()")
+        added.append((trigger, table))
+
+    yield add
+    for trigger, table in added:
+        query(db, f"drop trigger {trigger} on public.{table}")
+
+
+@pytest.fixture()
+def payment(db):
+    user_id = str(uuid.uuid4())
+    (plan_id,) = query(db, "insert into public.subscription_plans (name) values ('Monthly') returning id")[0]
+    query(db, "insert into public.profiles (user_id) values (%s)", user_id)
+    (ps_id,) = query(
+        db,
+        "insert into public.payment_sessions (user_id, plan_id, status) values (%s, %s, 'created') returning id",
+        user_id,
+        plan_id,
+    )[0]
+    return user_id, str(ps_id)
+
+
+def _payment_state(db, user_id: str, ps_id: str) -> tuple:
+    return (
+        query(db, "select status from public.payment_sessions where id = %s", ps_id)[0][0],
+        query(db, "select count(*) from public.subscriptions where user_id = %s", user_id)[0][0],
+        query(db, "select is_premium from public.profiles where user_id = %s", user_id)[0][0],
+        query(db, "select count(*) from public.premium_events where user_id = %s", user_id)[0][0],
+    )
+
+
+def test_confirm_payment_is_one_round_trip(client, db, payment):
+    http, sb = client
+    user_id, ps_id = payment
+    resp = http.post(f"/api/payments/session/{ps_id}/confirm", headers={"X-User-Id": user_id})
+    assert resp.status_code == 200, resp.get_data(as_text=True)
+    assert resp.get_json()["profile"] == {"is_premium": True}
+    # Was: update payment, re-select it, insert subscription, update profile,
+    # insert event.
+    assert sb.calls == ["rpc:confirm_payment_session"]
+    assert _payment_state(db, user_id, ps_id) == ("paid", 1, True, 1)
+
+
+def test_confirm_payment_rolls_back_when_a_later_step_fails(client, db, payment, failing):
+    http, _ = client
+    user_id, ps_id = payment
+    failing("profiles", "update")
+    resp = http.post(f"/api/payments/session/{ps_id}/confirm", headers={"X-User-Id": user_id})
+    assert resp.status_code == 500
+    # Neither the payment nor the subscription outlive the failed grant.
+    assert _payment_state(db, user_id, ps_id) == ("created", 0, False, 0)
+
+
+def test_confirm_payment_keeps_the_grant_when_the_audit_event_fails(client, db, payment, failing):
+    http, _ = client
+    user_id, ps_id = payment
+    failing("premium_events", "insert")
+    resp = http.post(f"/api/payments/session/{ps_id}/confirm", headers={"X-User-Id": user_id})
+    assert resp.status_code == 200
+    assert _payment_state(db, user_id, ps_id) == ("paid", 1, True, 0)
+
+
+@pytest.mark.parametrize("whose, session", [("other", "real"), ("own", "random"), ("own", "not-a-uuid")])
+def test_confirm_payment_not_found(client, db, payment, whose, session):
+    http, _ = client
+    user_id, ps_id = payment
+    caller = str(uuid.uuid4()) if whose == "other" else user_id
+    target = {"real": ps_id, "random": str(uuid.uuid4()), "not-a-uuid": "not-a-uuid"}[session]
+    resp = http.post(f"/api/payments/session/{target}/confirm", headers={"X-User-Id": caller})
+    assert resp.status_code == 404
+    assert _payment_state(db, user_id, ps_id) == ("created", 0, False, 0)
+
+
+@pytest.fixture()
+def session(db):
+    """
+    A practice session of a 4-question set with 3 answers, 2 correct, and a
+    writing evaluation on one of them.
+    """
+    user_id = str(uuid.uuid4())
+    (skill_id,) = query(db, "insert into public.skills (slug, name) values ('reading', 'Reading') returning id")[0]
+    (set_id,) = query(
+        db, "insert into public.practice_sets (skill_id, title) values (%s, 'Set A') returning id", skill_id
+    )[0]
+    question_ids = [
+        query(db, "insert into public.questions (practice_set_id) values (%s) returning id", set_id)[0][0]
+        for _ in range(4)
+    ]
+    (session_id,) = query(
+        db, "insert into public.practice_sessions (user_id, practice_set_id) values (%s, %s) returning id", user_id, set_id
+    )[0]
+    answer_ids = [
+        query(
+            db,
+            "insert into public.practice_answers (session_id, question_id, is_correct, answered_at)"
+            " values (%s, %s, %s, now() + %s * interval '1 second') returning id",
+            session_id,
+            qid,
+            correct,
+            i,
+        )[0][0]
+        for i, (qid, correct) in enumerate(zip(question_ids, (True, False, True)))
+    ]
+    query(
+        db,
+        "insert into public.writing_evaluations (practice_answer_id, user_id, overall_band) values (%s, %s, 6.5)",
+        answer_ids[1],
+        user_id,
+    )
+    return user_id, str(session_id), str(set_id)
+
+
+def _completed(db, session_id: str):
+    return query(
+        db,
+        "select completed_at is not null, total_questions, correct_questions, score, time_taken_seconds"
+        " from public.practice_sessions where id = %s",
+        session_id,
+    )[0]
+
+
+def test_complete_practice_is_one_round_trip(client, db, session):
+    http, sb = client
+    user_id, session_id, set_id = session
+    resp = http.post(
+        f"/api/practice-sessions/{session_id}/complete",
+        headers={"X-User-Id": user_id},
+        json={"time_taken_seconds": 95},
+    )
+    assert resp.status_code == 200, resp.get_data(as_text=True)
+    body = resp.get_json()
+    # Was: select session, update it, select answers, select evaluations,
+    # select set and skill.
+    assert sb.calls == ["rpc:complete_practice_session"]
+    assert body["stats"]["total_questions"] == 4
+    assert body["stats"]["correct_questions"] == 2
+    assert body["stats"]["score"] == pytest.approx(50.0)
+    assert body["practice_set"] == {"id": set_id, "title": "Set A", "skill_slug": "reading", "skill_name": "Reading"}
+    assert [a["is_correct"] for a in body["answers"]] == [True, False, True]
+    assert len(body["writing_evaluations"]) == 1
+    completed, total, correct, score, taken = _completed(db, session_id)
+    assert (completed, total, correct, float(score), taken) == (True, 4, 2, 50.0, 95)
+
+
+def test_complete_practice_leaves_the_session_open_when_the_update_fails(client, db, session, failing):
+    http, _ = client
+    user_id, session_id, _ = session
+    failing("practice_sessions", "update")
+    resp = http.post(f"/api/practice-sessions/{session_id}/complete", headers={"X-User-Id": user_id}, json={})
+    assert resp.status_code == 500
+    assert _completed(db, session_id) == (False, None, None, None, None)
+
+
+def test_complete_practice_rounds_fractional_seconds(client, db, session):
+    http, _ = client
+    user_id, session_id, _ = session
+    resp = http.post(
+        f"/api/practice-sessions/{session_id}/complete",
+        headers={"X-User-Id": user_id},
+        json={"time_taken_seconds": "94.6"},
+    )
+    assert resp.status_code == 200, resp.get_data(as_text=True)
+    assert resp.get_json()["stats"]["time_taken_seconds"] == 95
+    assert _completed(db, session_id)[4] == 95
+
+
+@pytest.mark.parametrize("value", ["abc", -1, True, [1], 1e20])
+def test_complete_practice_rejects_bad_time_taken(client, db, session, value):
+    http, sb = client
+    user_id, session_id, _ = session
+    resp = http.post(
+        f"/api/practice-sessions/{session_id}/complete",
+        headers={"X-User-Id": user_id},
+        json={"time_taken_seconds": value},
+    )
+    assert resp.status_code == 400
+    assert sb.calls == []
+    assert _completed(db, session_id)[0] is False
+
+
+@pytest.mark.parametrize("target", ["other-user", "random", "not-a-uuid"])
+def test_complete_practice_not_found(client, db, session, target):
+    http, _ = client
+    user_id, session_id, _ = session
+    caller = str(uuid.uuid4()) if target == "other-user" else user_id
+    path_id = {"other-user": session_id, "random": str(uuid.uuid4()), "not-a-uuid": "not-a-uuid"}[target]
+    resp = http.post(f"/api/practice-sessions/{path_id}/complete", headers={"X-User-Id": caller}, json={})
+    assert resp.status_code == 404
+    assert _completed(db, session_id)[0] is False
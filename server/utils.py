@@ -1,4 +1,7 @@
 from __future__ import annotations
+import json
+import uuid
+from typing import Iterable, Iterator
 from flask import request, abort
 from datetime import datetime
 from decimal import Decimal
@@ -11,6 +14,14 @@ def get_current_user_id() -> str:
     return user_id
 
 
+def is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
 def to_jsonable(value):
     if isinstance(value, Decimal):
         return float(value)
@@ -26,3 +37,17 @@ def to_jsonable(value):
 def json_list(rows):
     return [to_jsonable(r) for r in rows]
 
+
+def iter_json_object(fields: dict, stream_key: str, items: Iterable) -> Iterator[str]:
+    """
+    Serialize `{**fields, stream_key: [*items]}` chunk by chunk: the static
+    fields first, then each array item as soon as it is produced.
+    """
+    head = json.dumps(to_jsonable(fields), separators=(",", ":"))
+    prefix = head[:-1] + ("," if fields else "")
+    yield prefix + json.dumps(stream_key) + ":["
+    first = True
+    for item in items:
+        yield ("" if first else ",") + json.dumps(to_jsonable(item), separators=(",", ":"))
+        first = False
+    yield "]}"